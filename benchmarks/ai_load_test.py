@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Load generator for the AI path, against the bundled mock OpenAI server
+
+Usage:
+    python benchmarks/ai_load_test.py --concurrency 8 --requests 200
+    python benchmarks/ai_load_test.py --first-token lognormal:0.4,0.6 --error-rate 0.05 --server-rpm 120
+    python benchmarks/ai_load_test.py --url http://127.0.0.1:8080 --duration 60
+    python benchmarks/ai_load_test.py --backend openai --concurrency 8
+
+Drives AIProcessor.process_command() from concurrent callers, with the
+scheduler, rate limits and circuit breaker as configured (or overridden
+below), and reports throughput, tail latency, retries and how often turns
+ended in a fallback answer. Without --url an in-process mock server is
+started, so no real API calls are made.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Add the project root to the path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+from src.latency_budget import LatencyBudget  # noqa: E402
+from src.metrics import LatencyStats  # noqa: E402
+from src.mock_openai_server import add_server_arguments, server_from_arguments  # noqa: E402
+
+COMMANDS = (
+    "what is the weather like in", "tell me a fact about", "how far away is",
+    "what should I cook with", "give me a short tip about",
+)
+
+# How a turn was answered, from AIProcessor.last_turn_info
+OUTCOME_OK = "ok"
+OUTCOME_ERROR = "error"
+OUTCOME_SECONDARY = "secondary"
+OUTCOME_CACHE = "cache"
+OUTCOME_FALLBACK = "fallback"
+
+
+def classify_turn(info, primary_backend):
+    """
+    Classify a finished turn.
+    
+    Args:
+        info (dict): AIProcessor.last_turn_info after the turn
+        primary_backend (str): Name of the processor's main backend
+    
+    Returns:
+        str: One of the OUTCOME_* values
+    """
+    backend = info.get("backend")
+    if backend == "fallback":
+        return OUTCOME_FALLBACK
+    if backend == "cache":
+        return OUTCOME_CACHE
+    if backend != primary_backend:
+        return OUTCOME_SECONDARY
+    if info.get("error"):
+        return OUTCOME_ERROR
+    return OUTCOME_OK
+
+
+def run_load(processor, concurrency, total_requests=None, duration=None, budget_seconds=None):
+    """
+    Send commands from concurrent callers until the request count or duration is reached.
+    
+    Args:
+        processor (AIProcessor): Processor under test
+        concurrency (int): Number of callers
+        total_requests (int): Requests to send in total, or None
+        duration (float): Seconds to keep sending, or None
+        budget_seconds (float): Latency budget per turn, or None for no budget
+    
+    Returns:
+        dict: Elapsed seconds, latency stats and outcome counts
+    """
+    latencies = LatencyStats("load.turn", window=1000000)
+    outcomes = Counter()
+    lock = threading.Lock()
+    sent = [0]
+    start = time.monotonic()
+    primary = processor.backend.name if processor.backend is not None else None
+    
+    def next_index():
+        with lock:
+            if total_requests is not None and sent[0] >= total_requests:
+                return None
+            if duration is not None and time.monotonic() - start >= duration:
+                return None
+            sent[0] += 1
+            return sent[0]
+    
+    def caller():
+        while True:
+            index = next_index()
+            if index is None:
+                return
+            # Distinct commands, so requests are neither coalesced nor cached
+            command = f"{COMMANDS[index % len(COMMANDS)]} number {index}"
+            budget = None
+            if budget_seconds is not None:
+                budget = LatencyBudget(budget_seconds)
+                budget.start()
+            
+            turn_start = time.monotonic()
+            processor.process_command(command, budget=budget)
+            latencies.record(time.monotonic() - turn_start)
+            outcome = classify_turn(processor.last_turn_info, primary)
+            with lock:
+                outcomes[outcome] += 1
+    
+    threads = [threading.Thread(target=caller, name=f"load-{i}") for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    return {"elapsed": time.monotonic() - start, "latencies": latencies, "outcomes": outcomes}
+
+
+def build_report(result, processor, server_counts, concurrency):
+    """Collect the load test results into a JSON-friendly dict."""
+    latencies = result["latencies"]
+    outcomes = result["outcomes"]
+    completed = sum(outcomes.values())
+    scheduler = processor.scheduler
+    breaker = processor.breaker
+    
+    report = {
+        "concurrency": concurrency,
+        "requests": completed,
+        "elapsed_seconds": round(result["elapsed"], 3),
+        "throughput_per_sec": round(completed / result["elapsed"], 2) if result["elapsed"] else 0.0,
+        "latency_ms": {
+            name: round(latencies.percentile(percent) * 1000, 1)
+            for name, percent in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))
+        } if completed else {},
+        "outcomes": dict(outcomes),
+        "fallback_rate": round((outcomes[OUTCOME_FALLBACK] + outcomes[OUTCOME_CACHE]) / completed, 4)
+        if completed else 0.0,
+        "error_rate": round(outcomes[OUTCOME_ERROR] / completed, 4) if completed else 0.0,
+        "retries": scheduler.retried if scheduler is not None else 0,
+        "coalesced": scheduler.coalesced if scheduler is not None else 0,
+    }
+    if breaker is not None:
+        report["breaker"] = {"trips": breaker.trips, "short_circuited": breaker.short_circuited, "state": breaker.state}
+    if server_counts is not None:
+        report["server"] = server_counts
+    return report
+
+
+def print_report(report):
+    """Print the load test results."""
+    print("AI load test")
+    print(f"  Requests:    {report['requests']} in {report['elapsed_seconds']:.1f}s "
+          f"({report['throughput_per_sec']:.1f}/s) at concurrency {report['concurrency']}")
+    if report["latency_ms"]:
+        latency = report["latency_ms"]
+        print(f"  Latency:     p50 {latency['p50']:.0f} ms, p95 {latency['p95']:.0f} ms, "
+              f"p99 {latency['p99']:.0f} ms, max {latency['max']:.0f} ms")
+    outcomes = ", ".join(f"{name} {count}" for name, count in sorted(report["outcomes"].items()))
+    print(f"  Outcomes:    {outcomes}")
+    print(f"  Fallback:    {report['fallback_rate']:.1%}   Errors: {report['error_rate']:.1%}")
+    print(f"  Scheduler:   {report['retries']} rate-limit retries, {report['coalesced']} coalesced")
+    if "breaker" in report:
+        breaker = report["breaker"]
+        print(f"  Breaker:     {breaker['trips']} trips, {breaker['short_circuited']} short-circuited, "
+              f"now {breaker['state']}")
+    if "server" in report:
+        server = report["server"]
+        print(f"  Mock server: {server['requests']} requests, {server['rate_limited']} answered 429, "
+              f"{server['errors']} answered 500, {server['disconnects']} dropped")
+
+
+def main():
+    """Run the load test."""
+    parser = argparse.ArgumentParser(description="Load test the AI path against a mock OpenAI server")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent callers")
+    parser.add_argument("--requests", type=int, default=100, help="Requests to send in total")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Send for this many seconds instead of a fixed number of requests")
+    parser.add_argument("--url", default=None, help="Use a running server instead of the bundled mock")
+    parser.add_argument("--backend", choices=("local", "openai"), default="local",
+                        help="AI backend that sends the requests (default: local)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Scheduler workers (AI_SCHEDULER_WORKERS); defaults to the concurrency")
+    parser.add_argument("--client-rpm", type=int, default=None, help="Override AI_REQUESTS_PER_MINUTE")
+    parser.add_argument("--client-tpm", type=int, default=None, help="Override AI_TOKENS_PER_MINUTE")
+    parser.add_argument("--timeout", type=float, default=None, help="Override AI_REQUEST_TIMEOUT")
+    parser.add_argument("--budget", type=float, default=None, help="Latency budget per turn in seconds")
+    parser.add_argument("--no-breaker", action="store_true", help="Disable the circuit breaker")
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the assistant's log output")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    
+    server = None
+    if args.url is None:
+        server = server_from_arguments(args).start()
+    
+    url = args.url or server.url
+    config.AI_BACKEND = args.backend
+    if args.backend == "openai":
+        # The OpenAI client appends /chat/completions to its base URL; the
+        # mock checks the path, not the key
+        config.OPENAI_BASE_URL = url.rstrip("/") + "/v1"
+        config.OPENAI_API_KEY = "load-test"
+    else:
+        config.LOCAL_LLM_URL = url
+    config.AI_WARMUP = False
+    config.AI_SCHEDULER_WORKERS = args.workers or args.concurrency
+    config.AI_BREAKER_ENABLED = not args.no_breaker
+    if args.client_rpm is not None:
+        config.AI_REQUESTS_PER_MINUTE = args.client_rpm
+    if args.client_tpm is not None:
+        config.AI_TOKENS_PER_MINUTE = args.client_tpm
+    if args.timeout is not None:
+        config.AI_REQUEST_TIMEOUT = args.timeout
+    
+    from src.ai_processor import AIProcessor
+    processor = AIProcessor()
+    try:
+        if processor.use_fallback:
+            print("❌ AI processor could not be initialized; see the log with --verbose")
+            return 1
+        total = None if args.duration is not None else args.requests
+        result = run_load(processor, args.concurrency, total, args.duration, args.budget)
+    finally:
+        processor.cleanup()
+        if server is not None:
+            server.stop()
+    
+    report = build_report(result, processor, server.summary() if server is not None else None, args.concurrency)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Component micro-benchmarks for Wakeon with regression thresholds
+
+Usage:
+    python benchmarks/run_benchmarks.py                   # run and compare with the baseline
+    python benchmarks/run_benchmarks.py --update-baseline # store results as the new baseline
+    python benchmarks/run_benchmarks.py --only fallback_response earcon
+
+Results are compared with benchmarks/baseline.json. A metric that is worse
+than its baseline by more than the tolerance, or a benchmark that raises,
+fails the run (exit code 1). Benchmarks whose dependencies, models or
+fixtures are missing are skipped and listed at the end as having produced
+no data; a run in which no metric could be compared with the baseline
+exits with code 2.
+
+Fixtures are recordings you supply: put 16-bit mono WAV files of spoken
+commands (16 kHz for Porcupine and wake word spotting) in
+benchmarks/fixtures/. They are not part of the repository.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import wave
+
+# Add the project root to the path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARK_DIR, "fixtures")
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# Direction in which a metric improves
+HIGHER = "higher"
+LOWER = "lower"
+
+BENCHMARKS = {}
+
+
+class SkipBenchmark(Exception):
+    """Raised when a benchmark cannot run on this host."""
+
+
+def benchmark(name):
+    """Register a benchmark function under a name."""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def _timed_loop(func, min_seconds=1.0):
+    """
+    Call func repeatedly for at least min_seconds.
+    
+    Returns:
+        tuple: (calls, elapsed seconds)
+    """
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return calls, elapsed
+
+
+def _load_fixture_wavs():
+    """Load 16-bit mono fixture WAVs as (name, sample rate, bytes)."""
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.wav"))):
+        with wave.open(path, "rb") as wav:
+            if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                continue
+            fixtures.append((os.path.basename(path), wav.getframerate(), wav.readframes(wav.getnframes())))
+    if not fixtures:
+        raise SkipBenchmark(f"no 16-bit mono WAV fixtures in {FIXTURES_DIR}; nothing to measure")
+    return fixtures
+
+
+@benchmark("porcupine")
+def bench_porcupine():
+    """Porcupine frames per second through WakeWordDetector on fixture audio (or silence)."""
+    try:
+        import numpy as np
+        from src import audio_io
+        from src.wake_word_detector import PORCUPINE_AVAILABLE, WakeWordDetector
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    if not PORCUPINE_AVAILABLE:
+        raise SkipBenchmark("pvporcupine not installed")
+    
+    # Porcupine only runs at 16 kHz
+    sample_rate = 16000
+    try:
+        audio = np.concatenate([
+            np.frombuffer(data, dtype=np.int16)
+            for _, rate, data in _load_fixture_wavs() if rate == sample_rate
+        ])
+    except (SkipBenchmark, ValueError):
+        print(f"  porcupine: no {sample_rate} Hz fixtures; measuring on silence")
+        audio = np.zeros(sample_rate * 10, dtype=np.int16)
+    repeats = int(np.ceil(30 * sample_rate / len(audio)))
+    
+    # Feed the detector from a fake microphone on a virtual clock, so it
+    # reads as fast as Porcupine can process
+    previous_clock = audio_io.get_clock()
+    exhausted = []
+    
+    def finish():
+        exhausted.append(True)
+        detector.interrupt()
+    
+    audio_io.set_clock(audio_io.VirtualClock())
+    audio_io.set_audio_backend(audio_io.FakeAudioBackend(
+        audio_io.GeneratorSource([audio] * repeats, sample_rate),
+        on_exhausted=finish,
+    ))
+    try:
+        try:
+            detector = WakeWordDetector()
+        except Exception as e:
+            raise SkipBenchmark(f"Porcupine could not start ({e})")
+        
+        try:
+            start = time.perf_counter()
+            while not exhausted:
+                # detect() returns False only when interrupted or on an error
+                if not detector.detect():
+                    break
+            elapsed = time.perf_counter() - start
+            frame_length = detector.engine.frame_length
+        finally:
+            detector.cleanup()
+    finally:
+        audio_io.set_audio_backend(None)
+        audio_io.set_clock(previous_clock)
+    
+    if not exhausted:
+        raise RuntimeError("wake word detection stopped before the audio ran out; see the log")
+    
+    fps = len(audio) * repeats / frame_length / elapsed
+    return {
+        "porcupine.frames_per_sec": (fps, HIGHER),
+        "porcupine.realtime_factor": (sample_rate / frame_length / fps, LOWER),
+    }
+
+
+@benchmark("vosk")
+def bench_vosk():
+    """KaldiRecognizer real-time factor on fixture WAVs."""
+    try:
+        import vosk
+    except ImportError:
+        raise SkipBenchmark("vosk not installed")
+    if not os.path.exists(config.VOSK_MODEL_PATH):
+        raise SkipBenchmark(f"Vosk model not found at {config.VOSK_MODEL_PATH}")
+    
+    fixtures = _load_fixture_wavs()
+    model = vosk.Model(config.VOSK_MODEL_PATH)
+    
+    audio_seconds = 0.0
+    start = time.perf_counter()
+    for _, rate, data in fixtures:
+        rec = vosk.KaldiRecognizer(model, rate)
+        rec.AcceptWaveform(data)
+        rec.FinalResult()
+        audio_seconds += len(data) / 2 / rate
+    elapsed = time.perf_counter() - start
+    
+    return {"vosk.realtime_factor": (elapsed / audio_seconds, LOWER)}
+
+
+@benchmark("vosk_wake")
+def bench_vosk_wake():
+    """Vosk keyword spotter CPU cost on fixture audio between stretches of room noise."""
+    try:
+        import numpy as np
+        from src.wake_word_detector import VOSK_AVAILABLE, VoskKeywordSpotter
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    if not VOSK_AVAILABLE:
+        raise SkipBenchmark("vosk not installed")
+    if not os.path.exists(config.VOSK_MODEL_PATH):
+        raise SkipBenchmark(f"Vosk model not found at {config.VOSK_MODEL_PATH}")
+    
+    spotter = VoskKeywordSpotter()
+    rng = np.random.default_rng(0)
+    quiet = rng.integers(-60, 60, spotter.sample_rate * 10).astype(np.int16)
+    parts = [quiet]
+    for _, rate, data in _load_fixture_wavs():
+        if rate == spotter.sample_rate:
+            parts += [np.frombuffer(data, dtype=np.int16), quiet]
+    audio = np.concatenate(parts)
+    
+    length = spotter.frame_length
+    cpu_start = time.process_time()
+    for offset in range(0, len(audio) - length + 1, length):
+        spotter.process(audio[offset:offset + length])
+    cpu = time.process_time() - cpu_start
+    spotter.delete()
+    
+    return {
+        "vosk_wake.cpu_percent": (cpu / (len(audio) / spotter.sample_rate) * 100, LOWER),
+        "vosk_wake.decoded_percent": (spotter.frames_decoded / spotter.frames * 100, LOWER),
+    }
+
+
+@benchmark("ai_processor")
+def bench_ai_processor():
+    """AIProcessor round trip against an instant local mock server."""
+    try:
+        import requests  # noqa: F401
+    except ImportError:
+        raise SkipBenchmark("requests not installed")
+    
+    from src.mock_openai_server import MockOpenAIServer
+    server = MockOpenAIServer(first_token="0", token="0", response_tokens=2).start()
+    
+    settings = ("AI_BACKEND", "LOCAL_LLM_URL", "AI_WARMUP", "AI_REQUESTS_PER_MINUTE", "AI_TOKENS_PER_MINUTE")
+    saved = {name: getattr(config, name, None) for name in settings}
+    config.AI_BACKEND = "local"
+    config.LOCAL_LLM_URL = server.url
+    config.AI_WARMUP = False
+    # Without this the scheduler's rate limits pace the loop and the result
+    # depends on how long it runs, not on the processor
+    config.AI_REQUESTS_PER_MINUTE = 1e9
+    config.AI_TOKENS_PER_MINUTE = 1e12
+    
+    from src.ai_processor import AIProcessor
+    processor = AIProcessor()
+    try:
+        # Distinct commands so identical requests are not coalesced
+        counter = [0]
+        
+        def call():
+            counter[0] += 1
+            processor.process_command(f"what is the weather number {counter[0]}")
+        
+        calls, elapsed = _timed_loop(call)
+    finally:
+        processor.cleanup()
+        server.stop()
+        for name, value in saved.items():
+            setattr(config, name, value)
+    
+    return {"ai_processor.overhead_ms": (elapsed / calls * 1000, LOWER)}
+
+
+@benchmark("fallback_response")
+def bench_fallback_response():
+    """Keyword fallback and intent matching throughput."""
+    from src.ai_processor import AIProcessor
+    
+    processor = AIProcessor.__new__(AIProcessor)
+    commands = [
+        "what's the weather like", "what time is it", "what's the date today",
+        "hello there", "help me", "tell me a joke", "what's your name",
+        "how far away is the moon",
+    ]
+    index = [0]
+    
+    def call():
+        processor._fallback_response(commands[index[0] % len(commands)])
+        index[0] += 1
+    
+    calls, elapsed = _timed_loop(call)
+    return {"fallback_response.calls_per_sec": (calls / elapsed, HIGHER)}
+
+
+@benchmark("tts")
+def bench_tts():
+    """First-chunk and full render time of the TTS backend for a typical response."""
+    try:
+        from src.tts_backends import create_tts_backend
+        backend = create_tts_backend()
+    except Exception as e:
+        raise SkipBenchmark(f"text-to-speech unavailable: {e}")
+    
+    text = "The current time is ten forty five in the morning. Have a great day."
+    try:
+        start = time.perf_counter()
+        first_chunk = None
+        for _ in backend.synthesize(text):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+    finally:
+        backend.cleanup()
+    
+    return {
+        "tts.first_chunk_ms": (first_chunk * 1000, LOWER),
+        "tts.render_ms": (elapsed * 1000, LOWER),
+    }
+
+
+@benchmark("resampler")
+def bench_resampler():
+    """Polyphase resampler throughput and CPU cost from 48 and 44.1 kHz stereo to 16 kHz."""
+    try:
+        import numpy as np
+        from src.resampler import PolyphaseResampler
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    
+    results = {}
+    for rate, name in ((48000, "48k"), (44100, "44k")):
+        # Ten seconds of stereo capture, fed in 20 ms blocks like a live stream
+        audio = np.random.default_rng(0).integers(-8000, 8000, (rate * 10, 2)).astype(np.int16)
+        block = rate // 50
+        resampler = PolyphaseResampler(rate, 16000)
+        
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for offset in range(0, len(audio), block):
+            resampler.process(audio[offset:offset + block])
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        
+        results[f"resampler.{name}_msamples_per_sec"] = (len(audio) / elapsed / 1e6, HIGHER)
+        results[f"resampler.{name}_cpu_percent"] = (cpu / 10 * 100, LOWER)
+    return results
+
+
+@benchmark("beamformer")
+def bench_beamformer():
+    """Delay-and-sum beamformer CPU cost per block for a 4-microphone array."""
+    try:
+        import numpy as np
+        from src.beamformer import DelayAndSumBeamformer
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    
+    results = {}
+    for rate, name in ((48000, "48k"), (16000, "16k")):
+        # Ten seconds of a talker 2 samples apart on each microphone, in 32 ms blocks
+        rng = np.random.default_rng(0)
+        talker = rng.integers(-8000, 8000, rate * 10 + 8)
+        audio = np.stack([talker[8 - 2 * i:len(talker) - 2 * i] for i in range(4)], axis=1)
+        audio = (audio + rng.integers(-500, 500, audio.shape)).astype(np.int16)
+        block = int(rate * 0.032)
+        beamformer = DelayAndSumBeamformer(4, rate, spacing=0.1)
+        
+        blocks = 0
+        cpu_start = time.process_time()
+        for offset in range(0, len(audio), block):
+            beamformer.process(audio[offset:offset + block])
+            blocks += 1
+        cpu = time.process_time() - cpu_start
+        
+        results[f"beamformer.{name}_block_us"] = (cpu / blocks * 1e6, LOWER)
+        results[f"beamformer.{name}_cpu_percent"] = (cpu / 10 * 100, LOWER)
+    return results
+
+
+@benchmark("dsp")
+def bench_dsp():
+    """Speech enhancement (high-pass, noise suppression, AGC) CPU cost per 32 ms block."""
+    try:
+        import numpy as np
+        from src.speech_enhancer import DSP_AVAILABLE, SpeechEnhancer
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    if not DSP_AVAILABLE:
+        raise SkipBenchmark("numpy or scipy not installed")
+    
+    # Ten seconds of noisy audio at 16 kHz
+    audio = np.random.default_rng(0).integers(-4000, 4000, 160000).astype(np.int16)
+    enhancer = SpeechEnhancer(16000, block_budget_ms=1000.0)
+    
+    cpu_start = time.process_time()
+    enhancer.enhance(audio)
+    cpu = time.process_time() - cpu_start
+    
+    return {
+        "dsp.block_us": (cpu / enhancer.blocks * 1e6, LOWER),
+        "dsp.cpu_percent": (cpu / 10 * 100, LOWER),
+    }
+
+
+@benchmark("earcon")
+def bench_earcon():
+    """AudioManager system sound generation time."""
+    try:
+        from src.audio_manager import AUDIO_AVAILABLE, AudioManager
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    if not AUDIO_AVAILABLE:
+        raise SkipBenchmark("numpy not installed")
+    
+    manager = AudioManager.__new__(AudioManager)
+    calls, elapsed = _timed_loop(lambda: manager._make_tone(800, 0.3))
+    return {"earcon.generate_us": (elapsed / calls * 1e6, LOWER)}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline.
+    
+    Args:
+        results (dict): Metric name to {"value", "better"}
+        baseline (dict): Baseline metrics in the same format, optionally
+            with a per-metric "tolerance"
+        tolerance (float): Default allowed relative regression
+    
+    Returns:
+        tuple: (descriptions of metrics that regressed, number of metrics
+        compared with a baseline)
+    """
+    regressions = []
+    compared = 0
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None or not base["value"]:
+            print(f"  {name:<38} {result['value']:>12.3f}   (no baseline)")
+            continue
+        
+        compared += 1
+        allowed = base.get("tolerance", tolerance)
+        change = (result["value"] - base["value"]) / base["value"]
+        worse = -change if result["better"] == HIGHER else change
+        status = "REGRESSED" if worse > allowed else "ok"
+        print(f"  {name:<38} {result['value']:>12.3f}   baseline {base['value']:>12.3f}   "
+              f"{change:+7.1%}   {status}")
+        if worse > allowed:
+            regressions.append(f"{name}: {change:+.1%} (allowed {allowed:.0%})")
+    return regressions, compared
+
+
+def main():
+    """Run the benchmarks and check for regressions."""
+    parser = argparse.ArgumentParser(description="Wakeon component benchmarks")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Benchmarks to run")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed relative regression (default: 0.15)")
+    parser.add_argument("--update-baseline", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--output", help="Also write results to this JSON file")
+    args = parser.parse_args()
+    
+    results = {}
+    skipped = []
+    failed = []
+    for name in args.only or sorted(BENCHMARKS):
+        try:
+            metrics = BENCHMARKS[name]()
+        except SkipBenchmark as e:
+            print(f"- {name}: skipped ({e})")
+            skipped.append(name)
+            continue
+        except Exception as e:
+            # One broken benchmark must not hide the results of the others
+            print(f"- {name}: FAILED ({type(e).__name__}: {e})")
+            failed.append(name)
+            continue
+        print(f"- {name}: done")
+        for metric, (value, better) in metrics.items():
+            results[metric] = {"value": value, "better": better}
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"metrics": results}, f, indent=2, sort_keys=True)
+    
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("metrics", {})
+    
+    if args.update_baseline:
+        # Keep per-metric tolerances and metrics skipped on this run
+        for name, result in results.items():
+            if "tolerance" in baseline.get(name, {}):
+                result["tolerance"] = baseline[name]["tolerance"]
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"metrics": baseline}, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+        if skipped:
+            print(f"⚠️  No data from: {', '.join(skipped)} (skipped, see above)")
+        if failed:
+            print(f"❌ Failed: {', '.join(failed)} (see above)")
+            sys.exit(1)
+        return
+    
+    print("\nResults")
+    regressions, compared = compare(results, baseline, args.tolerance)
+    if skipped:
+        print(f"\n⚠️  No data from: {', '.join(skipped)} (skipped, see above)")
+    if failed:
+        print(f"\n❌ Failed: {', '.join(failed)} (see above)")
+    if regressions:
+        print("\n❌ Performance regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
+    if not compared:
+        if not os.path.exists(args.baseline):
+            print(f"\n⚠️  No baseline at {args.baseline}; record one with --update-baseline")
+        print("\n⚠️  Nothing was compared with a baseline")
+        sys.exit(2)
+    print(f"\n✅ No regressions ({compared} metrics compared)")
+
+
+if __name__ == "__main__":
+    main()
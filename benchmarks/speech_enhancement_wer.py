@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Word error rate and retry rate with and without speech enhancement
+
+Usage:
+    python benchmarks/speech_enhancement_wer.py
+    python benchmarks/speech_enhancement_wer.py --noise hum white --snr 10 5 0 --level -35
+    python benchmarks/speech_enhancement_wer.py --fixtures recordings/ --output wer.json
+
+Each 16-bit mono WAV in the fixtures directory needs a reference transcript
+in a .txt file of the same name. The recordings are made quieter (--level,
+a distant talker), mixed with noise at each signal-to-noise ratio, and
+decoded with Vosk as recorded and after the DSP stage (high-pass filter,
+noise suppression and AGC). A turn counts as a retry when the transcript
+is empty or the transcript gate rejects it, i.e. when the assistant would
+answer "I didn't catch that".
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+# Add the project root to the path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+from src import metrics  # noqa: E402
+from src.audio_io import read_wav  # noqa: E402
+from src.speech_enhancer import DSP_AVAILABLE, SpeechEnhancer  # noqa: E402
+from src.transcript_gate import TranscriptGate, parse_result  # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT, "benchmarks", "fixtures")
+
+
+def load_fixtures(directory):
+    """
+    Load recordings that have a reference transcript.
+    
+    Returns:
+        list: (name, int16 samples, sample rate, reference text)
+    """
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+        transcript = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(transcript):
+            continue
+        try:
+            audio, sample_rate = read_wav(path)
+        except ValueError:
+            continue
+        with open(transcript) as f:
+            fixtures.append((os.path.basename(path), audio, sample_rate, f.read().strip().lower()))
+    return fixtures
+
+
+def make_noise(kind, length, sample_rate, rng):
+    """
+    Generate unit-RMS noise.
+    
+    Args:
+        kind (str): "white", "pink" or "hum" (50 Hz mains with harmonics and some hiss)
+        length (int): Number of samples
+        sample_rate (int): Sample rate in Hz
+        rng (numpy.random.Generator): Random source
+    
+    Returns:
+        numpy.ndarray: float64 samples
+    """
+    if kind == "white":
+        noise = rng.standard_normal(length)
+    elif kind == "pink":
+        # Shape white noise by 1/sqrt(f) in the frequency domain
+        spectrum = np.fft.rfft(rng.standard_normal(length))
+        spectrum /= np.sqrt(np.maximum(np.fft.rfftfreq(length, 1 / sample_rate), 20.0))
+        noise = np.fft.irfft(spectrum, n=length)
+    elif kind == "hum":
+        t = np.arange(length) / sample_rate
+        noise = sum(np.sin(2 * np.pi * 50 * k * t) / k for k in (1, 2, 3, 5))
+        noise = noise + 0.1 * rng.standard_normal(length)
+    else:
+        raise ValueError(f"Unknown noise type '{kind}'")
+    return noise / np.sqrt(np.mean(noise ** 2))
+
+
+def degrade(audio, level_dbfs, snr_db, noise):
+    """
+    Make a recording quieter and add noise.
+    
+    Args:
+        audio (numpy.ndarray): int16 speech
+        level_dbfs (float): RMS level of the speech afterwards
+        snr_db (float): Speech to noise ratio in dB
+        noise (numpy.ndarray): Unit-RMS noise of the same length
+    
+    Returns:
+        numpy.ndarray: int16 samples
+    """
+    speech = audio.astype(np.float64)
+    rms = np.sqrt(np.mean(speech ** 2)) or 1.0
+    speech *= 32768 * 10 ** (level_dbfs / 20) / rms
+    mixed = speech + noise * 32768 * 10 ** ((level_dbfs - snr_db) / 20)
+    return np.clip(np.rint(mixed), -32768, 32767).astype(np.int16)
+
+
+def word_errors(reference, hypothesis):
+    """
+    Count word substitutions, insertions and deletions (Levenshtein distance).
+    
+    Returns:
+        tuple: (errors, reference word count)
+    """
+    ref, hyp = reference.split(), hypothesis.split()
+    previous = list(range(len(hyp) + 1))
+    for i, word in enumerate(ref, 1):
+        current = [i]
+        for j, other in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (word != other)))
+        previous = current
+    return previous[-1], len(ref)
+
+
+def decode(model, audio, sample_rate):
+    """Decode a recording like the assistant does, with word details."""
+    import vosk
+    rec = vosk.KaldiRecognizer(model, sample_rate)
+    rec.SetWords(True)
+    rec.AcceptWaveform(audio.tobytes())
+    return parse_result(json.loads(rec.FinalResult()))
+
+
+def evaluate(model, fixtures, noises, snrs, level_dbfs, seed=0):
+    """
+    Decode every fixture under every condition, with and without enhancement.
+    
+    Returns:
+        list: One dict per condition with word error and retry rates
+    """
+    rng = np.random.default_rng(seed)
+    gate = TranscriptGate()
+    results = []
+    for kind in noises:
+        for snr in snrs:
+            counts = {"raw": [0, 0, 0], "enhanced": [0, 0, 0]}
+            for _, audio, sample_rate, reference in fixtures:
+                noisy = degrade(audio, level_dbfs, snr, make_noise(kind, len(audio), sample_rate, rng))
+                enhancer = SpeechEnhancer(sample_rate)
+                for variant, samples in (("raw", noisy), ("enhanced", enhancer.enhance(noisy))):
+                    transcript = gate.check(decode(model, samples, sample_rate))
+                    errors, words = word_errors(reference, transcript.text)
+                    counts[variant][0] += errors
+                    counts[variant][1] += words
+                    counts[variant][2] += int(not transcript.text or transcript.rejected is not None)
+            
+            result = {"noise": kind, "snr_db": snr, "level_dbfs": level_dbfs}
+            for variant, (errors, words, retries) in counts.items():
+                result[f"{variant}_wer"] = errors / words if words else 0.0
+                result[f"{variant}_retry_rate"] = retries / len(fixtures)
+            results.append(result)
+    return results
+
+
+def print_results(results, fixtures):
+    """Print the comparison table."""
+    print(f"Speech enhancement on {len(fixtures)} recordings at {results[0]['level_dbfs']:.0f} dBFS")
+    print("  noise   SNR      WER raw -> enhanced     retries raw -> enhanced")
+    for r in results:
+        print(f"  {r['noise']:<6} {r['snr_db']:>4.0f} dB   {r['raw_wer']:>7.1%} -> {r['enhanced_wer']:<7.1%}"
+              f"      {r['raw_retry_rate']:>7.1%} -> {r['enhanced_retry_rate']:.1%}")
+    summary = metrics.get_stats("dsp.block_cpu").summary()
+    if summary["p95"] is not None:
+        print(f"  DSP CPU per block: p50 {summary['p50'] * 1000:.2f} ms, p95 {summary['p95'] * 1000:.2f} ms")
+
+
+def main():
+    """Run the comparison."""
+    parser = argparse.ArgumentParser(description="WER and retry rate with and without speech enhancement")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Directory of WAV files with .txt transcripts")
+    parser.add_argument("--noise", nargs="+", default=["hum", "pink"], choices=["white", "pink", "hum"],
+                        help="Noise types to mix in (default: hum pink)")
+    parser.add_argument("--snr", nargs="+", type=float, default=[20.0, 10.0, 5.0],
+                        help="Speech to noise ratios in dB (default: 20 10 5)")
+    parser.add_argument("--level", type=float, default=-35.0,
+                        help="Speech level in dBFS, low for a distant talker (default: -35)")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+    
+    try:
+        import vosk
+    except ImportError:
+        print("❌ Vosk not available. Install with: pip install vosk")
+        return 1
+    if not DSP_AVAILABLE:
+        print("❌ numpy and scipy not available. Install with: pip install numpy scipy")
+        return 1
+    if not os.path.exists(config.VOSK_MODEL_PATH):
+        print(f"❌ Vosk model not found at {config.VOSK_MODEL_PATH}")
+        return 1
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"❌ No 16-bit mono WAV files with .txt transcripts in {args.fixtures}")
+        return 1
+    
+    vosk.SetLogLevel(-1)
+    model = vosk.Model(config.VOSK_MODEL_PATH)
+    results = evaluate(model, fixtures, args.noise, args.snr, args.level)
+    print_results(results, fixtures)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Pluggable AI backends: OpenAI and a local llama.cpp-style server
+"""
+
+import importlib.util
+import json
+import logging
+import time
+from collections import namedtuple
+
+import config
+
+# Optional dependencies are only imported by the backend that uses them, so
+# an unused client library costs no memory (openai alone pulls in httpx and
+# pydantic)
+OPENAI_AVAILABLE = all(importlib.util.find_spec(name) for name in ("httpx", "openai"))
+REQUESTS_AVAILABLE = importlib.util.find_spec("requests") is not None
+httpx = openai = requests = None
+
+logger = logging.getLogger(__name__)
+
+# Idle pooled connections are kept this long (httpx drops them after 5 s by
+# default, which would undo pre-warming before the command is spoken)
+KEEPALIVE_SECONDS = 60.0
+
+# Deadline for a pre-warming request
+PREWARM_TIMEOUT = 5.0
+
+# Result of one chat completion
+BackendResponse = namedtuple(
+    "BackendResponse",
+    ["text", "headers", "first_token_seconds", "total_seconds"]
+)
+
+
+class BackendError(Exception):
+    """Raised when an AI backend request fails."""
+
+
+class BackendUnavailableError(BackendError):
+    """Raised when a backend cannot be used (missing library or key)."""
+
+
+class BackendAuthError(BackendError):
+    """Raised when the backend rejects our credentials."""
+
+
+class BackendRateLimitError(BackendError):
+    """Raised when the backend reports a rate limit."""
+    
+    def __init__(self, message, retry_after=None, headers=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.headers = headers or {}
+
+
+class BackendTimeoutError(BackendError):
+    """Raised when a request runs past its deadline."""
+
+
+def _import_openai():
+    """Import the OpenAI client libraries on first use."""
+    global httpx, openai
+    try:
+        import httpx
+        import openai
+    except ImportError as e:
+        raise BackendUnavailableError(f"OpenAI not available: {e}")
+
+
+def _import_requests():
+    """Import requests on first use."""
+    global requests
+    try:
+        import requests
+    except ImportError as e:
+        raise BackendUnavailableError(f"requests not available: {e}")
+
+
+class AIBackend:
+    """Base class for chat-completion backends."""
+    
+    name = "base"
+    
+    def complete(self, messages, max_tokens, timeout=None, on_token=None):
+        """
+        Run a streaming chat completion.
+        
+        Args:
+            messages (list): Chat messages, system prompt first
+            max_tokens (int): Maximum number of tokens to generate
+            timeout (float): Request deadline in seconds, or None
+            on_token (callable): Called with each text chunk as it arrives
+        
+        Returns:
+            BackendResponse: Full text, response headers and timings
+        """
+        raise NotImplementedError
+    
+    def warmup(self, system_prompt):
+        """
+        Prepare the backend before the first turn.
+        
+        Args:
+            system_prompt (str): The constant system prompt prefix
+        """
+    
+    def prewarm(self):
+        """
+        Open or refresh the pooled connection (DNS, TCP, TLS) ahead of a request.
+        
+        Raises:
+            BackendError: If the server could not be reached
+        """
+    
+    def cleanup(self):
+        """Clean up resources."""
+
+
+class OpenAIBackend(AIBackend):
+    """Chat completions through the OpenAI API."""
+    
+    name = "openai"
+    
+    def __init__(self):
+        """Initialize the OpenAI client."""
+        if not OPENAI_AVAILABLE:
+            raise BackendUnavailableError("OpenAI not available. Install with: pip install openai")
+        if config.OPENAI_API_KEY == "your_api_key_here":
+            raise BackendUnavailableError("OpenAI API key not configured.")
+        
+        _import_openai()
+        limits = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=KEEPALIVE_SECONDS)
+        # The scheduler handles 429s and deadlines itself; SDK retries would
+        # hide them and run past the caller's budget
+        self.client = openai.OpenAI(
+            api_key=config.OPENAI_API_KEY,
+            base_url=getattr(config, "OPENAI_BASE_URL", None) or None,
+            http_client=httpx.Client(limits=limits),
+            max_retries=0
+        )
+    
+    def complete(self, messages, max_tokens, timeout=None, on_token=None):
+        """Run a streaming chat completion against OpenAI."""
+        start = time.monotonic()
+        first_token = None
+        chunks = []
+        
+        try:
+            raw = self.client.chat.completions.with_raw_response.create(
+                model=config.OPENAI_MODEL,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.7,
+                stream=True,
+                timeout=timeout
+            )
+            headers = _lower_headers(raw.headers)
+            
+            for chunk in raw.parse():
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue
+                if first_token is None:
+                    first_token = time.monotonic() - start
+                chunks.append(text)
+                if on_token:
+                    on_token(text)
+        
+        except openai.AuthenticationError as e:
+            raise BackendAuthError(str(e))
+        except openai.RateLimitError as e:
+            headers = _lower_headers(e.response.headers) if e.response is not None else {}
+            raise BackendRateLimitError(str(e), _parse_retry_after(headers), headers)
+        except openai.APITimeoutError as e:
+            raise BackendTimeoutError(str(e))
+        except openai.APIError as e:
+            raise BackendError(str(e))
+        
+        return BackendResponse("".join(chunks).strip(), headers, first_token, time.monotonic() - start)
+    
+    def prewarm(self):
+        """Look up the model, which costs no tokens but leaves a connection in the pool."""
+        try:
+            self.client.models.retrieve(config.OPENAI_MODEL, timeout=PREWARM_TIMEOUT)
+        except openai.APIStatusError:
+            # Any HTTP answer means the connection is up
+            pass
+        except openai.APIError as e:
+            raise BackendError(str(e))
+
+
+class LocalLLMBackend(AIBackend):
+    """
+    Chat completions from a local llama.cpp-style server.
+    
+    The server speaks the OpenAI chat-completions protocol. Requests ask it to
+    keep the prompt in its KV cache, so the constant system prompt is only
+    processed once and each turn only pays for the new user text.
+    """
+    
+    name = "local"
+    
+    def __init__(self):
+        """Initialize the HTTP session for the local server."""
+        if not REQUESTS_AVAILABLE:
+            raise BackendUnavailableError("requests not available. Install with: pip install requests")
+        _import_requests()
+        
+        self.base_url = getattr(config, "LOCAL_LLM_URL", "http://127.0.0.1:8080").rstrip("/")
+        self.url = self.base_url + "/v1/chat/completions"
+        self.model = getattr(config, "LOCAL_LLM_MODEL", "local")
+        self.slot = getattr(config, "LOCAL_LLM_SLOT", -1)
+        
+        # Keep-alive session so each turn reuses the same connection
+        self.session = requests.Session()
+    
+    def _payload(self, messages, max_tokens):
+        """Build the request body with prompt caching enabled."""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "stream": True,
+            "cache_prompt": True
+        }
+        # Pinning a slot keeps the cached prefix on the same KV cache
+        if self.slot is not None and self.slot >= 0:
+            payload["id_slot"] = self.slot
+        return payload
+    
+    def complete(self, messages, max_tokens, timeout=None, on_token=None):
+        """Run a streaming chat completion against the local server."""
+        start = time.monotonic()
+        first_token = None
+        chunks = []
+        
+        try:
+            with self.session.post(self.url, json=self._payload(messages, max_tokens),
+                                   stream=True, timeout=timeout) as response:
+                headers = _lower_headers(response.headers)
+                if response.status_code == 401:
+                    raise BackendAuthError("Local LLM server rejected the request")
+                if response.status_code == 429:
+                    raise BackendRateLimitError("Local LLM server is busy",
+                                                _parse_retry_after(headers), headers)
+                if response.status_code >= 400:
+                    raise BackendError(f"Local LLM server returned HTTP {response.status_code}")
+                
+                # The timeout above bounds each read, not the whole stream, so
+                # a server trickling tokens is stopped here
+                deadline = start + timeout if timeout is not None else None
+                finished = False
+                for line in response.iter_lines():
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise BackendTimeoutError(f"Local LLM response took longer than {timeout:.1f}s")
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        finished = True
+                        break
+                    try:
+                        choices = json.loads(data).get("choices") or []
+                    except (ValueError, AttributeError) as e:
+                        raise BackendError(f"Local LLM server sent a malformed event: {e}")
+                    if not choices:
+                        continue
+                    if choices[0].get("finish_reason"):
+                        finished = True
+                    text = choices[0].get("delta", {}).get("content")
+                    if not text:
+                        continue
+                    if first_token is None:
+                        first_token = time.monotonic() - start
+                    chunks.append(text)
+                    if on_token:
+                        on_token(text)
+                
+                # A stream cut off without a finish reason is a truncated answer
+                if not finished:
+                    raise BackendError("Local LLM server closed the stream early")
+        
+        except requests.exceptions.Timeout as e:
+            raise BackendTimeoutError(str(e))
+        except requests.exceptions.RequestException as e:
+            raise BackendError(f"Local LLM server unreachable: {e}")
+        
+        return BackendResponse("".join(chunks).strip(), headers, first_token, time.monotonic() - start)
+    
+    def warmup(self, system_prompt):
+        """Evaluate the system prompt once so its KV cache is ready."""
+        try:
+            self.complete([{"role": "system", "content": system_prompt}], max_tokens=1, timeout=30)
+            logger.debug("Local LLM prompt cache primed")
+        except BackendError as e:
+            logger.warning(f"Could not prime local LLM prompt cache: {e}")
+    
+    def prewarm(self):
+        """Ask the server's health endpoint over the keep-alive session."""
+        try:
+            self.session.get(self.base_url + "/health", timeout=PREWARM_TIMEOUT).close()
+        except requests.exceptions.RequestException as e:
+            raise BackendError(f"Local LLM server unreachable: {e}")
+    
+    def cleanup(self):
+        """Close the HTTP session."""
+        self.session.close()
+
+
+BACKENDS = {
+    OpenAIBackend.name: OpenAIBackend,
+    LocalLLMBackend.name: LocalLLMBackend,
+}
+
+
+def create_backend(name=None):
+    """
+    Create the AI backend selected in the configuration.
+    
+    Args:
+        name (str): Backend name; defaults to config.AI_BACKEND
+    
+    Returns:
+        AIBackend: The backend instance
+    
+    Raises:
+        BackendUnavailableError: If the backend is unknown or cannot be used
+    """
+    if name is None:
+        name = getattr(config, "AI_BACKEND", OpenAIBackend.name)
+    if name not in BACKENDS:
+        raise BackendUnavailableError(f"Unknown AI backend '{name}'")
+    return BACKENDS[name]()
+
+
+def _lower_headers(headers):
+    """Copy response headers into a dict with lower-case names."""
+    return {name.lower(): value for name, value in headers.items()}
+
+
+def _parse_retry_after(headers):
+    """Read a Retry-After header in seconds, if present."""
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
@@ -1,95 +1,402 @@
 """
-AI Processing using OpenAI API
+AI Processing using OpenAI API or a local LLM server
 """
 
 import logging
-import config
+import threading
+import time
+from collections import OrderedDict
 
-# Try to import optional dependencies
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+import config
+from src import metrics
+from src.ai_backends import (
+    BackendAuthError,
+    BackendError,
+    BackendRateLimitError,
+    BackendTimeoutError,
+    BackendUnavailableError,
+    create_backend,
+)
+from src.ai_scheduler import AIRequestScheduler, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from src.circuit_breaker import STATE_CLOSED, CircuitBreaker
+from src.latency_budget import STAGE_AI
 
 logger = logging.getLogger(__name__)
 
 
 class AIProcessor:
-    """Handles AI processing using OpenAI API."""
+    """Handles AI processing through a configurable backend."""
     
     def __init__(self):
         """Initialize the AI processor."""
         logger.info("Initializing AI processor...")
         
-        if not OPENAI_AVAILABLE:
-            logger.warning("OpenAI not available. Using fallback responses.")
-            self.use_fallback = True
-            return
+        # Recent answers, used when the latency budget leaves no time for a request
+        self.response_cache = OrderedDict()
+        self.backend = None
+        self.scheduler = None
+        self.breaker = None
+        self.secondary_backend = None
+        self.secondary_scheduler = None
+        
+        # How the last command was answered: backend name, cache hit, error.
+        # Kept per thread so concurrent callers each see their own turn.
+        self._turn = threading.local()
+        
+        # When the backend connection was last used by a request or pre-warmed
+        self._connection_used_at = None
+        self._prewarmed_at = None
         
         try:
-            # Configure OpenAI client
-            if config.OPENAI_API_KEY == "your_api_key_here":
-                logger.warning("OpenAI API key not configured. Using fallback responses.")
-                self.use_fallback = True
-            else:
-                openai.api_key = config.OPENAI_API_KEY
-                self.use_fallback = False
-                logger.info("AI processor initialized with OpenAI")
+            self.backend = create_backend()
+            self.scheduler = AIRequestScheduler(self.backend)
+            self.use_fallback = False
+            logger.info(f"AI processor initialized with backend '{self.backend.name}'")
+            
+            if getattr(config, "AI_BREAKER_ENABLED", True):
+                self.breaker = CircuitBreaker(self.backend.name)
+                self._init_secondary_backend()
+            
+            if getattr(config, "AI_WARMUP", True):
+                self.backend.warmup(self._get_system_prompt())
+                self._connection_used_at = time.monotonic()
                 
+        except BackendUnavailableError as e:
+            logger.warning(f"{e} Using fallback responses.")
+            self.use_fallback = True
+            
         except Exception as e:
             logger.error(f"Failed to initialize AI processor: {e}")
             self.use_fallback = True
     
-    def process_command(self, command):
+    @property
+    def last_turn_info(self):
+        """dict: How this thread's last command was answered."""
+        return getattr(self._turn, "info", {})
+    
+    @last_turn_info.setter
+    def last_turn_info(self, info):
+        self._turn.info = info
+    
+    def _init_secondary_backend(self):
+        """Create the backend used while the circuit breaker is open (AI_FALLBACK_BACKEND)."""
+        name = getattr(config, "AI_FALLBACK_BACKEND", None)
+        if not name or name == self.backend.name:
+            return
+        try:
+            self.secondary_backend = create_backend(name)
+            self.secondary_scheduler = AIRequestScheduler(self.secondary_backend)
+            logger.info(f"Secondary AI backend '{name}' ready for when '{self.backend.name}' is degraded")
+        except Exception as e:
+            logger.warning(f"Secondary AI backend '{name}' not available: {e}")
+    
+    def process_command(self, command, budget=None, on_token=None, priority=PRIORITY_INTERACTIVE):
         """
         Process a voice command with AI.
         
         Args:
             command (str): The voice command to process
+            budget (LatencyBudget): Turn budget bounding the AI request
+            on_token (callable): Called with each text chunk as it streams in
+            priority (int): Scheduler priority; background work should pass
+                PRIORITY_BACKGROUND
             
         Returns:
             str: AI response or None if processing failed
         """
         logger.debug(f"Processing command: {command}")
+        self.last_turn_info = {"backend": "fallback", "cache_hit": False, "error": None}
         
         if self.use_fallback:
             return self._fallback_response(command)
         
+        self.last_turn_info["backend"] = self.backend.name
+        connection = self._connection_state()
+        self.last_turn_info["ai_connection"] = connection
+        
+        if budget is not None and not budget.check(STAGE_AI):
+            return self._degraded_response(command)
+        
+        # The backend is failing or slow: answer at once and probe it in the background
+        if self.breaker is not None and not self.breaker.allow_request():
+            self._send_probe()
+            return self._answer_while_open(command, budget, on_token, priority)
+        
         try:
-            # Create chat completion
-            response = openai.ChatCompletion.create(
-                model=config.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": self._get_system_prompt()},
-                    {"role": "user", "content": command}
-                ],
-                max_tokens=config.OPENAI_MAX_TOKENS,
-                temperature=0.7
+            # Create chat completion; the system prompt stays first and
+            # unchanged so backends can reuse its cached prefix
+            response = self._complete(
+                self._build_messages(command),
+                max_tokens=self._get_max_tokens(budget),
+                timeout=budget.remaining() if budget is not None else None,
+                priority=priority,
+                on_token=on_token
             )
+            self._record_latency(response, connection)
+            self._connection_used_at = time.monotonic()
             
-            ai_response = response.choices[0].message.content.strip()
+            ai_response = response.text
             logger.info(f"AI Response: {ai_response}")
+            self._cache_response(command, ai_response)
             return ai_response
             
-        except openai.error.AuthenticationError:
-            logger.error("OpenAI authentication failed. Check your API key.")
+        except BackendTimeoutError as e:
+            logger.warning("AI request ran past the latency budget.")
+            self.last_turn_info["error"] = f"timeout: {e}"
+            if budget is not None:
+                budget.check(STAGE_AI)
+            return self._degraded_response(command)
+            
+        except BackendAuthError as e:
+            logger.error("AI backend authentication failed. Check your API key.")
+            self.last_turn_info["error"] = f"auth: {e}"
             return "I'm sorry, I'm having trouble connecting to my AI service. Please check your API key."
             
-        except openai.error.RateLimitError:
-            logger.error("OpenAI rate limit exceeded.")
+        except BackendRateLimitError as e:
+            logger.error("AI backend rate limit exceeded.")
+            self.last_turn_info["error"] = f"rate_limit: {e}"
             return "I'm sorry, I'm receiving too many requests right now. Please try again later."
             
-        except openai.error.APIError as e:
-            logger.error(f"OpenAI API error: {e}")
+        except BackendError as e:
+            logger.error(f"AI backend error: {e}")
+            self.last_turn_info["error"] = str(e)
             return "I'm sorry, I encountered an error processing your request."
             
         except Exception as e:
             logger.error(f"Error processing command with AI: {e}")
+            self.last_turn_info.update(backend="fallback", error=str(e))
             return self._fallback_response(command)
     
+    def _complete(self, messages, **kwargs):
+        """
+        Run a request through the scheduler and report its outcome to the breaker.
+        
+        Returns:
+            BackendResponse: The response
+        """
+        try:
+            response = self.scheduler.complete(messages, **kwargs)
+        except BackendTimeoutError as e:
+            # A request cut off by a tight turn budget before it could count
+            # as slow says nothing about the backend's health
+            timeout = kwargs.get("timeout")
+            if self.breaker is not None and (timeout is None or timeout >= self.breaker.latency_threshold):
+                self.breaker.record_failure(e)
+            raise
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.record_failure(e)
+            raise
+        if self.breaker is not None:
+            self.breaker.record_success(self._breaker_latency(response))
+        return response
+    
+    @staticmethod
+    def _breaker_latency(response):
+        """Latency the user waits on: time to first token when streamed."""
+        if response.first_token_seconds is not None:
+            return response.first_token_seconds
+        return response.total_seconds
+    
+    def _build_messages(self, command):
+        """
+        Build the chat messages for a command.
+        
+        Args:
+            command (str): The voice command
+            
+        Returns:
+            list: System prompt followed by the user's command
+        """
+        return [
+            {"role": "system", "content": self._get_system_prompt()},
+            {"role": "user", "content": command}
+        ]
+    
+    def _send_probe(self):
+        """Send a tiny background request to find out whether the backend has recovered."""
+        if not self.breaker.try_probe():
+            return
+        
+        logger.info(f"Probing AI backend '{self.backend.name}'")
+        future = self.scheduler.submit(
+            self._build_messages("Reply with OK."),
+            max_tokens=1,
+            timeout=getattr(config, "AI_REQUEST_TIMEOUT", 15),
+            priority=PRIORITY_BACKGROUND
+        )
+        
+        def report(done):
+            try:
+                self.breaker.record_success(self._breaker_latency(done.result()), probe=True)
+            except Exception as e:
+                self.breaker.record_failure(e, probe=True)
+        
+        future.add_done_callback(report)
+    
+    def _answer_while_open(self, command, budget, on_token, priority):
+        """
+        Answer while the circuit breaker is open: secondary backend, cache or fallback.
+        
+        Args:
+            command (str): The voice command
+            budget (LatencyBudget): Turn budget or None
+            on_token (callable): Streaming callback
+            priority (int): Scheduler priority
+            
+        Returns:
+            str: Response for the user
+        """
+        self.last_turn_info["error"] = "circuit_open"
+        if self.secondary_scheduler is None:
+            return self._degraded_response(command, reason="AI backend degraded")
+        
+        try:
+            response = self.secondary_scheduler.complete(
+                self._build_messages(command),
+                max_tokens=self._get_max_tokens(budget),
+                timeout=budget.remaining() if budget is not None else None,
+                priority=priority,
+                on_token=on_token
+            )
+            self.last_turn_info["backend"] = self.secondary_backend.name
+            logger.info(f"AI Response ({self.secondary_backend.name}): {response.text}")
+            return response.text
+        except Exception as e:
+            logger.warning(f"Secondary AI backend failed: {e}")
+            return self._degraded_response(command, reason="AI backends degraded")
+    
+    def _record_latency(self, response, connection=None):
+        """
+        Record time to first token and total time for the active backend.
+        
+        Args:
+            response (BackendResponse): The completed response
+            connection (str): State of the connection when the request was
+                sent ("cold", "warm" or "prewarmed"); time to first token is
+                also recorded per state, to show what pre-warming saves
+        """
+        prefix = f"ai.{self.backend.name}"
+        if response.first_token_seconds is not None:
+            metrics.get_stats(f"{prefix}.first_token").record(response.first_token_seconds)
+            if connection is not None:
+                metrics.get_stats(f"{prefix}.first_token.{connection}").record(response.first_token_seconds)
+        metrics.get_stats(f"{prefix}.total").record(response.total_seconds)
+    
+    def _connection_state(self):
+        """
+        Tell whether a request now would find a pooled connection.
+        
+        Returns:
+            str: "warm" if a request used the connection within
+                AI_PREWARM_IDLE_SECONDS, "prewarmed" if prewarm() opened it
+                within that time, "cold" otherwise
+        """
+        idle = getattr(config, "AI_PREWARM_IDLE_SECONDS", 20.0)
+        now = time.monotonic()
+        if self._connection_used_at is not None and now - self._connection_used_at < idle:
+            return "warm"
+        if self._prewarmed_at is not None and now - self._prewarmed_at < idle:
+            return "prewarmed"
+        return "cold"
+    
+    def prewarm(self):
+        """
+        Open or refresh the backend connection before a command arrives.
+        
+        Called on the wake word, while the user is still speaking, so the
+        request does not pay for DNS and the TCP and TLS handshakes. Does
+        nothing if the connection is still warm or the backend is failing.
+        """
+        if self.use_fallback or self.backend is None:
+            return
+        if self.breaker is not None and self.breaker.state != STATE_CLOSED:
+            return
+        if self._connection_state() != "cold":
+            return
+        
+        try:
+            self.backend.prewarm()
+        except BackendError as e:
+            logger.debug(f"Pre-warming the AI connection failed: {e}")
+            return
+        self._prewarmed_at = time.monotonic()
+        logger.debug(f"AI connection to '{self.backend.name}' pre-warmed")
+    
+    def _get_max_tokens(self, budget):
+        """
+        Scale the response length down when the latency budget is running low.
+        
+        Below LATENCY_TOKEN_SCALE_SECONDS of remaining budget, max_tokens
+        shrinks in proportion to the time left, down to LATENCY_MIN_MAX_TOKENS.
+        
+        Args:
+            budget (LatencyBudget): Turn budget or None
+            
+        Returns:
+            int: max_tokens for the request
+        """
+        max_tokens = config.OPENAI_MAX_TOKENS
+        if budget is None:
+            return max_tokens
+        
+        # Recognition has used part of the budget by now on every turn, so
+        # answers are only shortened once little of it is left
+        threshold = min(getattr(config, "LATENCY_TOKEN_SCALE_SECONDS", 1.5), budget.total_seconds)
+        remaining = budget.remaining()
+        if threshold <= 0 or remaining >= threshold:
+            return max_tokens
+        
+        min_tokens = getattr(config, "LATENCY_MIN_MAX_TOKENS", 40)
+        scaled = int(max_tokens * remaining / threshold)
+        return min(max_tokens, max(min_tokens, scaled))
+    
+    def _cache_response(self, command, response):
+        """
+        Remember a response for use when a later turn runs out of budget.
+        
+        Args:
+            command (str): The voice command
+            response (str): The AI response
+        """
+        cache_size = getattr(config, "AI_RESPONSE_CACHE_SIZE", 64)
+        if cache_size <= 0:
+            return
+        
+        key = command.lower().strip()
+        self.response_cache[key] = response
+        self.response_cache.move_to_end(key)
+        while len(self.response_cache) > cache_size:
+            self.response_cache.popitem(last=False)
+    
+    def _degraded_response(self, command, reason="latency budget exhausted"):
+        """
+        Answer without calling the AI service: cached answer or local fallback.
+        
+        Args:
+            command (str): The voice command
+            reason (str): Why the AI service is skipped, for the log
+            
+        Returns:
+            str: Cached or fallback response
+        """
+        key = command.lower().strip()
+        if key in self.response_cache:
+            logger.info(f"Using cached response ({reason})")
+            self.last_turn_info.update(backend="cache", cache_hit=True)
+            self.response_cache.move_to_end(key)
+            return self.response_cache[key]
+        
+        logger.info(f"Using fallback response ({reason})")
+        self.last_turn_info["backend"] = "fallback"
+        return self._fallback_response(command)
+    
     def _get_system_prompt(self):
-        """Get the system prompt for the AI."""
+        """Get the system prompt for the AI (config.SYSTEM_PROMPT overrides the default)."""
+        custom_prompt = getattr(config, "SYSTEM_PROMPT", None)
+        if custom_prompt:
+            return custom_prompt
+        
         return """You are Wakeon, a helpful voice assistant. You should:
 1. Provide concise, helpful responses suitable for voice output
 2. Keep responses under 100 words when possible
@@ -140,6 +447,16 @@ class AIProcessor:
     
     def cleanup(self):
         """Clean up resources."""
+        if self.breaker is not None:
+            self.breaker.log_summary()
+        if self.scheduler is not None:
+            self.scheduler.log_summary()
+            self.scheduler.cleanup()
+        if self.backend is not None:
+            self.backend.cleanup()
+        if self.secondary_scheduler is not None:
+            self.secondary_scheduler.cleanup()
+            self.secondary_backend.cleanup()
         logger.debug("AI processor cleaned up")
 
 
@@ -150,12 +467,15 @@ class SimpleAIProcessor:
         """Initialize simple AI processor."""
         logger.info("Initializing simple AI processor (for testing)")
     
-    def process_command(self, command):
+    def process_command(self, command, budget=None, on_token=None, priority=None):
         """
         Simulate AI processing.
         
         Args:
             command (str): The voice command
+            budget (LatencyBudget): Ignored
+            on_token (callable): Ignored
+            priority (int): Ignored
             
         Returns:
             str: Simulated response
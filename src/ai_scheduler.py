@@ -0,0 +1,373 @@
+"""
+Rate-limit-aware scheduler in front of the AI backend
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import config
+from src import metrics
+from src.ai_backends import BackendRateLimitError, BackendTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class TokenBucket:
+    """Continuously refilled bucket for a per-minute limit."""
+    
+    def __init__(self, per_minute):
+        """
+        Initialize the bucket full.
+        
+        Args:
+            per_minute (float): Limit per minute
+        """
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self, now):
+        """Add what has accrued since the last update."""
+        rate = self.capacity / 60.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+    
+    def wait_time(self, amount):
+        """
+        Get how long until ``amount`` is available.
+        
+        Args:
+            amount (float): Units needed
+        
+        Returns:
+            float: Seconds to wait, 0 if available now
+        """
+        now = time.monotonic()
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+    
+    def consume(self, amount):
+        """
+        Take units from the bucket.
+        
+        Args:
+            amount (float): Units used
+        """
+        self.level -= min(amount, self.capacity)
+    
+    def sync(self, limit=None, remaining=None, reset_seconds=None):
+        """
+        Correct the bucket from the server's rate-limit headers.
+        
+        Args:
+            limit (float): Limit per minute reported by the server
+            remaining (float): Units the server says are left
+            reset_seconds (float): Seconds until the server refills completely
+        """
+        self._refill(time.monotonic())
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.capacity, float(remaining))
+            if remaining <= 0 and reset_seconds:
+                # Nothing left until the window resets
+                self.level = -self.capacity / 60.0 * reset_seconds
+
+
+class _Job:
+    """A queued request and the future its callers wait on."""
+    
+    def __init__(self, key, messages, max_tokens, deadline, on_token, tokens, priority):
+        self.key = key
+        self.priority = priority
+        self.dispatched = False
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.deadline = deadline
+        self.on_token = on_token
+        self.tokens = tokens
+        self.future = Future()
+        self.retries = 0
+        self.queued_at = time.monotonic()
+
+
+class AIRequestScheduler:
+    """
+    Queues AI requests, coalesces identical ones and respects rate limits.
+    
+    Requests with the same messages that are already queued or running share
+    one upstream call. A request and a token bucket, both per
+    minute and kept in sync with the server's rate-limit headers, decide when
+    the next request may go out. Interactive requests are served before
+    background ones, and rate-limited requests are queued again instead of
+    failing straight away.
+    """
+    
+    def __init__(self, backend, workers=None):
+        """
+        Initialize the scheduler and start its worker threads.
+        
+        Args:
+            backend (AIBackend): Backend that performs the requests
+            workers (int): Number of concurrent upstream requests
+        """
+        self.backend = backend
+        self.requests = TokenBucket(getattr(config, "AI_REQUESTS_PER_MINUTE", 60))
+        self.tokens = TokenBucket(getattr(config, "AI_TOKENS_PER_MINUTE", 40000))
+        self.default_timeout = getattr(config, "AI_REQUEST_TIMEOUT", 15.0)
+        self.max_retries = getattr(config, "AI_SCHEDULER_MAX_RETRIES", 3)
+        
+        self.queue = []
+        self.inflight = {}
+        self.coalesced = 0
+        self.retried = 0
+        self.queue_wait = metrics.get_stats("ai.queue_wait")
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._running = True
+        
+        if workers is None:
+            workers = getattr(config, "AI_SCHEDULER_WORKERS", 2)
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"ai-scheduler-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+    
+    def submit(self, messages, max_tokens, timeout=None, priority=PRIORITY_INTERACTIVE, on_token=None):
+        """
+        Queue a request, or join an identical one already in flight.
+        
+        Args:
+            messages (list): Chat messages
+            max_tokens (int): Maximum number of tokens to generate
+            timeout (float): Seconds until the caller gives up, queueing
+                included; None uses AI_REQUEST_TIMEOUT
+            priority (int): PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND
+            on_token (callable): Streaming callback; only the first caller
+                of a coalesced request receives tokens
+        
+        Returns:
+            concurrent.futures.Future: Resolves to a BackendResponse
+        """
+        # max_tokens follows each caller's remaining budget, so it is left out
+        # of the key; a shared job generates as much as its callers allow
+        key = json.dumps(messages, sort_keys=True)
+        if timeout is None:
+            timeout = self.default_timeout
+        deadline = time.monotonic() + timeout
+        
+        with self._cond:
+            job = self.inflight.get(key)
+            if job is not None:
+                self.coalesced += 1
+                # A shared job must live as long as its most patient caller
+                # and be served as early as its most urgent one
+                job.deadline = max(job.deadline, deadline)
+                if not job.dispatched and max_tokens > job.max_tokens:
+                    job.tokens += max_tokens - job.max_tokens
+                    job.max_tokens = max_tokens
+                if priority < job.priority and not job.dispatched:
+                    job.priority = priority
+                    self._push(job)
+                logger.debug("Coalesced identical AI request")
+                return job.future
+            
+            prompt_chars = sum(len(m.get("content", "")) for m in messages)
+            job = _Job(key, messages, max_tokens, deadline, on_token,
+                       prompt_chars / 4 + max_tokens, priority)
+            self.inflight[key] = job
+            self._push(job)
+            return job.future
+    
+    def complete(self, messages, max_tokens, timeout=None, priority=PRIORITY_INTERACTIVE, on_token=None):
+        """
+        Submit a request and wait for it; same contract as AIBackend.complete.
+        
+        Returns:
+            BackendResponse: The response
+        
+        Raises:
+            BackendError: If the request fails or runs past its deadline
+        """
+        if timeout is None:
+            timeout = self.default_timeout
+        future = self.submit(messages, max_tokens, timeout, priority, on_token)
+        
+        # A coalesced job may run until a more patient caller's deadline;
+        # this caller only waits until its own
+        try:
+            return future.result(timeout=max(0.0, timeout))
+        except FutureTimeoutError:
+            raise BackendTimeoutError("AI request ran past the caller's deadline") from None
+    
+    def _push(self, job):
+        """Add a job to the priority queue (caller holds the lock)."""
+        heapq.heappush(self.queue, (job.priority, next(self._counter), job))
+        self._cond.notify()
+    
+    def _next_job(self):
+        """
+        Wait until the head of the queue may be sent, then take it.
+        
+        Returns:
+            _Job: The job to send, or None when shutting down
+        """
+        with self._cond:
+            while self._running:
+                if not self.queue:
+                    self._cond.wait()
+                    continue
+                
+                priority, _, job = self.queue[0]
+                if job.dispatched or priority != job.priority:
+                    # Stale entry left behind by a priority bump
+                    heapq.heappop(self.queue)
+                    continue
+                
+                if time.monotonic() >= job.deadline:
+                    heapq.heappop(self.queue)
+                    self._finish(job, error=BackendTimeoutError("AI request expired in queue"))
+                    continue
+                
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(job.tokens))
+                if wait > 0:
+                    # Woken early if a more urgent request arrives
+                    self._cond.wait(min(wait, job.deadline - time.monotonic()))
+                    continue
+                
+                heapq.heappop(self.queue)
+                job.dispatched = True
+                self.requests.consume(1)
+                self.tokens.consume(job.tokens)
+                return job
+        return None
+    
+    def _worker(self):
+        """Send queued requests upstream."""
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self.queue_wait.record(time.monotonic() - job.queued_at)
+            
+            # The deadline can pass between dequeueing and dispatch; a zero
+            # timeout would be rejected by the HTTP client
+            timeout = job.deadline - time.monotonic()
+            if timeout <= 0:
+                self._finish(job, error=BackendTimeoutError("AI request expired before dispatch"))
+                continue
+            
+            try:
+                response = self.backend.complete(
+                    job.messages,
+                    max_tokens=job.max_tokens,
+                    timeout=timeout,
+                    on_token=job.on_token
+                )
+            except BackendRateLimitError as e:
+                self._handle_rate_limit(job, e)
+                continue
+            except Exception as e:
+                self._finish(job, error=e)
+                continue
+            
+            self._sync_limits(response.headers)
+            self._finish(job, response=response)
+    
+    def _handle_rate_limit(self, job, error):
+        """Back off and queue a rate-limited job again while it has time left."""
+        self._sync_limits(error.headers)
+        with self._cond:
+            if error.retry_after:
+                self.requests.sync(remaining=0, reset_seconds=error.retry_after)
+            elif not error.headers:
+                self.requests.sync(remaining=0, reset_seconds=1.0)
+            
+            if job.retries >= self.max_retries or time.monotonic() >= job.deadline:
+                self._finish(job, error=error)
+                return
+            
+            job.retries += 1
+            job.dispatched = False
+            self.retried += 1
+            logger.info(f"AI request rate limited; queued again (retry {job.retries})")
+            self._push(job)
+    
+    def _sync_limits(self, headers):
+        """Update both buckets from x-ratelimit-* response headers."""
+        if not headers:
+            return
+        with self._cond:
+            for name, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                limit = _parse_number(headers.get(f"x-ratelimit-limit-{name}"))
+                remaining = _parse_number(headers.get(f"x-ratelimit-remaining-{name}"))
+                reset = _parse_duration(headers.get(f"x-ratelimit-reset-{name}"))
+                if limit is not None or remaining is not None:
+                    bucket.sync(limit, remaining, reset)
+    
+    def _finish(self, job, response=None, error=None):
+        """Resolve a job's future for every caller waiting on it."""
+        with self._cond:
+            if self.inflight.get(job.key) is job:
+                del self.inflight[job.key]
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(response)
+    
+    def log_summary(self):
+        """Log coalescing and retry counts."""
+        logger.info(f"AI scheduler: {self.coalesced} coalesced requests, {self.retried} rate-limit retries")
+    
+    def cleanup(self):
+        """Stop the worker threads and fail anything still queued."""
+        with self._cond:
+            self._running = False
+            pending = {job.key: job for _, _, job in self.queue if not job.dispatched}.values()
+            self.queue = []
+            self._cond.notify_all()
+        for job in pending:
+            self._finish(job, error=BackendTimeoutError("AI scheduler stopped"))
+
+
+def _parse_number(value):
+    """Parse a numeric header value, or return None."""
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _parse_duration(value):
+    """
+    Parse a reset header such as "1s", "6m0s" or "20ms" into seconds.
+    
+    Args:
+        value (str): Header value
+    
+    Returns:
+        float: Seconds, or None if the value is missing or malformed
+    """
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return _parse_number(value)
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
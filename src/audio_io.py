@@ -0,0 +1,524 @@
+"""
+Pluggable audio I/O and clock, so the pipeline can run without a sound card
+
+Components never call sounddevice or pvrecorder directly; they go through
+get_audio_backend(), and through get_clock() for time and sleeping. The
+defaults use the real devices and wall-clock time. Installing a
+FakeAudioBackend and a VirtualClock instead runs the same code on audio
+from WAV files or generators, captures everything that is played, and
+advances time only as audio is consumed, so whole sessions run
+deterministically and many times faster than real time.
+"""
+
+import logging
+import threading
+import time
+import wave
+from collections import namedtuple
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import sounddevice as sd
+    SOUNDDEVICE_AVAILABLE = True
+except (ImportError, OSError):
+    # OSError: the module is installed but the PortAudio library is missing
+    SOUNDDEVICE_AVAILABLE = False
+
+try:
+    import pvrecorder
+    PVRECORDER_AVAILABLE = True
+except ImportError:
+    PVRECORDER_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# One captured playback on a FakeAudioBackend
+Playback = namedtuple("Playback", ["started_at", "audio", "sample_rate"])
+
+
+class SystemClock:
+    """Wall-clock time."""
+    
+    def time(self):
+        """Seconds since the epoch."""
+        return time.time()
+    
+    def monotonic(self):
+        """Monotonic seconds, for measuring intervals."""
+        return time.monotonic()
+    
+    def sleep(self, seconds):
+        """Block for the given number of seconds."""
+        time.sleep(seconds)
+
+
+class VirtualClock:
+    """
+    Simulated time that only moves when advanced.
+    
+    sleep() returns at once after advancing the clock, and a
+    FakeAudioBackend advances it by the duration of the audio it delivers
+    or plays.
+    """
+    
+    def __init__(self, start=None):
+        """
+        Initialize the clock.
+        
+        Args:
+            start (float): Epoch time the clock starts at; defaults to now
+        """
+        self._start = time.time() if start is None else start
+        self._elapsed = 0.0
+        self._lock = threading.Lock()
+    
+    def time(self):
+        """Simulated seconds since the epoch."""
+        return self._start + self._elapsed
+    
+    def monotonic(self):
+        """Simulated seconds since the clock was created."""
+        return self._elapsed
+    
+    def sleep(self, seconds):
+        """Advance the clock instead of blocking."""
+        self.advance(seconds)
+    
+    def advance(self, seconds):
+        """
+        Move the clock forward.
+        
+        Args:
+            seconds (float): Simulated seconds to add
+        """
+        if seconds > 0:
+            with self._lock:
+                self._elapsed += seconds
+
+
+_clock = SystemClock()
+_backend = None
+
+
+def get_clock():
+    """
+    Get the clock used by the pipeline.
+    
+    Returns:
+        SystemClock or VirtualClock: The active clock
+    """
+    return _clock
+
+
+def set_clock(clock):
+    """
+    Replace the clock used by the pipeline.
+    
+    Args:
+        clock (SystemClock or VirtualClock): New clock, or None for wall-clock time
+    """
+    global _clock
+    _clock = clock if clock is not None else SystemClock()
+
+
+def get_audio_backend():
+    """
+    Get the audio backend used by the pipeline, creating the default one.
+    
+    Returns:
+        AudioBackend: The active backend
+    """
+    global _backend
+    if _backend is None:
+        _backend = SoundDeviceBackend()
+    return _backend
+
+
+def set_audio_backend(backend):
+    """
+    Replace the audio backend used by the pipeline.
+    
+    Set it before the components are created; they open their streams
+    when they start.
+    
+    Args:
+        backend (AudioBackend): New backend, or None for the sound card
+    """
+    global _backend
+    _backend = backend
+
+
+def read_wav(path):
+    """
+    Read a 16-bit mono WAV file.
+    
+    Args:
+        path (str): WAV file path
+    
+    Returns:
+        tuple: (numpy.ndarray of int16 samples, sample rate)
+    """
+    with wave.open(path, "rb") as wav:
+        if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16-bit mono audio")
+        audio = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        return audio, wav.getframerate()
+
+
+class AudioBackend:
+    """Base class for audio input and output."""
+    
+    name = "base"
+    
+    # True when audio is simulated and the clock should be virtual
+    virtual = False
+    
+    @property
+    def available(self):
+        """Whether the backend can be used on this host."""
+        return True
+    
+    def open_input(self, frame_length, sample_rate):
+        """
+        Open a frame-by-frame input stream (the PvRecorder interface).
+        
+        Args:
+            frame_length (int): Samples returned by each read()
+            sample_rate (int): Sample rate the caller expects
+        
+        Returns:
+            object: Stream with start(), read(), stop() and delete()
+        """
+        raise NotImplementedError
+    
+    def open_stream(self, frame_length, sample_rate, channels):
+        """
+        Open a frame-by-frame multi-channel input stream, e.g. for a microphone array.
+        
+        Args:
+            frame_length (int): Samples per channel returned by each read()
+            sample_rate (int): Sample rate in Hz
+            channels (int): Number of channels
+        
+        Returns:
+            object: Stream with start(), stop() and delete(), and read()
+                returning an int16 array of shape (frame_length, channels)
+        """
+        raise NotImplementedError
+    
+    def native_sample_rate(self):
+        """
+        Get the rate the input device captures at without resampling.
+        
+        Returns:
+            int: Sample rate in Hz, or None if unknown
+        """
+        return None
+    
+    def record(self, num_samples, sample_rate, channels=1):
+        """
+        Record a fixed amount of audio, blocking until it is complete.
+        
+        Args:
+            num_samples (int): Number of samples per channel
+            sample_rate (int): Sample rate in Hz
+            channels (int): Number of channels
+        
+        Returns:
+            numpy.ndarray: int16 array of shape (num_samples, channels); it
+                may be reused by the next call, so copy it to keep it
+        """
+        raise NotImplementedError
+    
+    def play(self, audio, sample_rate):
+        """
+        Play audio, blocking until it has finished.
+        
+        Args:
+            audio (numpy.ndarray): Samples to play
+            sample_rate (int): Sample rate in Hz
+        """
+        raise NotImplementedError
+    
+    def stop(self):
+        """Stop any playback in progress."""
+    
+    def query_devices(self):
+        """
+        Get the audio devices of the backend.
+        
+        Returns:
+            object: Device list
+        """
+        return []
+
+
+class _SoundDeviceRecorder:
+    """PvRecorder-style stream over a sounddevice input stream, for any number of channels."""
+    
+    def __init__(self, frame_length, sample_rate, channels):
+        self.frame_length = frame_length
+        self.is_recording = False
+        self._stream = sd.InputStream(
+            samplerate=sample_rate, channels=channels, dtype="int16", blocksize=frame_length
+        )
+    
+    def start(self):
+        if not self.is_recording:
+            self._stream.start()
+            self.is_recording = True
+    
+    def read(self):
+        audio, overflowed = self._stream.read(self.frame_length)
+        if overflowed:
+            logger.debug("Input stream overflowed; samples were dropped")
+        return audio
+    
+    def stop(self):
+        if self.is_recording:
+            self._stream.stop()
+            self.is_recording = False
+    
+    def delete(self):
+        self.stop()
+        self._stream.close()
+
+
+class SoundDeviceBackend(AudioBackend):
+    """The sound card, through sounddevice and pvrecorder."""
+    
+    name = "sounddevice"
+    
+    def __init__(self):
+        # Recording buffer reused across turns instead of allocated for each one
+        self._record_buffer = None
+    
+    @property
+    def available(self):
+        return SOUNDDEVICE_AVAILABLE
+    
+    def open_input(self, frame_length, sample_rate):
+        if not PVRECORDER_AVAILABLE:
+            raise ImportError("pvrecorder not available. Install with: pip install pvrecorder")
+        # PvRecorder always captures at 16 kHz, the rate Porcupine expects
+        return pvrecorder.PvRecorder(device_index=-1, frame_length=frame_length)
+    
+    def open_stream(self, frame_length, sample_rate, channels):
+        if not SOUNDDEVICE_AVAILABLE:
+            raise ImportError("sounddevice not available. Install with: pip install sounddevice")
+        return _SoundDeviceRecorder(frame_length, sample_rate, channels)
+    
+    def native_sample_rate(self):
+        if not SOUNDDEVICE_AVAILABLE:
+            return None
+        try:
+            return int(sd.query_devices(kind="input")["default_samplerate"])
+        except Exception as e:
+            logger.debug(f"Could not query the input device's sample rate: {e}")
+            return None
+    
+    def record(self, num_samples, sample_rate, channels=1):
+        if not SOUNDDEVICE_AVAILABLE:
+            raise ImportError("sounddevice not available. Install with: pip install sounddevice")
+        if self._record_buffer is None or self._record_buffer.shape != (num_samples, channels):
+            self._record_buffer = np.empty((num_samples, channels), dtype=np.int16)
+        sd.rec(samplerate=sample_rate, out=self._record_buffer)
+        sd.wait()
+        return self._record_buffer
+    
+    def play(self, audio, sample_rate):
+        if not SOUNDDEVICE_AVAILABLE:
+            raise ImportError("sounddevice not available. Install with: pip install sounddevice")
+        sd.play(audio, sample_rate)
+        sd.wait()
+    
+    def stop(self):
+        if SOUNDDEVICE_AVAILABLE:
+            sd.stop()
+    
+    def query_devices(self):
+        if not SOUNDDEVICE_AVAILABLE:
+            return []
+        return sd.query_devices()
+
+
+class WavFileSource:
+    """Input audio read from WAV files, one after another."""
+    
+    def __init__(self, paths, gap_seconds=0.5):
+        """
+        Initialize the source.
+        
+        Args:
+            paths (list): 16-bit mono WAV files, all at the same sample rate
+            gap_seconds (float): Silence inserted after each file
+        """
+        if not paths:
+            raise ValueError("WavFileSource needs at least one file")
+        self.paths = list(paths)
+        self.gap_seconds = gap_seconds
+        _, self.sample_rate = read_wav(self.paths[0])
+    
+    def __iter__(self):
+        for path in self.paths:
+            audio, sample_rate = read_wav(path)
+            if sample_rate != self.sample_rate:
+                raise ValueError(f"{path}: sample rate {sample_rate} differs from {self.sample_rate}")
+            logger.debug(f"Audio input: {path}")
+            yield audio
+            yield np.zeros(int(self.gap_seconds * self.sample_rate), dtype=np.int16)
+
+
+class GeneratorSource:
+    """Input audio produced by any iterable of sample chunks."""
+    
+    def __init__(self, chunks, sample_rate=16000):
+        """
+        Initialize the source.
+        
+        Args:
+            chunks (iterable): int16 arrays (or sequences) of any length
+            sample_rate (int): Sample rate of the chunks
+        """
+        self.chunks = chunks
+        self.sample_rate = sample_rate
+    
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield np.asarray(chunk, dtype=np.int16)
+
+
+class _FakeRecorder:
+    """PvRecorder stand-in reading from a FakeAudioBackend."""
+    
+    def __init__(self, backend, frame_length, channels=None):
+        self.backend = backend
+        self.frame_length = frame_length
+        self.channels = channels
+        self.is_recording = False
+    
+    def start(self):
+        self.is_recording = True
+    
+    def read(self):
+        audio = self.backend.take(self.frame_length)
+        if self.channels is None:
+            return audio.tolist()
+        # The source is mono: every channel hears the same signal
+        return np.repeat(audio[:, np.newaxis], self.channels, axis=1)
+    
+    def stop(self):
+        self.is_recording = False
+    
+    def delete(self):
+        self.is_recording = False
+
+
+class FakeAudioBackend(AudioBackend):
+    """
+    Hardware-free backend: input from a source, output into a list.
+    
+    Input is one continuous stream shared by every reader, like a single
+    microphone. Once the source runs out, reads return silence and
+    on_exhausted is called once, which is how a simulated session ends.
+    """
+    
+    name = "fake"
+    virtual = True
+    
+    def __init__(self, source, clock=None, on_exhausted=None):
+        """
+        Initialize the backend.
+        
+        Args:
+            source (WavFileSource or GeneratorSource): Input audio
+            clock (VirtualClock): Clock advanced by the audio read and played;
+                defaults to the active clock
+            on_exhausted (callable): Called when the input runs out
+        """
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy not available. Install with: pip install numpy")
+        self.source = source
+        self.sample_rate = source.sample_rate
+        self.clock = clock
+        self.on_exhausted = on_exhausted
+        self.exhausted = False
+        self.samples_read = 0
+        self.played = []
+        
+        self._chunks = iter(source)
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._lock = threading.Lock()
+    
+    def _clock(self):
+        return self.clock if self.clock is not None else get_clock()
+    
+    def take(self, num_samples):
+        """
+        Take the next samples from the input stream.
+        
+        Args:
+            num_samples (int): Number of samples
+        
+        Returns:
+            numpy.ndarray: int16 samples, padded with silence past the end
+        """
+        notify = False
+        with self._lock:
+            parts, have = [self._pending], len(self._pending)
+            while have < num_samples and not self.exhausted:
+                try:
+                    chunk = next(self._chunks)
+                except StopIteration:
+                    self.exhausted = True
+                    notify = True
+                    break
+                parts.append(chunk)
+                have += len(chunk)
+            
+            audio = np.concatenate(parts)
+            if len(audio) < num_samples:
+                audio = np.concatenate([audio, np.zeros(num_samples - len(audio), dtype=np.int16)])
+            audio, self._pending = audio[:num_samples], audio[num_samples:]
+            self.samples_read += num_samples
+        
+        self._clock().advance(num_samples / self.sample_rate)
+        if notify:
+            logger.info("Audio input exhausted")
+            if self.on_exhausted is not None:
+                self.on_exhausted()
+        return audio
+    
+    def _check_rate(self, sample_rate):
+        if sample_rate != self.sample_rate:
+            raise ValueError(f"Input is {self.sample_rate} Hz but {sample_rate} Hz was requested")
+    
+    def open_input(self, frame_length, sample_rate):
+        self._check_rate(sample_rate)
+        return _FakeRecorder(self, frame_length)
+    
+    def open_stream(self, frame_length, sample_rate, channels):
+        self._check_rate(sample_rate)
+        return _FakeRecorder(self, frame_length, channels)
+    
+    def native_sample_rate(self):
+        return self.sample_rate
+    
+    def record(self, num_samples, sample_rate, channels=1):
+        self._check_rate(sample_rate)
+        audio = self.take(num_samples)
+        return np.repeat(audio[:, np.newaxis], channels, axis=1)
+    
+    def play(self, audio, sample_rate):
+        audio = np.asarray(audio)
+        self.played.append(Playback(self._clock().time(), audio.copy(), sample_rate))
+        self._clock().advance(len(audio) / sample_rate)
+    
+    def query_devices(self):
+        return [{"name": "fake input/output", "max_input_channels": 1, "max_output_channels": 1}]
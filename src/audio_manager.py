@@ -5,18 +5,20 @@ Audio Manager for handling audio playback and system sounds
 import logging
 import os
 import config
+from src.audio_io import get_audio_backend
 
 # Try to import optional dependencies
 try:
     import wave
     import numpy as np
-    import sounddevice as sd
     AUDIO_AVAILABLE = True
 except ImportError:
     AUDIO_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+EARCON_SAMPLE_RATE = 44100
+
 
 class AudioManager:
     """Manages audio playback and system sounds."""
@@ -25,7 +27,7 @@ class AudioManager:
         """Initialize the audio manager."""
         logger.info("Initializing audio manager...")
         
-        if not AUDIO_AVAILABLE:
+        if not AUDIO_AVAILABLE or not get_audio_backend().available:
             logger.warning("Audio libraries not available. Using simple audio manager.")
             raise ImportError("Audio libraries not available. Install with: pip install sounddevice numpy")
         
@@ -46,17 +48,10 @@ class AudioManager:
         """Play a sound when wake word is detected."""
         try:
             # Generate a simple beep sound
-            sample_rate = 44100
-            duration = 0.3  # seconds
-            frequency = 800  # Hz
-            
-            # Generate sine wave
-            t = np.linspace(0, duration, int(sample_rate * duration), False)
-            audio = np.sin(2 * np.pi * frequency * t) * 0.3
+            audio = self._make_tone(800, 0.3)
             
             # Play the sound
-            sd.play(audio, sample_rate)
-            sd.wait()
+            get_audio_backend().play(audio, EARCON_SAMPLE_RATE)
             
             logger.debug("Activation sound played")
             
@@ -67,17 +62,10 @@ class AudioManager:
         """Play a sound when an error occurs."""
         try:
             # Generate a simple error beep
-            sample_rate = 44100
-            duration = 0.2  # seconds
-            frequency = 400  # Hz
-            
-            # Generate sine wave
-            t = np.linspace(0, duration, int(sample_rate * duration), False)
-            audio = np.sin(2 * np.pi * frequency * t) * 0.3
+            audio = self._make_tone(400, 0.2)
             
             # Play the sound
-            sd.play(audio, sample_rate)
-            sd.wait()
+            get_audio_backend().play(audio, EARCON_SAMPLE_RATE)
             
             logger.debug("Error sound played")
             
@@ -88,23 +76,30 @@ class AudioManager:
         """Play a sound when a command is successful."""
         try:
             # Generate a simple success chime
-            sample_rate = 44100
-            duration = 0.2  # seconds
-            frequency = 1000  # Hz
-            
-            # Generate sine wave
-            t = np.linspace(0, duration, int(sample_rate * duration), False)
-            audio = np.sin(2 * np.pi * frequency * t) * 0.3
+            audio = self._make_tone(1000, 0.2)
             
             # Play the sound
-            sd.play(audio, sample_rate)
-            sd.wait()
+            get_audio_backend().play(audio, EARCON_SAMPLE_RATE)
             
             logger.debug("Success sound played")
             
         except Exception as e:
             logger.error(f"Error playing success sound: {e}")
     
+    def _make_tone(self, frequency, duration):
+        """
+        Generate a sine tone for system sounds.
+        
+        Args:
+            frequency (float): Tone frequency in Hz
+            duration (float): Length in seconds
+            
+        Returns:
+            numpy.ndarray: Tone samples at EARCON_SAMPLE_RATE
+        """
+        t = np.linspace(0, duration, int(EARCON_SAMPLE_RATE * duration), False)
+        return np.sin(2 * np.pi * frequency * t) * 0.3
+    
     def save_audio(self, audio_data, filename, sample_rate=16000):
         """
         Save audio data to a WAV file.
@@ -145,7 +140,7 @@ class AudioManager:
             dict: Dictionary of audio devices
         """
         try:
-            devices = sd.query_devices()
+            devices = get_audio_backend().query_devices()
             return devices
         except Exception as e:
             logger.error(f"Error getting audio devices: {e}")
@@ -168,7 +163,7 @@ class AudioManager:
         """Clean up audio resources."""
         try:
             # Stop any playing audio
-            sd.stop()
+            get_audio_backend().stop()
             logger.debug("Audio manager cleaned up")
         except Exception as e:
             logger.error(f"Error cleaning up audio manager: {e}")
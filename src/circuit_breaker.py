@@ -0,0 +1,174 @@
+"""
+Circuit breaker that stops sending turns to a failing or slow AI backend
+"""
+
+import logging
+import threading
+from collections import deque
+
+import config
+from src.audio_io import get_clock
+from src.metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Tracks the rolling error rate and latency of a backend and trips when either is bad.
+    
+    Closed: requests go through and their outcome is recorded. Open: requests
+    are refused so callers answer locally at once. After AI_BREAKER_OPEN_SECONDS
+    the breaker is half-open and lets exactly one probe through; a fast
+    success closes it, anything else opens it again for twice as long (up to
+    AI_BREAKER_MAX_OPEN_SECONDS).
+    """
+    
+    def __init__(self, name, window=None, min_samples=None, error_rate=None,
+                 latency_p95=None, open_seconds=None, max_open_seconds=None):
+        """
+        Initialize the circuit breaker.
+        
+        Args:
+            name (str): Name used in logs
+            window (int): Number of recent requests considered
+            min_samples (int): Requests needed in the window before tripping
+            error_rate (float): Failure share that trips the breaker
+            latency_p95 (float): 95th percentile latency in seconds that trips it
+            open_seconds (float): Time to stay open before the first probe
+            max_open_seconds (float): Longest time to stay open after failed probes
+        """
+        self.name = name
+        self.window = window or getattr(config, "AI_BREAKER_WINDOW", 20)
+        self.min_samples = min_samples or getattr(config, "AI_BREAKER_MIN_SAMPLES", 5)
+        self.error_rate_threshold = error_rate or getattr(config, "AI_BREAKER_ERROR_RATE", 0.5)
+        self.latency_threshold = latency_p95 or getattr(config, "AI_BREAKER_P95_SECONDS", 4.0)
+        self.base_open_seconds = open_seconds or getattr(config, "AI_BREAKER_OPEN_SECONDS", 30.0)
+        self.max_open_seconds = max_open_seconds or getattr(config, "AI_BREAKER_MAX_OPEN_SECONDS", 300.0)
+        
+        self.state = STATE_CLOSED
+        self.open_seconds = self.base_open_seconds
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.trips = 0
+        self.short_circuited = 0
+        
+        self._reset_window()
+        self._lock = threading.Lock()
+    
+    def _reset_window(self):
+        """Forget the outcomes recorded so far."""
+        self.outcomes = deque(maxlen=self.window)
+        self.latencies = LatencyStats(f"breaker.{self.name}", window=self.window)
+    
+    def allow_request(self):
+        """
+        Check whether a request may be sent to the backend.
+        
+        Returns:
+            bool: True if the request should go to the backend
+        """
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and get_clock().monotonic() - self.opened_at >= self.open_seconds:
+                self._set_state(STATE_HALF_OPEN)
+            self.short_circuited += 1
+            return False
+    
+    def try_probe(self):
+        """
+        Claim the single probe allowed while half-open.
+        
+        Returns:
+            bool: True if the caller should send a probe now
+        """
+        with self._lock:
+            if self.state == STATE_OPEN and get_clock().monotonic() - self.opened_at >= self.open_seconds:
+                self._set_state(STATE_HALF_OPEN)
+            if self.state != STATE_HALF_OPEN or self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+    
+    def record_success(self, latency, probe=False):
+        """
+        Record a completed request.
+        
+        Args:
+            latency (float): Seconds the request took
+            probe (bool): The request was the half-open probe
+        """
+        with self._lock:
+            if probe:
+                self.probe_in_flight = False
+                if latency < self.latency_threshold:
+                    self.open_seconds = self.base_open_seconds
+                    self._reset_window()
+                    self._set_state(STATE_CLOSED)
+                else:
+                    self._open(f"probe took {latency:.1f}s")
+                return
+            if self.state != STATE_CLOSED:
+                return
+            self.outcomes.append(True)
+            self.latencies.record(latency)
+            self._check()
+    
+    def record_failure(self, error=None, probe=False):
+        """
+        Record a failed request.
+        
+        Args:
+            error (Exception): The error, for the log
+            probe (bool): The request was the half-open probe
+        """
+        with self._lock:
+            if probe:
+                self.probe_in_flight = False
+                self._open(f"probe failed: {error}")
+                return
+            if self.state != STATE_CLOSED:
+                return
+            self.outcomes.append(False)
+            self._check()
+    
+    def _check(self):
+        """Trip the breaker if the window is bad enough (lock held)."""
+        if len(self.outcomes) < self.min_samples:
+            return
+        error_rate = self.outcomes.count(False) / len(self.outcomes)
+        if error_rate >= self.error_rate_threshold:
+            self._open(f"error rate {error_rate:.0%}")
+            return
+        p95 = self.latencies.percentile(95)
+        if p95 is not None and len(self.latencies.samples) >= self.min_samples and p95 >= self.latency_threshold:
+            self._open(f"p95 latency {p95:.1f}s")
+    
+    def _open(self, reason):
+        """Open the breaker (lock held)."""
+        if self.state == STATE_HALF_OPEN:
+            self.open_seconds = min(self.open_seconds * 2, self.max_open_seconds)
+        else:
+            self.trips += 1
+        self.opened_at = get_clock().monotonic()
+        logger.warning(f"Circuit breaker '{self.name}' open for {self.open_seconds:.0f}s: {reason}")
+        self._set_state(STATE_OPEN)
+    
+    def _set_state(self, state):
+        """Change state and log the transition (lock held)."""
+        if state != self.state:
+            logger.info(f"Circuit breaker '{self.name}': {self.state} -> {state}")
+            self.state = state
+    
+    def log_summary(self):
+        """Log how often the breaker tripped and how many requests it refused."""
+        if self.trips:
+            logger.info(
+                f"Circuit breaker '{self.name}': {self.trips} trips, "
+                f"{self.short_circuited} requests answered locally, now {self.state}"
+            )
@@ -0,0 +1,174 @@
+"""
+Configuration hot-reload: rebuild only the components whose settings changed
+"""
+
+import importlib
+import logging
+import os
+import threading
+from collections import namedtuple
+
+import config
+
+# Try to import optional dependencies
+try:
+    from dotenv import load_dotenv
+    DOTENV_AVAILABLE = True
+except ImportError:
+    DOTENV_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Settings read once when a component is built; changing any of them means
+# building a new instance. Settings not listed here are read on every use
+# and take effect as soon as the config is reloaded.
+COMPONENT_SETTINGS = {
+    "wake_word_detector": {
+        "WAKE_WORD", "WAKE_ENGINE", "PORCUPINE_ACCESS_KEY", "PORCUPINE_KEYWORD_PATH", "PORCUPINE_SENSITIVITIES",
+        "WAKE_BUFFER_SECONDS",
+        "LANGUAGE_MODELS",
+    },
+    "speech_recognizer": {
+        "VOSK_MODEL_PATH", "SAMPLE_RATE", "MODEL_SERVER_SOCKET",
+        "LANGUAGE_MODELS", "DEFAULT_LANGUAGE", "MODEL_MEMORY_BUDGET_MB", "MODEL_PRELOAD",
+        "SMALL_FOOTPRINT",
+    },
+    "ai_processor": {
+        "AI_BACKEND", "OPENAI_API_KEY", "OPENAI_BASE_URL", "SYSTEM_PROMPT", "AI_WARMUP",
+        "LOCAL_LLM_URL", "LOCAL_LLM_MODEL", "LOCAL_LLM_SLOT",
+        "AI_REQUESTS_PER_MINUTE", "AI_TOKENS_PER_MINUTE", "AI_REQUEST_TIMEOUT",
+        "AI_SCHEDULER_WORKERS", "AI_SCHEDULER_MAX_RETRIES",
+        "AI_BREAKER_ENABLED", "AI_BREAKER_WINDOW", "AI_BREAKER_MIN_SAMPLES", "AI_BREAKER_ERROR_RATE",
+        "AI_BREAKER_P95_SECONDS", "AI_BREAKER_OPEN_SECONDS", "AI_BREAKER_MAX_OPEN_SECONDS",
+        "AI_FALLBACK_BACKEND",
+    },
+    "tts": {"TTS_ENGINE", "PIPER_MODEL_PATH"},
+}
+
+# A batch of reloaded settings and the components rebuilt for them
+ConfigChange = namedtuple("ConfigChange", ["changed_keys", "components"])
+
+
+def config_snapshot():
+    """
+    Get the current settings.
+    
+    Returns:
+        dict: Upper-case attributes of the config module
+    """
+    return {name: value for name, value in vars(config).items() if name.isupper()}
+
+
+class ConfigWatcher:
+    """
+    Watches .env and config.py and prepares changed components in the background.
+    
+    New components are built on the watcher thread while the old ones keep
+    serving. The assistant picks them up with take_pending() between turns,
+    so a swap never happens in the middle of an interaction.
+    """
+    
+    def __init__(self, factories, env_path=".env", interval=None, on_ready=None):
+        """
+        Initialize the watcher.
+        
+        Args:
+            factories (dict): Component name to a callable building a new instance
+            env_path (str): The .env file; config.py is watched as well
+            interval (float): Seconds between checks
+            on_ready (callable): Called when a change is ready to be applied
+        """
+        self.factories = factories
+        self.env_path = env_path
+        self.paths = [env_path, getattr(config, "__file__", "config.py")]
+        if interval is None:
+            interval = getattr(config, "CONFIG_RELOAD_INTERVAL", 2.0)
+        self.interval = interval
+        self.on_ready = on_ready
+        
+        self.pending = []
+        self._mtimes = self._read_mtimes()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _read_mtimes(self):
+        """Get the modification time of each watched file (None if missing)."""
+        mtimes = {}
+        for path in self.paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+    
+    def start(self):
+        """Start watching in a background thread."""
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {', '.join(self.paths)} for configuration changes")
+    
+    def stop(self):
+        """Stop watching."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def _run(self):
+        """Polling loop."""
+        while not self._stop.wait(self.interval):
+            mtimes = self._read_mtimes()
+            if mtimes == self._mtimes:
+                continue
+            self._mtimes = mtimes
+            
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Failed to reload configuration: {e}")
+    
+    def reload(self):
+        """
+        Reload the configuration and build new components for changed settings.
+        
+        Returns:
+            ConfigChange: What changed, or None if no setting changed
+        """
+        before = config_snapshot()
+        if DOTENV_AVAILABLE:
+            load_dotenv(self.env_path, override=True)
+        importlib.reload(config)
+        after = config_snapshot()
+        
+        changed = {name for name in set(before) | set(after) if before.get(name) != after.get(name)}
+        if not changed:
+            return None
+        logger.info(f"Configuration changed: {', '.join(sorted(changed))}")
+        
+        components = {}
+        for name, settings in COMPONENT_SETTINGS.items():
+            if name not in self.factories or not (changed & settings):
+                continue
+            try:
+                logger.info(f"Rebuilding {name} in the background...")
+                components[name] = self.factories[name]()
+            except Exception as e:
+                logger.error(f"Could not rebuild {name}, keeping the current one: {e}")
+        
+        change = ConfigChange(changed, components)
+        with self._lock:
+            self.pending.append(change)
+        if self.on_ready:
+            self.on_ready()
+        return change
+    
+    def take_pending(self):
+        """
+        Take all prepared changes.
+        
+        Returns:
+            list: ConfigChange entries in the order they were prepared
+        """
+        with self._lock:
+            pending, self.pending = self.pending, []
+        return pending
@@ -0,0 +1,404 @@
+"""
+SQLite interaction journal written in batches by a background thread
+
+Report on a journal with:
+
+    python -m src.interaction_journal report --since 2026-01-01
+    python -m src.interaction_journal search "weather"
+"""
+
+import argparse
+import json
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+import config
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    "wake_at", "command_at", "ai_done_at", "tts_done_at",
+    "transcript", "response", "backend", "cache_hit", "error", "budget_misses",
+    "asr_confidence", "asr_rejected", "ai_connection", "follow_up",
+)
+
+# Stage durations reported by the CLI: (name, start column, end column)
+STAGES = (
+    ("recognition", "wake_at", "command_at"),
+    ("ai", "command_at", "ai_done_at"),
+    ("tts", "ai_done_at", "tts_done_at"),
+    ("turn", "wake_at", "tts_done_at"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY,
+    wake_at REAL NOT NULL,
+    command_at REAL,
+    ai_done_at REAL,
+    tts_done_at REAL,
+    transcript TEXT,
+    response TEXT,
+    backend TEXT,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    budget_misses TEXT,
+    asr_confidence REAL,
+    asr_rejected TEXT,
+    ai_connection TEXT,
+    follow_up INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_wake_at ON interactions(wake_at);
+CREATE INDEX IF NOT EXISTS idx_interactions_backend ON interactions(backend, wake_at);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS interactions_fts USING fts5(
+    transcript, response, content='interactions', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS interactions_fts_insert AFTER INSERT ON interactions BEGIN
+    INSERT INTO interactions_fts(rowid, transcript, response)
+    VALUES (new.id, new.transcript, new.response);
+END;
+"""
+
+
+def connect(path):
+    """
+    Open a journal database, creating the schema if needed.
+    
+    Args:
+        path (str): Database file path
+    
+    Returns:
+        sqlite3.Connection: Connection in WAL mode
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    _add_missing_columns(conn)
+    try:
+        conn.executescript(FTS_SCHEMA)
+    except sqlite3.OperationalError:
+        logger.debug("SQLite built without FTS5; text search falls back to LIKE")
+    return conn
+
+
+def _add_missing_columns(conn):
+    """Add columns introduced after a journal was created."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(interactions)")}
+    added = (
+        ("asr_confidence", "REAL"), ("asr_rejected", "TEXT"), ("ai_connection", "TEXT"),
+        ("follow_up", "INTEGER NOT NULL DEFAULT 0"),
+    )
+    for column, kind in added:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE interactions ADD COLUMN {column} {kind}")
+    conn.commit()
+
+
+def has_fts(conn):
+    """Check whether the full-text index exists."""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='interactions_fts'"
+    ).fetchone()
+    return row is not None
+
+
+class InteractionJournal:
+    """
+    Records one row per interaction without blocking the assistant.
+    
+    record() only puts the row on a queue. A background thread writes rows
+    in batched transactions, so the hot path never waits on disk.
+    """
+    
+    def __init__(self, path=None):
+        """
+        Open the journal and start the writer thread.
+        
+        Args:
+            path (str): Database file path; defaults to config.JOURNAL_PATH
+        """
+        self.path = path or getattr(config, "JOURNAL_PATH", f"{config.LOGS_DIR}/interactions.db")
+        self.batch_size = getattr(config, "JOURNAL_BATCH_SIZE", 50)
+        self.flush_interval = getattr(config, "JOURNAL_FLUSH_INTERVAL", 1.0)
+        self.queue = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        
+        # Create the schema up front so errors surface at startup
+        connect(self.path).close()
+        
+        self._thread = threading.Thread(target=self._writer, name="journal-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"Interaction journal at {self.path}")
+    
+    def record(self, turn):
+        """
+        Queue one interaction for writing.
+        
+        Args:
+            turn (dict): Values for COLUMNS; missing ones are stored as NULL
+        """
+        turn = dict(turn, cache_hit=int(bool(turn.get("cache_hit"))), follow_up=int(bool(turn.get("follow_up"))))
+        row = tuple(turn.get(column) for column in COLUMNS)
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+    
+    def _writer(self):
+        """Write queued rows in batches until a None sentinel arrives."""
+        conn = connect(self.path)
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            if None in batch:
+                running = False
+                batch = [row for row in batch if row is not None]
+            if not batch:
+                continue
+            
+            try:
+                with conn:
+                    conn.executemany(
+                        f"INSERT INTO interactions ({', '.join(COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                        batch
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write {len(batch)} journal rows: {e}")
+        conn.close()
+    
+    def close(self):
+        """Flush queued rows and stop the writer thread."""
+        self.queue.put(None)
+        self._thread.join()
+        if self.dropped:
+            logger.warning(f"Interaction journal dropped {self.dropped} rows (queue full)")
+
+
+def _parse_time(value):
+    """Parse an ISO date or datetime into a Unix timestamp."""
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _percentile(conn, expression, where, params, count, percent):
+    """Nearest-rank percentile computed in SQL with ORDER BY / OFFSET."""
+    offset = min(count - 1, int(round(percent / 100.0 * (count - 1))))
+    row = conn.execute(
+        f"SELECT {expression} AS d FROM interactions WHERE {where} ORDER BY d LIMIT 1 OFFSET ?",
+        params + [offset]
+    ).fetchone()
+    return row[0]
+
+
+def report(conn, since=None, until=None):
+    """
+    Print latency and usage statistics for a time range.
+    
+    Args:
+        conn (sqlite3.Connection): Journal connection
+        since (float): Start of range as a Unix timestamp, or None
+        until (float): End of range as a Unix timestamp, or None
+    """
+    where, params = ["1=1"], []
+    if since is not None:
+        where.append("wake_at >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("wake_at < ?")
+        params.append(until)
+    where = " AND ".join(where)
+    
+    total, cache_hits, errors = conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(cache_hit), 0), COUNT(error) FROM interactions WHERE {where}",
+        params
+    ).fetchone()
+    print(f"Interactions: {total}  cache hits: {cache_hits}  errors: {errors}")
+    if not total:
+        return
+    
+    rejected = conn.execute(
+        f"SELECT asr_rejected, COUNT(*) FROM interactions WHERE {where} AND asr_rejected IS NOT NULL "
+        "GROUP BY 1 ORDER BY 2 DESC", params
+    ).fetchall()
+    if rejected:
+        reasons = ", ".join(f"{reason}={count}" for reason, count in rejected)
+        print(f"Rejected transcripts: {sum(count for _, count in rejected)} ({reasons})")
+    
+    print("\nLatency (ms)       count      p50      p95      p99")
+    for name, start, end in STAGES:
+        expression = f"({end} - {start}) * 1000"
+        stage_where = f"{where} AND {start} IS NOT NULL AND {end} IS NOT NULL"
+        count = conn.execute(f"SELECT COUNT(*) FROM interactions WHERE {stage_where}", params).fetchone()[0]
+        if not count:
+            continue
+        p50, p95, p99 = (_percentile(conn, expression, stage_where, params, count, p) for p in (50, 95, 99))
+        print(f"{name:<15} {count:>8} {p50:>8.0f} {p95:>8.0f} {p99:>8.0f}")
+    
+    # What pre-warming saves: AI latency by the state of the connection
+    ai_where = f"{where} AND ai_connection IS NOT NULL AND ai_done_at IS NOT NULL AND command_at IS NOT NULL"
+    connections = conn.execute(
+        f"SELECT ai_connection, COUNT(*) FROM interactions WHERE {ai_where} GROUP BY 1 ORDER BY 1", params
+    ).fetchall()
+    if connections:
+        print("\nAI latency by connection (ms)   count      p50      p95")
+        for connection, count in connections:
+            connection_where = f"{ai_where} AND ai_connection = ?"
+            p50, p95 = (
+                _percentile(conn, "(ai_done_at - command_at) * 1000", connection_where,
+                            params + [connection], count, p)
+                for p in (50, 95)
+            )
+            print(f"  {connection:<28} {count:>7} {p50:>8.0f} {p95:>8.0f}")
+    
+    # What follow-up windows save: the same stages with and without the wake word
+    answered_where = f"{where} AND command_at IS NOT NULL AND tts_done_at IS NOT NULL"
+    kinds = conn.execute(
+        f"SELECT follow_up, COUNT(*) FROM interactions WHERE {answered_where} GROUP BY 1 ORDER BY 1", params
+    ).fetchall()
+    if len(kinds) > 1:
+        print("\nLatency by turn kind (ms)      count  recog p50   turn p50")
+        for follow_up, count in kinds:
+            kind_where = f"{answered_where} AND follow_up = ?"
+            recognition, total = (
+                _percentile(conn, expression, kind_where, params + [follow_up], count, 50)
+                for expression in ("(command_at - wake_at) * 1000", "(tts_done_at - wake_at) * 1000")
+            )
+            name = "follow-up" if follow_up else "wake word"
+            print(f"  {name:<28} {count:>7} {recognition:>10.0f} {total:>10.0f}")
+    
+    print("\nBackends")
+    for backend, count in conn.execute(
+        f"SELECT COALESCE(backend, 'none'), COUNT(*) FROM interactions WHERE {where} "
+        "GROUP BY 1 ORDER BY 2 DESC", params
+    ):
+        print(f"  {backend:<12} {count}")
+    
+    misses = {}
+    for (value,) in conn.execute(
+        f"SELECT budget_misses FROM interactions WHERE {where} AND budget_misses IS NOT NULL", params
+    ):
+        for stage in json.loads(value):
+            misses[stage] = misses.get(stage, 0) + 1
+    if misses:
+        print("\nBudget misses: " + ", ".join(f"{stage}={count}" for stage, count in sorted(misses.items())))
+    
+    print("\nTop commands")
+    for transcript, count in conn.execute(
+        f"SELECT transcript, COUNT(*) FROM interactions WHERE {where} AND transcript IS NOT NULL "
+        "AND asr_rejected IS NULL GROUP BY transcript ORDER BY 2 DESC LIMIT 10", params
+    ):
+        print(f"  {count:>6}  {transcript}")
+
+
+def _fts_query(text):
+    """
+    Turn user text into an FTS5 query matching rows that contain every word.
+    
+    Each word is quoted as a phrase, so apostrophes, quotes and operators
+    like AND in the text are searched for instead of parsed.
+    
+    Args:
+        text (str): Text as typed
+    
+    Returns:
+        str: FTS5 query, or "" if the text has no words
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def find(conn, text, limit=20):
+    """
+    Get interactions whose transcript or response matches text, newest first.
+    
+    Args:
+        conn (sqlite3.Connection): Journal connection
+        text (str): Words to search for (a plain substring without FTS5)
+        limit (int): Maximum number of rows
+    
+    Returns:
+        list: (wake_at, transcript, response) tuples
+    """
+    query = _fts_query(text)
+    if query and has_fts(conn):
+        return conn.execute(
+            "SELECT i.wake_at, i.transcript, i.response FROM interactions_fts f "
+            "JOIN interactions i ON i.id = f.rowid WHERE interactions_fts MATCH ? "
+            "ORDER BY i.wake_at DESC LIMIT ?", (query, limit)
+        ).fetchall()
+    
+    pattern = f"%{text}%"
+    return conn.execute(
+        "SELECT wake_at, transcript, response FROM interactions "
+        "WHERE transcript LIKE ? OR response LIKE ? ORDER BY wake_at DESC LIMIT ?",
+        (pattern, pattern, limit)
+    ).fetchall()
+
+
+def search(conn, text, limit=20):
+    """
+    Print interactions whose transcript or response matches text.
+    
+    Args:
+        conn (sqlite3.Connection): Journal connection
+        text (str): Words to search for (a plain substring without FTS5)
+        limit (int): Maximum number of rows
+    """
+    for wake_at, transcript, response in find(conn, text, limit):
+        print(f"{datetime.fromtimestamp(wake_at):%Y-%m-%d %H:%M:%S}  {transcript!r} -> {response!r}")
+
+
+def main():
+    """Command line reports over the interaction journal."""
+    parser = argparse.ArgumentParser(description="Wakeon interaction journal reports")
+    parser.add_argument("--db", default=getattr(config, "JOURNAL_PATH", f"{config.LOGS_DIR}/interactions.db"),
+                        help="Journal database path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    report_parser = subparsers.add_parser("report", help="Latency and usage report")
+    report_parser.add_argument("--since", help="Start date/time (ISO format)")
+    report_parser.add_argument("--until", help="End date/time (ISO format)")
+    
+    search_parser = subparsers.add_parser("search", help="Search transcripts and responses")
+    search_parser.add_argument("text", help="Text to search for")
+    search_parser.add_argument("--limit", type=int, default=20)
+    
+    args = parser.parse_args()
+    
+    try:
+        conn = connect(args.db)
+    except sqlite3.Error as e:
+        print(f"Error: cannot open {args.db}: {e}")
+        sys.exit(1)
+    
+    if args.command == "report":
+        report(
+            conn,
+            since=_parse_time(args.since) if args.since else None,
+            until=_parse_time(args.until) if args.until else None
+        )
+    else:
+        search(conn, args.text, args.limit)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Per-turn latency budget with deadline propagation across pipeline stages
+"""
+
+import logging
+import threading
+from collections import Counter
+
+import config
+from src.audio_io import get_clock
+
+logger = logging.getLogger(__name__)
+
+# Stage names used when recording budget misses
+STAGE_ASR = "asr"
+STAGE_AI = "ai"
+STAGE_TTS = "tts"
+
+
+class LatencyBudget:
+    """
+    Tracks the time left in a single turn, from end of speech to first audio.
+    
+    The budget is created before the turn and started once the user stops
+    speaking. Each stage asks for ``remaining()`` to size its own deadline and
+    calls ``check(stage)`` to find out whether it has to degrade.
+    """
+    
+    # Budget misses per stage, shared by all turns of the process
+    _misses = Counter()
+    _lock = threading.Lock()
+    
+    def __init__(self, total_seconds=None):
+        """
+        Initialize the latency budget.
+        
+        Args:
+            total_seconds (float): Budget for the turn in seconds
+        """
+        if total_seconds is None:
+            total_seconds = getattr(config, "LATENCY_BUDGET_SECONDS", 3.0)
+        self.total_seconds = float(total_seconds)
+        self.deadline = None
+        self.missed_stages = set()
+    
+    def start(self):
+        """Start the budget clock (call at end of speech)."""
+        if self.deadline is None:
+            self.deadline = get_clock().monotonic() + self.total_seconds
+    
+    def extend(self, seconds):
+        """
+        Give the rest of the turn a new deadline counted from now.
+        
+        Used after something has already been played to the user, so the
+        remaining stages are not forced to degrade.
+        
+        Args:
+            seconds (float): Seconds from now until the new deadline
+        """
+        self.deadline = get_clock().monotonic() + seconds
+    
+    @property
+    def started(self):
+        """bool: True once the budget clock is running."""
+        return self.deadline is not None
+    
+    def remaining(self):
+        """
+        Get the time left in the budget.
+        
+        Returns:
+            float: Seconds left, never negative (full budget if not started)
+        """
+        if self.deadline is None:
+            return self.total_seconds
+        return max(0.0, self.deadline - get_clock().monotonic())
+    
+    def expired(self):
+        """
+        Check whether the budget has run out.
+        
+        Returns:
+            bool: True if no time is left
+        """
+        return self.started and self.remaining() <= 0.0
+    
+    def check(self, stage):
+        """
+        Check the budget on behalf of a stage and record a miss if it ran out.
+        
+        A stage is counted at most once per turn.
+        
+        Args:
+            stage (str): Name of the stage doing the check
+        
+        Returns:
+            bool: True if the stage still has time, False if it must degrade
+        """
+        if not self.expired():
+            return True
+        
+        if stage not in self.missed_stages:
+            self.missed_stages.add(stage)
+            with LatencyBudget._lock:
+                LatencyBudget._misses[stage] += 1
+            logger.warning(f"Latency budget exhausted in stage '{stage}'")
+        return False
+    
+    @classmethod
+    def get_misses(cls):
+        """
+        Get the number of budget misses per stage.
+        
+        Returns:
+            dict: Mapping of stage name to miss count
+        """
+        with cls._lock:
+            return dict(cls._misses)
+    
+    @classmethod
+    def log_misses(cls):
+        """Log a summary of budget misses per stage."""
+        misses = cls.get_misses()
+        if misses:
+            summary = ", ".join(f"{stage}={count}" for stage, count in sorted(misses.items()))
+            logger.info(f"Latency budget misses: {summary}")
+        else:
+            logger.info("Latency budget misses: none")
@@ -0,0 +1,421 @@
+"""
+Resident memory report per component, and a reproducible footprint comparison
+
+With `python wakeon.py --memory-report` the assistant measures how much
+its resident set (RSS) grows while each component is created, which
+packages each one imports, and the RSS after init and at steady state,
+when it shuts down. Native libraries (Vosk, Porcupine, numpy, onnxruntime,
+...) are attributed from /proc/self/smaps; models and Python objects live
+on the heap and show up in the per-component growth instead.
+
+Run as a module, it measures a whole session on simulated audio twice in
+fresh processes, once as configured and once in small-footprint mode,
+and prints the savings:
+
+Usage:
+    python -m src.memory_report
+    python -m src.memory_report --seconds 120 --output footprint.json
+    python -m src.memory_report --audio-input session.wav
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import gc
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import config
+
+# Try to import optional dependencies
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Mapped files whose path contains one of the patterns count towards the group
+MAPPING_GROUPS = (
+    ("vosk", ("vosk",)),
+    ("porcupine", ("pvporcupine", "pvrecorder")),
+    ("numpy", ("numpy", "openblas", "gfortran")),
+    ("scipy", ("scipy",)),
+    ("tts", ("pyttsx3", "espeak", "piper", "onnxruntime")),
+    ("openai", ("openai", "httpx", "pydantic")),
+    ("audio", ("portaudio", "sounddevice", "libasound", "libpulse")),
+    ("python", ("python3", "libpython", "lib-dynload")),
+)
+
+_active_report = None
+
+
+def rss_bytes():
+    """
+    Get the current resident set size of this process.
+    
+    Returns:
+        int: Bytes, or None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    """
+    Get the highest resident set size this process has had.
+    
+    Returns:
+        int: Bytes, or None if unknown
+    """
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def rss_by_mapping():
+    """
+    Split the resident set by what is mapped: native libraries by MAPPING_GROUPS,
+    anonymous memory as "heap" and other files as "other".
+    
+    Returns:
+        dict: Group name to bytes, empty where /proc/self/smaps is not available
+    """
+    groups = OrderedDict((name, 0) for name, _ in MAPPING_GROUPS)
+    groups["heap"] = groups["other"] = 0
+    try:
+        with open("/proc/self/smaps") as f:
+            group = "other"
+            for line in f:
+                fields = line.split()
+                if not fields:
+                    continue
+                if fields[0] == "Rss:":
+                    groups[group] += int(fields[1]) * 1024
+                elif not fields[0].endswith(":"):
+                    # A mapping header: address perms offset dev inode [path]
+                    path = fields[5] if len(fields) > 5 else ""
+                    group = _mapping_group(path)
+    except (OSError, ValueError):
+        return {}
+    return groups
+
+
+def _mapping_group(path):
+    """Group a mapped path belongs to."""
+    if not path or path.startswith("["):
+        return "heap"
+    for name, patterns in MAPPING_GROUPS:
+        if any(pattern in path for pattern in patterns):
+            return name
+    return "other"
+
+
+def release_memory():
+    """
+    Hand freed memory back to the operating system.
+    
+    glibc keeps freed heap pages for reuse, so dropping a model or engine
+    does not lower the RSS by itself until the heap is trimmed.
+    """
+    gc.collect()
+    libc_name = ctypes.util.find_library("c")
+    if not libc_name:
+        return
+    try:
+        ctypes.CDLL(libc_name).malloc_trim(0)
+    except (OSError, AttributeError):
+        # Not glibc (macOS, musl)
+        pass
+
+
+def _mb(value):
+    """Format bytes as MB, or n/a."""
+    return "n/a" if value is None else f"{value / (1024 * 1024):.1f} MB"
+
+
+class MemoryReport:
+    """
+    Collects resident memory per component and at named points in a session.
+    
+    Growth is measured around each component's creation, so it includes the
+    packages and models the component loads; other threads allocating at
+    the same time are counted too, so the figures are approximate.
+    """
+    
+    def __init__(self):
+        """Initialize an empty report."""
+        self.components = OrderedDict()
+        self.snapshots = OrderedDict()
+    
+    @contextmanager
+    def measure(self, name):
+        """
+        Attribute the memory allocated inside the block to a component.
+        
+        Args:
+            name (str): Component name; repeated measurements add up
+        """
+        modules = set(sys.modules)
+        before = rss_bytes()
+        try:
+            yield
+        finally:
+            after = rss_bytes()
+            imported = {module.split(".")[0] for module in set(sys.modules) - modules}
+            imported -= set(getattr(sys, "stdlib_module_names", ())) | {"src", "config", "wakeon"}
+            imported = {module for module in imported if not module.startswith("_")}
+            
+            entry = self.components.setdefault(name, {"rss_bytes": 0, "imports": []})
+            if before is not None and after is not None:
+                entry["rss_bytes"] += after - before
+            entry["imports"] = sorted(set(entry["imports"]) | imported)
+    
+    def snapshot(self, label):
+        """
+        Record the resident memory now; a later snapshot with the same label replaces it.
+        
+        Args:
+            label (str): Point in the session, e.g. "after init"
+        """
+        self.snapshots[label] = {
+            "rss_bytes": rss_bytes(),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "mappings": rss_by_mapping(),
+            "at": time.time(),
+        }
+    
+    def to_dict(self):
+        """
+        Get the report as plain data.
+        
+        Returns:
+            dict: "components" and "snapshots"
+        """
+        return {"components": self.components, "snapshots": self.snapshots}
+    
+    def format(self):
+        """
+        Render the report as text.
+        
+        Returns:
+            list: Lines of the report
+        """
+        lines = ["Memory report (resident set size)"]
+        for label, snapshot in self.snapshots.items():
+            lines.append(f"  {label}: {_mb(snapshot['rss_bytes'])} (peak {_mb(snapshot['peak_rss_bytes'])})")
+        
+        if self.components:
+            lines.append("  Created components:")
+            for name, entry in self.components.items():
+                imports = f", imports {', '.join(entry['imports'])}" if entry["imports"] else ""
+                lines.append(f"    {name:<20} +{_mb(entry['rss_bytes'])}{imports}")
+        
+        if self.snapshots:
+            label, snapshot = next(reversed(self.snapshots.items()))
+            mappings = [(name, size) for name, size in snapshot["mappings"].items() if size]
+            if mappings:
+                lines.append(f"  By mapping ({label}):")
+                for name, size in sorted(mappings, key=lambda item: -item[1]):
+                    lines.append(f"    {name:<20} {_mb(size)}")
+        return lines
+    
+    def log(self):
+        """Log the report."""
+        for line in self.format():
+            logger.info(line)
+    
+    def write(self, path):
+        """
+        Write the report as JSON.
+        
+        Args:
+            path (str): Output file
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        logger.info(f"Memory report written to {path}")
+
+
+def start():
+    """
+    Start collecting a report for this process, with a "startup" snapshot.
+    
+    Returns:
+        MemoryReport: The active report
+    """
+    global _active_report
+    _active_report = MemoryReport()
+    _active_report.snapshot("startup")
+    return _active_report
+
+
+def get_active_report():
+    """
+    Get the report being collected.
+    
+    Returns:
+        MemoryReport: The active report, or None if none was started
+    """
+    return _active_report
+
+
+@contextmanager
+def measure(name):
+    """
+    Attribute memory to a component if a report is being collected.
+    
+    Cheap enough to leave in place when none is.
+    
+    Args:
+        name (str): Component name
+    """
+    if _active_report is None:
+        yield
+        return
+    with _active_report.measure(name):
+        yield
+
+
+def snapshot(label):
+    """
+    Record the resident memory now if a report is being collected.
+    
+    Args:
+        label (str): Point in the session
+    """
+    if _active_report is not None:
+        _active_report.snapshot(label)
+
+
+def _run_session(small_footprint, seconds, audio_input, output):
+    """
+    Measure one simulated session in this process (the child side of main()).
+    
+    Args:
+        small_footprint (bool): Run in small-footprint mode
+        seconds (float): Seconds of quiet noise to listen to, without audio_input
+        audio_input (list): WAV files to feed instead, e.g. with wake words and commands
+        output (str): JSON file for the results
+    """
+    import numpy as np
+    from src import audio_io
+    # This file runs as __main__; the assistant reports to the imported module
+    from src import memory_report
+    
+    config.SMALL_FOOTPRINT = small_footprint
+    # The file watcher would only add a thread; it has nothing to reload here
+    config.CONFIG_HOT_RELOAD = False
+    
+    audio_io.set_clock(audio_io.VirtualClock())
+    if audio_input:
+        source = audio_io.WavFileSource(audio_input)
+    else:
+        rng = np.random.default_rng(0)
+        block = int(config.SAMPLE_RATE)
+        chunks = (rng.normal(0, 30, block).astype(np.int16) for _ in range(int(seconds)))
+        source = audio_io.GeneratorSource(chunks, config.SAMPLE_RATE)
+    backend = audio_io.FakeAudioBackend(source)
+    audio_io.set_audio_backend(backend)
+    
+    report = memory_report.start()
+    with report.measure("imports"):
+        import wakeon
+    assistant = wakeon.WakeonAssistant()
+    backend.on_exhausted = assistant.stop
+    assistant.run()
+    
+    with open(output, "w") as f:
+        json.dump(report.to_dict(), f)
+
+
+def _print_comparison(results):
+    """Print the standard and small-footprint sessions side by side."""
+    standard, small = results["standard"], results["small"]
+    
+    def row(name, a, b):
+        saved = "" if a is None or b is None else _mb(a - b)
+        print(f"  {name:<22} {_mb(a):>10} {_mb(b):>10} {saved:>10}")
+    
+    print("Resident memory, as configured vs small-footprint mode")
+    print(f"  {'':<22} {'standard':>10} {'small':>10} {'saved':>10}")
+    for label in standard["snapshots"]:
+        a = standard["snapshots"][label]
+        b = small["snapshots"].get(label, {})
+        row(label, a["rss_bytes"], b.get("rss_bytes"))
+    last = list(standard["snapshots"])[-1]
+    row("peak", standard["snapshots"][last]["peak_rss_bytes"], small["snapshots"][last]["peak_rss_bytes"])
+    
+    print("  Created components:")
+    for name, entry in standard["components"].items():
+        row(f"  {name}", entry["rss_bytes"], small["components"].get(name, {}).get("rss_bytes"))
+    for mode, result in results.items():
+        imports = sorted({module for entry in result["components"].values() for module in entry["imports"]})
+        print(f"  Packages imported ({mode}): {', '.join(imports) or 'none'}")
+
+
+def main():
+    """Compare a session's memory use with and without small-footprint mode."""
+    parser = argparse.ArgumentParser(description="Resident memory with and without small-footprint mode")
+    parser.add_argument("--seconds", type=float, default=60.0,
+                        help="Seconds of simulated quiet room to listen to (default: 60)")
+    parser.add_argument("--audio-input", nargs="+", metavar="WAV",
+                        help="16-bit mono WAV files to run on instead, e.g. with wake words and commands")
+    parser.add_argument("--output", help="Also write both reports as JSON to this file")
+    parser.add_argument("--session", choices=["standard", "small"], help=argparse.SUPPRESS)
+    parser.add_argument("--session-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.session:
+        _run_session(args.session == "small", args.seconds, args.audio_input, args.session_output)
+        return
+    
+    if rss_bytes() is None:
+        print("Error: resident memory can only be measured where /proc is available (Linux)")
+        sys.exit(1)
+    
+    # Each session in a fresh interpreter, so neither inherits the other's imports
+    results = {}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for mode in ("standard", "small"):
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            path = f.name
+        try:
+            command = [sys.executable, "-m", "src.memory_report", "--session", mode,
+                       "--seconds", str(args.seconds), "--session-output", path]
+            if args.audio_input:
+                command += ["--audio-input"] + [os.path.abspath(wav) for wav in args.audio_input]
+            completed = subprocess.run(command, cwd=root, stdout=subprocess.DEVNULL)
+            if completed.returncode != 0:
+                print(f"Error: the {mode} session failed (exit code {completed.returncode})")
+                sys.exit(1)
+            with open(path) as f:
+                results[mode] = json.load(f)
+        finally:
+            os.unlink(path)
+    
+    _print_comparison(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Rolling latency metrics shared by the pipeline components
+"""
+
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """Keeps a rolling window of latency samples and reports percentiles."""
+    
+    def __init__(self, name, window=500):
+        """
+        Initialize the latency stats.
+        
+        Args:
+            name (str): Metric name used in reports
+            window (int): Number of recent samples to keep
+        """
+        self.name = name
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def record(self, seconds):
+        """
+        Record one latency sample.
+        
+        Args:
+            seconds (float): Measured latency in seconds
+        """
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+    
+    def percentile(self, percent):
+        """
+        Get a percentile over the current window.
+        
+        Args:
+            percent (float): Percentile between 0 and 100
+        
+        Returns:
+            float: Latency in seconds, or None if there are no samples
+        """
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return _pick(ordered, percent)
+    
+    def summary(self):
+        """
+        Get a summary of the current window.
+        
+        Returns:
+            dict: count, mean, p50, p95 and max in seconds
+        """
+        with self._lock:
+            ordered = sorted(self.samples)
+            count = self.count
+        if not ordered:
+            return {"count": count, "mean": None, "p50": None, "p95": None, "max": None}
+        return {
+            "count": count,
+            "mean": sum(ordered) / len(ordered),
+            "p50": _pick(ordered, 50),
+            "p95": _pick(ordered, 95),
+            "max": ordered[-1],
+        }
+
+
+def _pick(ordered, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    index = int(round(percent / 100.0 * (len(ordered) - 1)))
+    return ordered[min(len(ordered) - 1, index)]
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_stats(name):
+    """
+    Get the shared latency stats for a metric, creating it on first use.
+    
+    Args:
+        name (str): Metric name, e.g. "ai.openai.first_token"
+    
+    Returns:
+        LatencyStats: The stats object for the metric
+    """
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = LatencyStats(name)
+        return _registry[name]
+
+
+def get_all_summaries():
+    """
+    Get summaries for every registered metric.
+    
+    Returns:
+        dict: Mapping of metric name to summary dict
+    """
+    with _registry_lock:
+        stats = list(_registry.values())
+    return {s.name: s.summary() for s in stats}
+
+
+def log_all():
+    """Log a one-line summary for every metric that has samples."""
+    for name, summary in sorted(get_all_summaries().items()):
+        if summary["count"] == 0:
+            continue
+        logger.info(
+            f"{name}: n={summary['count']} "
+            f"p50={summary['p50'] * 1000:.0f}ms "
+            f"p95={summary['p95'] * 1000:.0f}ms "
+            f"max={summary['max'] * 1000:.0f}ms"
+        )
@@ -0,0 +1,397 @@
+"""
+Mock OpenAI chat-completions server for load tests and offline development
+
+Speaks enough of the chat-completions protocol for the local AI backend
+(and any OpenAI client pointed at it): streamed and non-streamed
+responses, x-ratelimit-* headers, 429 responses with Retry-After, and
+injected server errors and dropped connections. Latencies are drawn from
+configurable distributions, so tail behaviour can be reproduced without
+paying for real API calls.
+
+Usage:
+    python -m src.mock_openai_server --port 8080 --first-token lognormal:0.4,0.5
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_WORDS = (
+    "Sure. It is sunny and mild today with a light breeze from the west, "
+    "so it is a good afternoon for a walk. Let me know if you need anything else."
+).split()
+
+
+def parse_distribution(spec):
+    """
+    Parse a latency distribution.
+    
+    Forms: "0.2" or "fixed:0.2", "uniform:LOW,HIGH", "normal:MEAN,STDDEV",
+    "lognormal:MEDIAN,SIGMA" and "exp:MEAN", all in seconds. Samples are
+    never negative.
+    
+    Args:
+        spec (str or float): Distribution spec
+    
+    Returns:
+        callable: Takes a random.Random and returns seconds
+    
+    Raises:
+        ValueError: If the spec cannot be parsed
+    """
+    if isinstance(spec, (int, float)):
+        spec = str(spec)
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "fixed", kind
+    try:
+        values = [float(value) for value in args.split(",")]
+    except ValueError:
+        raise ValueError(f"Bad latency distribution '{spec}'")
+    
+    samplers = {
+        ("fixed", 1): lambda rng: values[0],
+        ("uniform", 2): lambda rng: rng.uniform(values[0], values[1]),
+        ("normal", 2): lambda rng: rng.gauss(values[0], values[1]),
+        ("lognormal", 2): lambda rng: rng.lognormvariate(math.log(values[0]), values[1]),
+        ("exp", 1): lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0,
+    }
+    sampler = samplers.get((kind, len(values)))
+    if sampler is None:
+        raise ValueError(f"Bad latency distribution '{spec}'")
+    return lambda rng: max(0.0, sampler(rng))
+
+
+class _ChatHandler(BaseHTTPRequestHandler):
+    """Request handler; the MockOpenAIServer is reachable as self.server.mock."""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        model = {"id": self.server.mock.model, "object": "model"}
+        if path == "/health":
+            # llama.cpp's health check, used for pre-warming
+            self._send_json(200, {"status": "ok"})
+        elif path == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [model]})
+        elif path.startswith("/v1/models/"):
+            self._send_json(200, model)
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+            return
+        self.server.mock.handle(self, request)
+    
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    """HTTP server that logs dropped client connections quietly."""
+    
+    daemon_threads = True
+    
+    def handle_error(self, request, client_address):
+        logger.debug(f"Connection from {client_address[0]}:{client_address[1]} failed", exc_info=True)
+
+
+class MockOpenAIServer:
+    """
+    Chat-completions server with simulated latency, errors and rate limits.
+    
+    Each request first waits the first-token latency, then streams one word
+    per token with the per-token latency in between. Before that it may be
+    refused: with 429 when the requests-per-minute limit is used up or by
+    random injection, or with 500 by random injection. A dropped request
+    closes the connection halfway through the stream.
+    """
+    
+    def __init__(self, host="127.0.0.1", port=0, first_token="0.05", token="0.01",
+                 response_tokens=30, requests_per_minute=None, rate_limit_rate=0.0,
+                 error_rate=0.0, disconnect_rate=0.0, model="mock-gpt", seed=None):
+        """
+        Initialize the server.
+        
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on; 0 picks a free one
+            first_token (str): Distribution of the latency before the first token
+            token (str): Distribution of the latency between tokens
+            response_tokens (int): Tokens per answer, capped by max_tokens
+            requests_per_minute (int): Limit reported and enforced, or None
+            rate_limit_rate (float): Share of requests refused with 429 regardless
+            error_rate (float): Share of requests failing with HTTP 500
+            disconnect_rate (float): Share of streams cut off halfway
+            model (str): Model name reported in responses
+            seed (int): Seed for reproducible latencies and failures
+        """
+        self.first_token = parse_distribution(first_token)
+        self.token = parse_distribution(token)
+        self.response_tokens = response_tokens
+        self.requests_per_minute = requests_per_minute
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.model = model
+        
+        self.counts = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "disconnects": 0}
+        self._recent = deque()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        
+        self.httpd = _MockHTTPServer((host, port), _ChatHandler)
+        self.httpd.mock = self
+        self._thread = None
+    
+    @property
+    def url(self):
+        """str: Base URL, as used for LOCAL_LLM_URL."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        logger.info(f"Mock OpenAI server listening on {self.url}")
+        return self
+    
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+    
+    def _admit(self):
+        """
+        Decide what happens to a new request and draw its latencies.
+        
+        Returns:
+            tuple: (outcome, rate-limit headers, retry after, first-token delay, token delays)
+        """
+        with self._lock:
+            self.counts["requests"] += 1
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            
+            headers = {}
+            retry_after = None
+            outcome = "ok"
+            if self.requests_per_minute:
+                remaining = self.requests_per_minute - len(self._recent)
+                reset = 60 - (now - self._recent[0]) if self._recent else 0.0
+                if remaining <= 0:
+                    outcome, retry_after = "rate_limited", max(reset, 0.001)
+                else:
+                    remaining -= 1
+                headers = {
+                    "x-ratelimit-limit-requests": str(self.requests_per_minute),
+                    "x-ratelimit-remaining-requests": str(max(remaining, 0)),
+                    "x-ratelimit-reset-requests": f"{max(reset, 0.0):.3f}s",
+                }
+            if outcome == "ok" and self._rng.random() < self.rate_limit_rate:
+                outcome, retry_after = "rate_limited", 1.0
+            elif outcome == "ok" and self._rng.random() < self.error_rate:
+                outcome = "errors"
+            elif outcome == "ok" and self._rng.random() < self.disconnect_rate:
+                outcome = "disconnects"
+            
+            if outcome in ("ok", "disconnects"):
+                self._recent.append(now)
+            self.counts[outcome] += 1
+            first_token = self.first_token(self._rng)
+            token_delays = [self.token(self._rng) for _ in range(self.response_tokens)]
+            return outcome, headers, retry_after, first_token, token_delays
+    
+    def handle(self, handler, request):
+        """
+        Answer one chat-completion request.
+        
+        Args:
+            handler (BaseHTTPRequestHandler): The request's handler
+            request (dict): Parsed request body
+        """
+        outcome, headers, retry_after, first_token, token_delays = self._admit()
+        
+        if outcome == "rate_limited":
+            headers["Retry-After"] = f"{retry_after:.3f}"
+            handler._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, headers)
+            return
+        if outcome == "errors":
+            handler._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return
+        
+        max_tokens = request.get("max_tokens") or self.response_tokens
+        count = max(1, min(max_tokens, self.response_tokens))
+        words = [RESPONSE_WORDS[i % len(RESPONSE_WORDS)] for i in range(count)]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        
+        time.sleep(first_token)
+        if not request.get("stream"):
+            time.sleep(sum(token_delays[:count - 1]))
+            handler._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": self.model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "length" if count == max_tokens else "stop",
+                }],
+                "usage": {"prompt_tokens": _count_prompt_tokens(request), "completion_tokens": count,
+                          "total_tokens": _count_prompt_tokens(request) + count},
+            }, headers)
+            return
+        
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        # No Content-Length: the stream ends when the connection closes
+        handler.send_header("Connection", "close")
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.close_connection = True
+        
+        try:
+            for i, word in enumerate(words):
+                if outcome == "disconnects" and i == count // 2:
+                    return
+                if i:
+                    time.sleep(token_delays[i - 1])
+                text = word if i == 0 else " " + word
+                self._send_event(handler, completion_id, {"content": text}, None)
+            self._send_event(handler, completion_id, {}, "length" if count == max_tokens else "stop")
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, e.g. at its deadline
+            return
+    
+    def _send_event(self, handler, completion_id, delta, finish_reason):
+        """Write one chat.completion.chunk server-sent event."""
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": self.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        handler.wfile.write(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+        handler.wfile.flush()
+    
+    def summary(self):
+        """
+        Get the request counts so far.
+        
+        Returns:
+            dict: Requests, ok, rate_limited, errors and disconnects
+        """
+        with self._lock:
+            return dict(self.counts)
+
+
+def _count_prompt_tokens(request):
+    """Rough prompt size in tokens (words) for the usage block."""
+    return sum(len(str(message.get("content", "")).split()) for message in request.get("messages", []))
+
+
+def add_server_arguments(parser):
+    """
+    Add the mock server options to an argument parser.
+    
+    Args:
+        parser (argparse.ArgumentParser): Parser to extend
+    """
+    parser.add_argument("--first-token", default="0.05",
+                        help="First-token latency distribution, e.g. 0.2, uniform:0.1,0.5, lognormal:0.3,0.6")
+    parser.add_argument("--token", default="0.01", help="Per-token latency distribution")
+    parser.add_argument("--response-tokens", type=int, default=30, help="Tokens per answer")
+    parser.add_argument("--server-rpm", type=int, default=None,
+                        help="Requests per minute the server allows before answering 429")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests refused with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with HTTP 500")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="Share of streams cut off halfway")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+
+
+def server_from_arguments(args, host="127.0.0.1", port=0):
+    """
+    Create a server from parsed add_server_arguments() options.
+    
+    Returns:
+        MockOpenAIServer: The (not yet started) server
+    """
+    return MockOpenAIServer(
+        host=host,
+        port=port,
+        first_token=args.first_token,
+        token=args.token,
+        response_tokens=args.response_tokens,
+        requests_per_minute=args.server_rpm,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        disconnect_rate=args.disconnect_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    """Run the mock server in the foreground."""
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    server = server_from_arguments(args, args.host, args.port).start()
+    print(f"Mock OpenAI server on {server.url} - set AI_BACKEND=local and LOCAL_LLM_URL={server.url}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"Requests: {server.summary()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Per-language Vosk models loaded on first use and evicted under a memory budget
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+import config
+from src import metrics
+
+# Try to import optional dependencies
+try:
+    import vosk
+    VOSK_AVAILABLE = True
+except ImportError:
+    VOSK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# A model load, preload or eviction
+ModelEvent = namedtuple("ModelEvent", ["kind", "language", "size_mb", "seconds", "at"])
+
+EVENT_LOAD = "load"
+EVENT_PRELOAD = "preload"
+EVENT_EVICT = "evict"
+
+
+def get_language_settings():
+    """
+    Get the configured languages.
+    
+    LANGUAGE_MODELS maps a language code to a dict with "model_path" and,
+    optionally, "tts_voice" and "wake_word". It may also be given as a JSON
+    string (e.g. from .env). Without it there is one language, "default",
+    using VOSK_MODEL_PATH.
+    
+    Returns:
+        dict: Language code to settings
+    """
+    languages = getattr(config, "LANGUAGE_MODELS", None)
+    if isinstance(languages, str):
+        languages = json.loads(languages) if languages.strip() else None
+    if not languages:
+        return {"default": {"model_path": config.VOSK_MODEL_PATH}}
+    return languages
+
+
+def estimate_model_size_mb(model_path):
+    """
+    Estimate the memory a model needs from the size of its files.
+    
+    Args:
+        model_path (str): Vosk model directory
+    
+    Returns:
+        float: Size in MB
+    """
+    total = 0
+    for root, _, files in os.walk(model_path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total / (1024 * 1024)
+
+
+class ModelManager:
+    """
+    Maps languages to Vosk models and TTS voices and keeps the right models loaded.
+    
+    Models are loaded on first use and kept in least-recently-used order.
+    When the loaded models exceed the memory budget, the least recently used
+    ones are dropped, except the default language and the one just requested.
+    Usage is counted per hour of day, and after each request the language
+    most likely to come next is loaded in the background if it fits in the
+    budget without evicting anything.
+    """
+    
+    def __init__(self, languages=None, default_language=None, memory_budget_mb=None,
+                 preload=None, loader=None, on_event=None):
+        """
+        Initialize the model manager.
+        
+        Args:
+            languages (dict): Language code to settings; defaults to LANGUAGE_MODELS
+            default_language (str): Language used when none is given
+            memory_budget_mb (float): Memory allowed for loaded models
+            preload (bool): Preload models predicted from usage
+            loader (callable): Builds a model from its path (vosk.Model by default)
+            on_event (callable): Called with each ModelEvent
+        """
+        self.languages = languages or get_language_settings()
+        self.default_language = default_language or getattr(config, "DEFAULT_LANGUAGE", None)
+        if self.default_language not in self.languages:
+            self.default_language = next(iter(self.languages))
+        if memory_budget_mb is None:
+            memory_budget_mb = getattr(config, "MODEL_MEMORY_BUDGET_MB", 1024)
+        self.memory_budget_mb = memory_budget_mb
+        if preload is None:
+            # Preloading keeps a second model resident, which small-footprint mode avoids
+            preload = getattr(config, "MODEL_PRELOAD", True) and not getattr(config, "SMALL_FOOTPRINT", False)
+        self.preload_enabled = preload
+        self.loader = loader or self._load_vosk_model
+        self.on_event = on_event
+        
+        self.models = OrderedDict()
+        self.sizes = {}
+        self.events = []
+        self.usage = Counter()
+        self.load_stats = metrics.get_stats("model.load")
+        
+        self._lock = threading.Lock()
+        self._load_locks = {language: threading.Lock() for language in self.languages}
+        self._preloading = set()
+        
+        wake_words = {}
+        for language, settings in self.languages.items():
+            if settings.get("wake_word"):
+                wake_words[settings["wake_word"].lower()] = language
+        self.wake_words = wake_words
+    
+    @staticmethod
+    def _load_vosk_model(model_path):
+        """Load a Vosk model from disk."""
+        if not VOSK_AVAILABLE:
+            raise ImportError("Vosk not available. Install with: pip install vosk")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Vosk model not found at {model_path}")
+        return vosk.Model(model_path)
+    
+    @property
+    def loaded_mb(self):
+        """float: Estimated memory used by the loaded models."""
+        with self._lock:
+            return sum(self.sizes[language] for language in self.models)
+    
+    def language_for_wake_word(self, wake_word):
+        """
+        Get the language a wake word selects.
+        
+        Args:
+            wake_word (str): Detected wake word, or None
+        
+        Returns:
+            str: Language code (the default if the wake word has no language)
+        """
+        if not wake_word:
+            return self.default_language
+        return self.wake_words.get(wake_word.lower(), self.default_language)
+    
+    def get_tts_voice(self, language=None):
+        """
+        Get the TTS voice configured for a language.
+        
+        Args:
+            language (str): Language code; defaults to the default language
+        
+        Returns:
+            str: Voice id, or None to keep the current voice
+        """
+        settings = self.languages.get(language or self.default_language, {})
+        return settings.get("tts_voice")
+    
+    def get_model(self, language=None):
+        """
+        Get the model for a language, loading it if needed.
+        
+        Args:
+            language (str): Language code; defaults to the default language
+        
+        Returns:
+            vosk.Model: The loaded model
+        
+        Raises:
+            KeyError: If the language is not configured
+        """
+        language = language or self.default_language
+        if language not in self.languages:
+            raise KeyError(f"No model configured for language '{language}'")
+        
+        self._record_usage(language)
+        model = self._ensure_loaded(language, EVENT_LOAD)
+        self._evict(keep=language)
+        
+        if self.preload_enabled:
+            self._preload_predicted(exclude=language)
+        return model
+    
+    def _ensure_loaded(self, language, kind):
+        """Load a language's model unless it is loaded, and mark it most recent."""
+        with self._load_locks[language]:
+            with self._lock:
+                if language in self.models:
+                    self.models.move_to_end(language)
+                    return self.models[language]
+            
+            model_path = self.languages[language]["model_path"]
+            start = time.monotonic()
+            model = self.loader(model_path)
+            seconds = time.monotonic() - start
+            size_mb = estimate_model_size_mb(model_path)
+            
+            with self._lock:
+                self.models[language] = model
+                self.sizes[language] = size_mb
+            self.load_stats.record(seconds)
+            self._report(kind, language, size_mb, seconds)
+            return model
+    
+    def _evict(self, keep):
+        """Drop least recently used models until the budget is met."""
+        while True:
+            with self._lock:
+                used = sum(self.sizes[language] for language in self.models)
+                if used <= self.memory_budget_mb:
+                    return
+                victims = [
+                    language for language in self.models
+                    if language not in (keep, self.default_language)
+                ]
+                if not victims:
+                    logger.warning(
+                        f"Loaded models use {used:.0f} MB, over the {self.memory_budget_mb:.0f} MB "
+                        "budget, but none can be evicted"
+                    )
+                    return
+                victim = victims[0]
+                del self.models[victim]
+            # Recognizers built on the model keep it alive until they are dropped
+            self._report(EVENT_EVICT, victim, self.sizes[victim], 0.0)
+    
+    def release_idle(self):
+        """Unload every model except the default language's, regardless of the budget."""
+        with self._lock:
+            victims = [language for language in self.models if language != self.default_language]
+            for victim in victims:
+                del self.models[victim]
+        for victim in victims:
+            self._report(EVENT_EVICT, victim, self.sizes[victim], 0.0)
+    
+    def _record_usage(self, language):
+        """Count a use of a language at the current hour of day."""
+        with self._lock:
+            self.usage[(time.localtime().tm_hour, language)] += 1
+    
+    def predict_next(self, exclude=None):
+        """
+        Predict the language most likely to be used next.
+        
+        Args:
+            exclude (str): Language to leave out (usually the current one)
+        
+        Returns:
+            str: Language code, or None if there is no usage to go on
+        """
+        hour = time.localtime().tm_hour
+        with self._lock:
+            scores = Counter()
+            for (used_hour, language), count in self.usage.items():
+                if language == exclude:
+                    continue
+                # Uses in this hour count most, the neighbouring hours half
+                distance = min((used_hour - hour) % 24, (hour - used_hour) % 24)
+                if distance == 0:
+                    scores[language] += count
+                elif distance == 1:
+                    scores[language] += count / 2
+        if not scores:
+            return None
+        return scores.most_common(1)[0][0]
+    
+    def _preload_predicted(self, exclude):
+        """Load the predicted next language in the background if it fits."""
+        language = self.predict_next(exclude=exclude)
+        if language is None:
+            return
+        size_mb = estimate_model_size_mb(self.languages[language]["model_path"])
+        with self._lock:
+            if language in self.models or language in self._preloading:
+                return
+            used = sum(self.sizes[loaded] for loaded in self.models)
+            if used + size_mb > self.memory_budget_mb:
+                return
+            self._preloading.add(language)
+        
+        def preload():
+            try:
+                self._ensure_loaded(language, EVENT_PRELOAD)
+            except Exception as e:
+                logger.warning(f"Could not preload model for '{language}': {e}")
+            finally:
+                with self._lock:
+                    self._preloading.discard(language)
+        
+        threading.Thread(target=preload, name=f"model-preload-{language}", daemon=True).start()
+    
+    def _report(self, kind, language, size_mb, seconds):
+        """Record and log a load, preload or eviction."""
+        event = ModelEvent(kind, language, size_mb, seconds, time.time())
+        self.events.append(event)
+        if kind == EVENT_EVICT:
+            logger.info(f"Evicted model for '{language}' ({size_mb:.0f} MB)")
+        else:
+            logger.info(f"Loaded model for '{language}' ({size_mb:.0f} MB) in {seconds:.2f}s ({kind})")
+        if self.on_event is not None:
+            self.on_event(event)
+    
+    def log_summary(self):
+        """Log model loads and evictions so far."""
+        kinds = Counter(event.kind for event in self.events)
+        if not kinds:
+            return
+        with self._lock:
+            loaded = ", ".join(self.models) or "none"
+        logger.info(
+            f"Models: {kinds[EVENT_LOAD]} loaded, {kinds[EVENT_PRELOAD]} preloaded, "
+            f"{kinds[EVENT_EVICT]} evicted; resident: {loaded} ({self.loaded_mb:.0f} MB)"
+        )
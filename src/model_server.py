@@ -0,0 +1,340 @@
+"""
+Resident model server: keeps the Vosk model loaded for several processes
+
+Run it once per host:
+    
+    python -m src.model_server --socket /tmp/wakeon-models.sock
+
+Assistant processes, tests and tools then set MODEL_SERVER_SOCKET and attach
+in milliseconds instead of loading their own copy of the model. Requests are
+newline-delimited JSON over a Unix domain socket; audio is passed through a
+shared-memory buffer owned by the client, so only its name crosses the socket.
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+import config
+
+# Try to import optional dependencies
+try:
+    from multiprocessing import resource_tracker, shared_memory
+    SHARED_MEMORY_AVAILABLE = True
+except ImportError:
+    SHARED_MEMORY_AVAILABLE = False
+
+try:
+    import vosk
+    VOSK_AVAILABLE = True
+except ImportError:
+    VOSK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "/tmp/wakeon-models.sock"
+
+
+class ModelServerError(Exception):
+    """Raised when the model server cannot be reached or returns an error."""
+
+
+def attach_shared_memory(name):
+    """
+    Attach to a client's shared-memory buffer without taking ownership.
+    
+    Before Python 3.13 attaching registers the segment with this process's
+    resource tracker, which would unlink it when the server exits.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class _RecognitionHandler(socketserver.StreamRequestHandler):
+    """Serves one client connection with its own recognizers."""
+    
+    def handle(self):
+        recognizers = {}
+        buffers = {}
+        try:
+            for line in self.rfile:
+                try:
+                    reply = self._dispatch(json.loads(line), recognizers, buffers)
+                except Exception as e:
+                    logger.error(f"Model server request failed: {e}")
+                    reply = {"ok": False, "error": str(e)}
+                self.wfile.write(json.dumps(reply).encode() + b"\n")
+                self.wfile.flush()
+        finally:
+            for shm in buffers.values():
+                shm.close()
+    
+    def _dispatch(self, request, recognizers, buffers):
+        """Handle one request and build the reply."""
+        op = request.get("op")
+        
+        if op == "ping":
+            return {"ok": True, "model_path": self.server.model_path}
+        
+        if op == "recognize":
+            name = request["shm"]
+            if name not in buffers:
+                buffers[name] = attach_shared_memory(name)
+            audio = bytes(buffers[name].buf[:request["nbytes"]])
+            
+            # One recognizer per sample rate and grammar, reused across requests
+            key = (request["sample_rate"], request.get("grammar"), bool(request.get("words")))
+            rec = recognizers.get(key)
+            if rec is None:
+                if key[1] is None:
+                    rec = vosk.KaldiRecognizer(self.server.model, key[0])
+                else:
+                    rec = vosk.KaldiRecognizer(self.server.model, key[0], key[1])
+                if key[2]:
+                    rec.SetWords(True)
+                recognizers[key] = rec
+            
+            rec.AcceptWaveform(audio)
+            result = json.loads(rec.FinalResult())
+            rec.Reset()
+            return {"ok": True, "result": result}
+        
+        if op == "accept":
+            # Incremental decoding, e.g. keyword spotting; the recognizer keeps
+            # its state between requests until a "reset"
+            name = request["shm"]
+            if name not in buffers:
+                buffers[name] = attach_shared_memory(name)
+            audio = bytes(buffers[name].buf[:request["nbytes"]])
+            
+            key = ("stream", request["sample_rate"], request.get("grammar"))
+            rec = recognizers.get(key)
+            if rec is None:
+                if key[2] is None:
+                    rec = vosk.KaldiRecognizer(self.server.model, key[1])
+                else:
+                    rec = vosk.KaldiRecognizer(self.server.model, key[1], key[2])
+                recognizers[key] = rec
+            
+            if rec.AcceptWaveform(audio):
+                return {"ok": True, "final": True, "result": json.loads(rec.Result())}
+            return {"ok": True, "final": False, "result": json.loads(rec.PartialResult())}
+        
+        if op == "reset":
+            rec = recognizers.get(("stream", request["sample_rate"], request.get("grammar")))
+            if rec is not None:
+                rec.Reset()
+            return {"ok": True}
+        
+        return {"ok": False, "error": f"Unknown op '{op}'"}
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server holding one loaded Vosk model for all clients."""
+    
+    daemon_threads = True
+    
+    def __init__(self, socket_path, model_path):
+        """
+        Load the model and bind the socket.
+        
+        Args:
+            socket_path (str): Path of the Unix domain socket
+            model_path (str): Path of the Vosk model directory
+        """
+        if not VOSK_AVAILABLE:
+            raise ImportError("Vosk not available. Install with: pip install vosk")
+        if not SHARED_MEMORY_AVAILABLE:
+            raise ImportError("multiprocessing.shared_memory requires Python 3.8+")
+        
+        logger.info(f"Loading Vosk model from {model_path}...")
+        self.model_path = model_path
+        self.model = vosk.Model(model_path)
+        
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _RecognitionHandler)
+        logger.info(f"Model server listening on {socket_path}")
+    
+    def server_close(self):
+        """Close the socket and remove its file."""
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class ModelServerClient:
+    """Client for a running ModelServer."""
+    
+    def __init__(self, socket_path=None, timeout=30.0):
+        """
+        Connect to the model server.
+        
+        Args:
+            socket_path (str): Path of the server socket
+            timeout (float): Seconds to wait for a reply
+        
+        Raises:
+            ModelServerError: If the server is not running
+        """
+        if not SHARED_MEMORY_AVAILABLE:
+            raise ModelServerError("multiprocessing.shared_memory not available")
+        
+        self.socket_path = socket_path or getattr(config, "MODEL_SERVER_SOCKET", DEFAULT_SOCKET_PATH)
+        self.timeout = timeout
+        self.shm = None
+        self._lock = threading.RLock()
+        
+        try:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(self.socket_path)
+        except (OSError, AttributeError) as e:
+            raise ModelServerError(f"Model server not reachable at {self.socket_path}: {e}")
+        
+        self.reader = self.sock.makefile("rb")
+        self.model_path = self._request({"op": "ping"})["model_path"]
+    
+    def _request(self, request):
+        """Send one request and wait for its reply."""
+        with self._lock:
+            try:
+                self.sock.sendall(json.dumps(request).encode() + b"\n")
+                line = self.reader.readline()
+            except OSError as e:
+                raise ModelServerError(f"Model server connection failed: {e}")
+        
+        if not line:
+            raise ModelServerError("Model server closed the connection")
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise ModelServerError(reply.get("error", "unknown error"))
+        return reply
+    
+    def _ensure_buffer(self, nbytes):
+        """Create or grow the shared-memory audio buffer."""
+        if self.shm is not None and self.shm.size >= nbytes:
+            return
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+        self.shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+    
+    def recognize(self, audio, sample_rate, grammar=None, words=False):
+        """
+        Decode audio with the server's model.
+        
+        Args:
+            audio (numpy.ndarray): 16-bit mono audio
+            sample_rate (int): Sample rate of the audio
+            grammar (str): Optional JSON list of allowed phrases
+            words (bool): Ask for word-level results
+        
+        Returns:
+            dict: Vosk result, as from KaldiRecognizer.FinalResult()
+        """
+        data = audio.tobytes()
+        
+        # Hold the lock until the reply so no other caller reuses the buffer
+        with self._lock:
+            self._ensure_buffer(len(data))
+            self.shm.buf[:len(data)] = data
+            
+            request = {
+                "op": "recognize",
+                "shm": self.shm.name,
+                "nbytes": len(data),
+                "sample_rate": sample_rate,
+                "words": words
+            }
+            if grammar is not None:
+                request["grammar"] = grammar
+            return self._request(request)["result"]
+    
+    def accept(self, audio, sample_rate, grammar=None):
+        """
+        Feed audio to this connection's streaming recognizer.
+        
+        Args:
+            audio (numpy.ndarray): 16-bit mono audio following the previous call's
+            sample_rate (int): Sample rate of the audio
+            grammar (str): Optional JSON list of allowed phrases
+        
+        Returns:
+            tuple: (True and the Vosk result if an utterance ended, else
+                False and the partial result)
+        """
+        data = audio.tobytes()
+        with self._lock:
+            self._ensure_buffer(len(data))
+            self.shm.buf[:len(data)] = data
+            
+            request = {"op": "accept", "shm": self.shm.name, "nbytes": len(data), "sample_rate": sample_rate}
+            if grammar is not None:
+                request["grammar"] = grammar
+            reply = self._request(request)
+        return reply["final"], reply["result"]
+    
+    def reset(self, sample_rate, grammar=None):
+        """
+        Start the streaming recognizer of accept() over.
+        
+        Args:
+            sample_rate (int): Sample rate given to accept()
+            grammar (str): Grammar given to accept()
+        """
+        request = {"op": "reset", "sample_rate": sample_rate}
+        if grammar is not None:
+            request["grammar"] = grammar
+        self._request(request)
+    
+    def close(self):
+        """Close the connection and free the audio buffer."""
+        try:
+            self.reader.close()
+            self.sock.close()
+        finally:
+            if self.shm is not None:
+                self.shm.close()
+                self.shm.unlink()
+                self.shm = None
+
+
+def main():
+    """Run the model server until interrupted."""
+    parser = argparse.ArgumentParser(description="Wakeon resident model server")
+    parser.add_argument("--socket", default=getattr(config, "MODEL_SERVER_SOCKET", DEFAULT_SOCKET_PATH),
+                        help="Unix domain socket path")
+    parser.add_argument("--model", default=config.VOSK_MODEL_PATH, help="Vosk model directory")
+    args = parser.parse_args()
+    
+    logging.basicConfig(
+        level=getattr(logging, config.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    try:
+        server = ModelServer(args.socket, args.model)
+    except Exception as e:
+        logger.error(f"Failed to start model server: {e}")
+        sys.exit(1)
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down model server...")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Built-in sampling profiler with per-stage attribution
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Stages whose allocations are traced when allocation tracing is on
+TRACED_STAGES = ("capture", "recognition")
+
+# Stage per thread, keyed by thread id; threads not in a stage are idle
+_stages = {}
+_active_profiler = None
+
+
+@contextmanager
+def stage(name):
+    """
+    Mark the pipeline stage the assistant is in.
+    
+    Cheap enough to leave in place when no profiler is running.
+    
+    Args:
+        name (str): Stage name, e.g. "wake", "capture", "recognition", "ai", "tts"
+    """
+    ident = threading.get_ident()
+    previous = _stages.get(ident)
+    _stages[ident] = name
+    profiler = _active_profiler
+    if profiler is not None:
+        profiler._enter_stage(name)
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler._exit_stage(name)
+        if previous is None:
+            _stages.pop(ident, None)
+        else:
+            _stages[ident] = previous
+
+
+def current_stage():
+    """
+    Get the pipeline stage of the calling thread.
+    
+    Returns:
+        str: Stage name
+    """
+    return _stages.get(threading.get_ident(), "idle")
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's Python stack at a fixed interval.
+    
+    Each sample is filed under its thread's pipeline stage and thread name.
+    Time spent inside native extensions (Porcupine, Vosk, numpy) shows up
+    under the Python frame that called into them, because the sampler runs
+    whenever the extension releases the GIL.
+    """
+    
+    def __init__(self, interval=0.005, trace_allocations=False, top_n=25):
+        """
+        Initialize the profiler.
+        
+        Args:
+            interval (float): Seconds between samples
+            trace_allocations (bool): Trace allocations in TRACED_STAGES
+            top_n (int): Number of entries in the allocation report
+        """
+        self.interval = interval
+        self.trace_allocations = trace_allocations
+        self.top_n = top_n
+        self.stacks = Counter()
+        self.samples = 0
+        self.allocations = Counter()
+        self.peaks = {}
+        self._snapshots = {}
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start sampling in a background thread."""
+        global _active_profiler
+        if self.trace_allocations:
+            tracemalloc.start(25)
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        _active_profiler = self
+        logger.info(f"Profiler started ({1 / self.interval:.0f} Hz)")
+    
+    def stop(self):
+        """Stop sampling."""
+        global _active_profiler
+        _active_profiler = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.trace_allocations:
+            tracemalloc.stop()
+        logger.info(f"Profiler stopped after {self.samples} samples")
+    
+    def _run(self):
+        """Sampling loop."""
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stages = dict(_stages)
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                frames.append(stages.get(ident, "idle"))
+                self.stacks[";".join(reversed(frames))] += 1
+            self.samples += 1
+    
+    def _enter_stage(self, name):
+        """Snapshot allocations when a traced stage starts."""
+        if self.trace_allocations and name in TRACED_STAGES and tracemalloc.is_tracing():
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            self._snapshots[name] = tracemalloc.take_snapshot()
+    
+    def _exit_stage(self, name):
+        """Accumulate what a traced stage allocated."""
+        before = self._snapshots.pop(name, None)
+        if before is None or not tracemalloc.is_tracing():
+            return
+        self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+        after = tracemalloc.take_snapshot()
+        for stat in after.compare_to(before, "lineno"):
+            if stat.size_diff > 0:
+                frame = stat.traceback[0]
+                self.allocations[(name, f"{frame.filename}:{frame.lineno}")] += stat.size_diff
+    
+    def write_collapsed_stacks(self, path):
+        """
+        Write samples in the collapsed-stack format used by flamegraph tools.
+        
+        Args:
+            path (str): Output file path
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Collapsed stacks written to {path}")
+    
+    def write_allocation_report(self, path):
+        """
+        Write peak memory and the top allocation sites per traced stage.
+        
+        Args:
+            path (str): Output file path
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for name in TRACED_STAGES:
+                f.write(f"== {name} (peak traced memory {self.peaks.get(name, 0) / 1024:.1f} KiB)\n")
+                sites = [(site, size) for (s, site), size in self.allocations.items() if s == name]
+                sites.sort(key=lambda item: item[1], reverse=True)
+                for site, size in sites[:self.top_n]:
+                    f.write(f"{size / 1024:10.1f} KiB  {site}\n")
+                f.write("\n")
+        logger.info(f"Allocation report written to {path}")
+    
+    def stage_summary(self):
+        """
+        Get the share of samples per stage.
+        
+        Returns:
+            dict: Mapping of stage name to fraction of samples
+        """
+        per_stage = Counter()
+        for stack, count in self.stacks.items():
+            per_stage[stack.split(";", 1)[0]] += count
+        total = sum(per_stage.values()) or 1
+        return {name: count / total for name, count in per_stage.most_common()}
+    
+    def write_reports(self, output_dir):
+        """
+        Write all reports into a directory.
+        
+        Args:
+            output_dir (str): Directory for the report files
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.write_collapsed_stacks(os.path.join(output_dir, f"profile-{stamp}.folded"))
+        if self.trace_allocations:
+            self.write_allocation_report(os.path.join(output_dir, f"allocations-{stamp}.txt"))
+        
+        summary = ", ".join(f"{name}={share:.0%}" for name, share in self.stage_summary().items())
+        logger.info(f"Samples per stage: {summary}")
@@ -0,0 +1,165 @@
+"""
+Streaming polyphase resampler, so audio can be captured at the device's native rate
+"""
+
+import logging
+import math
+from math import gcd
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Input samples processed per vectorized step, bounding the temporary arrays
+BLOCK_SAMPLES = 16384
+
+
+def downmix(audio):
+    """
+    Average the channels of multi-channel audio into one.
+    
+    Args:
+        audio (numpy.ndarray): Samples of shape (frames,) or (frames, channels)
+    
+    Returns:
+        numpy.ndarray: float32 mono samples
+    """
+    audio = np.asarray(audio)
+    if audio.ndim == 2:
+        if audio.shape[1] == 1:
+            return audio[:, 0].astype(np.float32)
+        return audio.mean(axis=1, dtype=np.float32)
+    return audio.astype(np.float32)
+
+
+class PolyphaseResampler:
+    """
+    Rational-ratio resampler (e.g. 48 kHz or 44.1 kHz to 16 kHz) for streaming blocks.
+    
+    The low-pass filter is a Kaiser-windowed sinc whose stopband starts at
+    the lower Nyquist frequency, so nothing above 8 kHz folds back into a
+    16 kHz output, and whose passband reaches to within `transition` of it
+    (7 kHz for 16 kHz output), where fricatives still carry energy. It is
+    split into one filter per phase so only the taps that hit real input
+    samples are computed. Each block is resampled with one gather and one multiply-add
+    over all its output samples; the last input samples and the output
+    position are carried over, so feeding a signal in blocks of any size
+    gives the same result as feeding it at once.
+    """
+    
+    def __init__(self, in_rate, out_rate, attenuation_db=80.0, transition=0.125, taps_per_phase=None):
+        """
+        Initialize the resampler.
+        
+        Args:
+            in_rate (int): Input sample rate in Hz
+            out_rate (int): Output sample rate in Hz
+            attenuation_db (float): Stopband attenuation, which sets the Kaiser window shape
+            transition (float): Width of the transition band as a fraction of
+                the lower Nyquist frequency; narrower needs a longer filter
+            taps_per_phase (int): Filter length per phase; by default the
+                shortest that meets attenuation_db over the transition band
+        """
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy not available. Install with: pip install numpy")
+        
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        divisor = gcd(self.in_rate, self.out_rate)
+        self.up = self.out_rate // divisor
+        self.down = self.in_rate // divisor
+        
+        # Transition band just below the lower Nyquist frequency, in cycles per input sample
+        nyquist = min(self.in_rate, self.out_rate) / 2.0
+        width = transition * nyquist / self.in_rate
+        if taps_per_phase is None:
+            # Kaiser's estimate of the filter length, in input samples
+            taps_per_phase = int(math.ceil((attenuation_db - 7.95) / (2.285 * 2 * math.pi * width))) + 1
+        self.taps_per_phase = taps_per_phase
+        beta = 0.1102 * (attenuation_db - 8.7) if attenuation_db > 50 else 5.0
+        
+        # Prototype filter at the upsampled rate, normalized so each phase has unit gain;
+        # the cutoff sits mid-transition, so the stopband starts at the lower Nyquist frequency
+        length = taps_per_phase * self.up
+        cutoff = (nyquist / self.in_rate - width / 2) / self.up
+        n = np.arange(length) - (length - 1) / 2.0
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta)
+        prototype *= self.up / prototype.sum()
+        
+        # phases[p, k] = prototype[p + k * up]
+        self.phases = prototype.reshape(taps_per_phase, self.up).T.astype(np.float32)
+        
+        self.reset()
+    
+    @property
+    def passthrough(self):
+        """bool: Input and output rates are equal."""
+        return self.up == self.down
+    
+    def reset(self):
+        """Forget the carried-over input, e.g. before an unrelated recording."""
+        self._history = np.zeros(self.taps_per_phase - 1, dtype=np.float32)
+        self._consumed = 0
+        self._produced = 0
+    
+    def process(self, audio):
+        """
+        Resample the next block of a stream.
+        
+        Args:
+            audio (numpy.ndarray): Samples of shape (frames,) or (frames, channels);
+                multi-channel input is downmixed to mono first
+        
+        Returns:
+            numpy.ndarray: Mono samples at the output rate; int16 for int16
+                input, float32 otherwise
+        """
+        integer = np.asarray(audio).dtype == np.int16
+        mono = downmix(audio)
+        
+        if self.passthrough:
+            output = mono
+        else:
+            parts = [self._process_block(mono[i:i + BLOCK_SAMPLES]) for i in range(0, len(mono), BLOCK_SAMPLES)]
+            output = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+        
+        if integer:
+            return np.clip(np.rint(output), -32768, 32767).astype(np.int16)
+        return output
+    
+    def _process_block(self, block):
+        """Resample one bounded block of mono float32 samples."""
+        buffer = np.concatenate([self._history, block])
+        total = self._consumed + len(block)
+        
+        # Output m uses the input samples up to (m * down) // up
+        end = (total * self.up + self.down - 1) // self.down
+        positions = np.arange(self._produced, end, dtype=np.int64) * self.down
+        newest = positions // self.up - (self._consumed - len(self._history))
+        indices = newest[:, np.newaxis] - np.arange(self.taps_per_phase)
+        output = np.einsum("ij,ij->i", buffer[indices], self.phases[positions % self.up])
+        
+        self._history = buffer[len(buffer) - len(self._history):]
+        self._consumed = total
+        self._produced = end
+        return output.astype(np.float32)
+
+
+def resample(audio, in_rate, out_rate):
+    """
+    Resample a complete recording.
+    
+    Args:
+        audio (numpy.ndarray): Samples of shape (frames,) or (frames, channels)
+        in_rate (int): Input sample rate in Hz
+        out_rate (int): Output sample rate in Hz
+    
+    Returns:
+        numpy.ndarray: Mono samples at out_rate, int16 for int16 input
+    """
+    return PolyphaseResampler(in_rate, out_rate).process(audio)
@@ -0,0 +1,545 @@
+"""
+Speaker verification on the wake word, so only enrolled users start a turn
+
+Usage:
+    python -m src.speaker_verification enroll alice alice1.wav alice2.wav
+    python -m src.speaker_verification enroll bob --record 3
+    python -m src.speaker_verification list
+    python -m src.speaker_verification score recording.wav
+    python -m src.speaker_verification remove bob
+
+Each enrolled user is one voice embedding, computed from their recordings
+once at enrollment and kept in SPEAKER_PROFILES_PATH. After a wake word,
+the buffered keyword audio is embedded and compared with every profile in
+one matrix product; below SPEAKER_THRESHOLD the turn is dropped before any
+recording, recognition or AI request.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+
+import config
+from src import metrics
+from src.audio_io import get_audio_backend, read_wav
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import vosk
+    VOSK_AVAILABLE = True
+except ImportError:
+    VOSK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SPEAKER_SETTINGS = {
+    "SPEAKER_VERIFY_ENABLED", "SPEAKER_PROFILES_PATH", "SPEAKER_EMBEDDING",
+    "SPEAKER_MODEL_PATH", "SPEAKER_THRESHOLD",
+}
+
+# Cosine similarity a keyword must reach, per embedding; tune with the score command
+DEFAULT_THRESHOLDS = {"mfcc": 0.85, "vosk": 0.5}
+
+# MFCC analysis: 25 ms frames every 10 ms, 26 mel bands, 20 cepstra of which c0 is dropped
+FRAME_SECONDS = 0.025
+HOP_SECONDS = 0.010
+MEL_BANDS = 26
+CEPSTRA = 20
+CEPSTRAL_LIFTER = 22
+
+# Frames this far below the loudest are silence around the keyword
+VOICED_RANGE_DB = 30.0
+
+# Voiced frames needed for an embedding (0.2 s)
+MIN_VOICED_FRAMES = 20
+
+SpeakerMatch = namedtuple("SpeakerMatch", ["speaker", "score", "accepted"])
+
+
+class MfccEmbedder:
+    """
+    Voice embedding from cepstral statistics; needs nothing but numpy.
+    
+    The mean and standard deviation of the liftered MFCCs over the voiced
+    frames describe the talker's vocal tract and how much it moves, in 38
+    numbers. Filter banks are cached per sample rate.
+    """
+    
+    name = "mfcc"
+    
+    def __init__(self):
+        """Initialize the embedder."""
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy not available. Install with: pip install numpy")
+        self._banks = {}
+    
+    def _filter_bank(self, sample_rate):
+        """Get the window, mel filter bank and DCT matrix for a sample rate."""
+        bank = self._banks.get(sample_rate)
+        if bank is not None:
+            return bank
+        
+        frame_length = int(FRAME_SECONDS * sample_rate)
+        n_fft = 1 << (frame_length - 1).bit_length()
+        
+        # Triangular filters spaced evenly on the mel scale up to 8 kHz
+        def to_mel(hz):
+            return 2595 * np.log10(1 + hz / 700)
+        
+        edges_mel = np.linspace(to_mel(50.0), to_mel(min(8000.0, sample_rate / 2)), MEL_BANDS + 2)
+        edges = 700 * (10 ** (edges_mel / 2595) - 1)
+        freqs = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+        rising = (freqs[np.newaxis, :] - edges[:-2, np.newaxis]) / (edges[1:-1] - edges[:-2])[:, np.newaxis]
+        falling = (edges[2:, np.newaxis] - freqs[np.newaxis, :]) / (edges[2:] - edges[1:-1])[:, np.newaxis]
+        mel = np.maximum(0.0, np.minimum(rising, falling)).T
+        
+        # DCT-II rows c1..c19 with sinusoidal liftering, so no coefficient dominates the cosine
+        k = np.arange(1, CEPSTRA)
+        dct = np.cos(np.pi * k[np.newaxis, :] * (np.arange(MEL_BANDS)[:, np.newaxis] + 0.5) / MEL_BANDS)
+        dct *= 1 + (CEPSTRAL_LIFTER / 2) * np.sin(np.pi * k / CEPSTRAL_LIFTER)
+        
+        bank = self._banks[sample_rate] = (np.hamming(frame_length), n_fft, mel, dct)
+        return bank
+    
+    def embed(self, audio, sample_rate):
+        """
+        Embed an utterance.
+        
+        Args:
+            audio (numpy.ndarray): 16-bit mono audio
+            sample_rate (int): Sample rate in Hz
+        
+        Returns:
+            numpy.ndarray: Unit-length float32 embedding, or None if the
+                audio holds too little voice
+        """
+        window, n_fft, mel, dct = self._filter_bank(sample_rate)
+        hop = int(HOP_SECONDS * sample_rate)
+        samples = np.asarray(audio, dtype=np.float32)
+        if len(samples) < len(window) + hop * MIN_VOICED_FRAMES:
+            return None
+        samples = np.append(samples[0], samples[1:] - 0.97 * samples[:-1])
+        
+        count = 1 + (len(samples) - len(window)) // hop
+        index = np.arange(len(window))[np.newaxis, :] + hop * np.arange(count)[:, np.newaxis]
+        frames = samples[index] * window
+        
+        energy = np.log(np.sum(frames ** 2, axis=1) + 1e-6)
+        voiced = energy > energy.max() - VOICED_RANGE_DB * math.log(10) / 10
+        if np.count_nonzero(voiced) < MIN_VOICED_FRAMES:
+            return None
+        
+        power = np.abs(np.fft.rfft(frames[voiced], n=n_fft)) ** 2
+        cepstra = np.log(power @ mel + 1e-6) @ dct
+        return _normalize(np.concatenate([cepstra.mean(axis=0), cepstra.std(axis=0)]))
+
+
+class VoskSpeakerEmbedder:
+    """x-vector from a Vosk speaker model (vosk-model-spk); more robust, 128 numbers."""
+    
+    name = "vosk"
+    
+    def __init__(self, model, model_path=None):
+        """
+        Initialize the embedder.
+        
+        Args:
+            model (vosk.Model): Loaded Vosk model, shared with speech recognition
+            model_path (str): Speaker model directory; defaults to SPEAKER_MODEL_PATH
+        """
+        if not VOSK_AVAILABLE:
+            raise ImportError("Vosk not available. Install with: pip install vosk")
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy not available. Install with: pip install numpy")
+        
+        model_path = model_path or getattr(config, "SPEAKER_MODEL_PATH", "models/vosk-model-spk-0.4")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Vosk speaker model not found at {model_path}")
+        self.model = model
+        self.spk_model = vosk.SpkModel(model_path)
+        self._recognizers = {}
+    
+    def embed(self, audio, sample_rate):
+        """Embed an utterance; see MfccEmbedder.embed()."""
+        rec = self._recognizers.get(sample_rate)
+        if rec is None:
+            rec = self._recognizers[sample_rate] = vosk.KaldiRecognizer(self.model, sample_rate)
+            rec.SetSpkModel(self.spk_model)
+        
+        rec.AcceptWaveform(np.asarray(audio, dtype=np.int16).tobytes())
+        vector = json.loads(rec.FinalResult()).get("spk")
+        rec.Reset()
+        return _normalize(np.asarray(vector, dtype=np.float32)) if vector else None
+
+
+def _normalize(vector):
+    """Scale a vector to unit length, so a dot product is the cosine similarity."""
+    norm = float(np.linalg.norm(vector))
+    return (vector / norm).astype(np.float32) if norm > 0 else None
+
+
+def create_speaker_embedder(model=None):
+    """
+    Create the embedder named by SPEAKER_EMBEDDING.
+    
+    Args:
+        model (vosk.Model): Loaded Vosk model for the "vosk" embedder;
+            VOSK_MODEL_PATH is loaded if not given
+    
+    Returns:
+        MfccEmbedder or VoskSpeakerEmbedder: The embedder
+    """
+    kind = getattr(config, "SPEAKER_EMBEDDING", "mfcc")
+    if kind == "vosk":
+        if model is None and VOSK_AVAILABLE:
+            model = vosk.Model(config.VOSK_MODEL_PATH)
+        return VoskSpeakerEmbedder(model)
+    if kind != "mfcc":
+        raise ValueError(f"Unknown SPEAKER_EMBEDDING '{kind}'")
+    return MfccEmbedder()
+
+
+class SpeakerProfiles:
+    """
+    Enrolled voice embeddings, stored in one .npz file.
+    
+    Each speaker is kept as the sum of their unit-length utterance
+    embeddings, so more recordings can be added later; matrix() stacks the
+    normalized sums for scoring.
+    """
+    
+    def __init__(self, path=None, embedder_name=None):
+        """
+        Load the profiles, or start empty if the file does not exist.
+        
+        Args:
+            path (str): Profile file; defaults to SPEAKER_PROFILES_PATH
+            embedder_name (str): Embedding the profiles must have been made
+                with; defaults to SPEAKER_EMBEDDING
+        """
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy not available. Install with: pip install numpy")
+        
+        self.path = path or getattr(config, "SPEAKER_PROFILES_PATH", "models/speakers.npz")
+        self.embedder_name = embedder_name or getattr(config, "SPEAKER_EMBEDDING", "mfcc")
+        self.names = []
+        self.sums = None
+        self.counts = []
+        
+        if os.path.exists(self.path):
+            with np.load(self.path) as data:
+                stored = str(data["embedder"])
+                if stored != self.embedder_name:
+                    raise ValueError(
+                        f"{self.path} was enrolled with the '{stored}' embedding, not "
+                        f"'{self.embedder_name}'; enroll again or change SPEAKER_EMBEDDING"
+                    )
+                self.names = [str(name) for name in data["names"]]
+                self.sums = data["sums"].astype(np.float32)
+                self.counts = [int(count) for count in data["counts"]]
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def add(self, name, embeddings):
+        """
+        Enroll a speaker, or add recordings to an enrolled one.
+        
+        Args:
+            name (str): Speaker name
+            embeddings (list): Unit-length embeddings of their recordings
+        """
+        total = np.sum(embeddings, axis=0).astype(np.float32)
+        if name in self.names:
+            index = self.names.index(name)
+            self.sums[index] += total
+            self.counts[index] += len(embeddings)
+            return
+        
+        self.names.append(name)
+        self.counts.append(len(embeddings))
+        self.sums = total[np.newaxis, :] if self.sums is None else np.vstack([self.sums, total])
+    
+    def remove(self, name):
+        """
+        Forget a speaker.
+        
+        Returns:
+            bool: True if the speaker was enrolled
+        """
+        if name not in self.names:
+            return False
+        index = self.names.index(name)
+        del self.names[index]
+        del self.counts[index]
+        self.sums = np.delete(self.sums, index, axis=0) if self.names else None
+        return True
+    
+    def matrix(self):
+        """
+        Get one unit-length embedding per speaker.
+        
+        Returns:
+            numpy.ndarray: float32 array of shape (speakers, dimensions)
+        """
+        if self.sums is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.sums / np.linalg.norm(self.sums, axis=1, keepdims=True)
+    
+    def save(self):
+        """Write the profiles to their file."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "wb") as f:
+            np.savez(
+                f,
+                embedder=np.array(self.embedder_name),
+                names=np.array(self.names),
+                sums=self.sums if self.sums is not None else np.zeros((0, 0), dtype=np.float32),
+                counts=np.array(self.counts, dtype=np.int64),
+            )
+
+
+class SpeakerVerifier:
+    """Accepts a wake word only if it sounds like an enrolled speaker."""
+    
+    def __init__(self, embedder, profiles, threshold=None):
+        """
+        Initialize the verifier.
+        
+        Args:
+            embedder (MfccEmbedder or VoskSpeakerEmbedder): Embedding the
+                profiles were enrolled with
+            profiles (SpeakerProfiles): Enrolled speakers
+            threshold (float): Lowest cosine similarity accepted; defaults to
+                SPEAKER_THRESHOLD, or the embedder's default if that is unset
+        """
+        if threshold is None:
+            threshold = getattr(config, "SPEAKER_THRESHOLD", None)
+        if threshold is None or threshold == "":
+            threshold = DEFAULT_THRESHOLDS.get(embedder.name, 0.7)
+        
+        self.embedder = embedder
+        self.names = list(profiles.names)
+        self.matrix = profiles.matrix()
+        self.threshold = float(threshold)
+        
+        self.checks = 0
+        self.rejected = 0
+        self.no_voice = 0
+        self.accepted_by_speaker = Counter()
+        self.latency = metrics.get_stats("speaker.verify")
+        self._lock = threading.Lock()
+    
+    def scores(self, audio, sample_rate):
+        """
+        Score an utterance against every enrolled speaker.
+        
+        Args:
+            audio (numpy.ndarray): 16-bit mono audio
+            sample_rate (int): Sample rate in Hz
+        
+        Returns:
+            numpy.ndarray: Cosine similarity per speaker in profile order,
+                or None if the audio holds too little voice
+        """
+        embedding = self.embedder.embed(audio, sample_rate)
+        if embedding is None:
+            return None
+        if embedding.shape[0] != self.matrix.shape[1]:
+            raise ValueError(
+                f"Embedding has {embedding.shape[0]} dimensions, profiles have {self.matrix.shape[1]}"
+            )
+        return self.matrix @ embedding
+    
+    def verify(self, audio, sample_rate):
+        """
+        Check who said the wake word and record the outcome.
+        
+        Args:
+            audio (numpy.ndarray): 16-bit mono keyword audio
+            sample_rate (int): Sample rate of the audio
+        
+        Returns:
+            SpeakerMatch: Closest speaker, their score and whether it passed
+                the threshold; speaker and score are None without enough voice
+        """
+        start = time.monotonic()
+        scores = self.scores(audio, sample_rate)
+        if scores is None:
+            match = SpeakerMatch(None, None, False)
+        else:
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            match = SpeakerMatch(self.names[best], score, score >= self.threshold)
+        self.latency.record(time.monotonic() - start)
+        
+        with self._lock:
+            self.checks += 1
+            if match.accepted:
+                self.accepted_by_speaker[match.speaker] += 1
+            else:
+                self.rejected += 1
+                if match.speaker is None:
+                    self.no_voice += 1
+        return match
+    
+    def rejection_rate(self):
+        """
+        Get the share of wake words rejected.
+        
+        Returns:
+            float: Rejected checks divided by all checks
+        """
+        with self._lock:
+            return self.rejected / self.checks if self.checks else 0.0
+    
+    def log_summary(self):
+        """Log check counts, rejection rate, accepted turns per speaker and latency."""
+        summary = self.latency.summary()
+        p50 = f"{summary['p50'] * 1000:.1f}ms" if summary["p50"] is not None else "n/a"
+        p95 = f"{summary['p95'] * 1000:.1f}ms" if summary["p95"] is not None else "n/a"
+        speakers = ", ".join(f"{name} {count}" for name, count in self.accepted_by_speaker.most_common())
+        logger.info(
+            f"Speaker verification: {self.checks} checks, {self.rejected} rejected "
+            f"(rejection rate {self.rejection_rate():.1%}, {self.no_voice} without enough voice), "
+            f"latency p50 {p50} p95 {p95}; accepted: {speakers or 'none'}"
+        )
+
+
+def create_speaker_verifier(model=None):
+    """
+    Create the verifier if SPEAKER_VERIFY_ENABLED is set.
+    
+    Args:
+        model (vosk.Model): Loaded Vosk model for the "vosk" embedding
+    
+    Returns:
+        SpeakerVerifier: The verifier, or None if disabled, numpy is missing
+            or nobody is enrolled
+    """
+    if not getattr(config, "SPEAKER_VERIFY_ENABLED", False):
+        return None
+    if not NUMPY_AVAILABLE:
+        logger.warning("numpy not available; speaker verification disabled")
+        return None
+    
+    profiles = SpeakerProfiles()
+    if not len(profiles):
+        logger.warning(f"No speakers enrolled in {profiles.path}; speaker verification disabled. "
+                       f"Enroll with: python -m src.speaker_verification enroll NAME WAV...")
+        return None
+    
+    verifier = SpeakerVerifier(create_speaker_embedder(model), profiles)
+    logger.info(f"Speaker verification enabled for {', '.join(profiles.names)} "
+                f"({profiles.embedder_name} embedding, threshold {verifier.threshold:.2f})")
+    return verifier
+
+
+def _record_utterances(count, seconds):
+    """Record utterances from the microphone for enrollment."""
+    sample_rate = config.SAMPLE_RATE
+    recordings = []
+    for i in range(count):
+        input(f"Recording {i + 1}/{count}: press Enter, then say '{config.WAKE_WORD}'... ")
+        audio = get_audio_backend().record(int(seconds * sample_rate), sample_rate)
+        recordings.append((audio.reshape(-1).astype(np.int16), sample_rate))
+    return recordings
+
+
+def main():
+    """Enroll, list, score and remove speakers from the command line."""
+    parser = argparse.ArgumentParser(description="Speaker profiles for wake word speaker verification")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enroll = commands.add_parser("enroll", help="Enroll a speaker, or add recordings to one")
+    enroll.add_argument("name", help="Speaker name")
+    enroll.add_argument("wavs", nargs="*", help="16-bit mono WAV files of them saying the wake word")
+    enroll.add_argument("--record", type=int, default=0, metavar="N",
+                        help="Record N utterances from the microphone instead")
+    enroll.add_argument("--seconds", type=float, default=getattr(config, "WAKE_BUFFER_SECONDS", 1.5),
+                        help="Length of each recording (default: WAKE_BUFFER_SECONDS)")
+    commands.add_parser("list", help="List enrolled speakers")
+    score = commands.add_parser("score", help="Score recordings against every speaker, to tune the threshold")
+    score.add_argument("wavs", nargs="+", help="16-bit mono WAV files")
+    remove = commands.add_parser("remove", help="Remove a speaker")
+    remove.add_argument("name", help="Speaker name")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL), format="%(levelname)s - %(message)s")
+    if not NUMPY_AVAILABLE:
+        print("Error: numpy not available. Install with: pip install numpy")
+        sys.exit(1)
+    
+    try:
+        profiles = SpeakerProfiles()
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    if args.command == "list":
+        if not len(profiles):
+            print(f"No speakers enrolled in {profiles.path}")
+        for name, count in zip(profiles.names, profiles.counts):
+            print(f"  {name}: {count} recordings")
+        return
+    
+    if args.command == "remove":
+        if not profiles.remove(args.name):
+            print(f"Error: '{args.name}' is not enrolled")
+            sys.exit(1)
+        profiles.save()
+        print(f"Removed {args.name}")
+        return
+    
+    embedder = create_speaker_embedder()
+    
+    if args.command == "score":
+        if not len(profiles):
+            print(f"Error: no speakers enrolled in {profiles.path}")
+            sys.exit(1)
+        verifier = SpeakerVerifier(embedder, profiles)
+        print(f"Threshold {verifier.threshold:.2f}")
+        for path in args.wavs:
+            scores = verifier.scores(*read_wav(path))
+            if scores is None:
+                print(f"  {path}: not enough voice")
+                continue
+            ranked = sorted(zip(verifier.names, scores), key=lambda item: -item[1])
+            print(f"  {path}: " + ", ".join(f"{name} {value:.3f}" for name, value in ranked))
+        return
+    
+    recordings = [read_wav(path) for path in args.wavs]
+    if args.record:
+        recordings += _record_utterances(args.record, args.seconds)
+    if not recordings:
+        print("Error: give WAV files or --record N")
+        sys.exit(1)
+    
+    embeddings = [embedder.embed(audio, sample_rate) for audio, sample_rate in recordings]
+    usable = [embedding for embedding in embeddings if embedding is not None]
+    if len(usable) < len(embeddings):
+        print(f"Skipped {len(embeddings) - len(usable)} recordings with too little voice")
+    if not usable:
+        print("Error: no usable recordings")
+        sys.exit(1)
+    
+    profiles.add(args.name, usable)
+    profiles.save()
+    print(f"Enrolled {args.name} with {len(usable)} recordings in {profiles.path}")
+
+
+if __name__ == "__main__":
+    main()
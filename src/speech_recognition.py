@@ -3,20 +3,47 @@ Speech Recognition using Vosk
 """
 
 import logging
+from collections import deque
+
 import config
+from src import metrics, profiler
+from src.audio_io import get_audio_backend, get_clock
+from src.latency_budget import STAGE_ASR
+from src.model_manager import ModelManager
+from src.model_server import ModelServerClient, ModelServerError
+from src.resampler import PolyphaseResampler
+from src.speech_enhancer import create_speech_enhancer
+from src.transcript_gate import TranscriptGate, parse_result
+from src.voice_activity import EVENT_END, EVENT_START, VoiceActivityDetector
 
 # Try to import optional dependencies
 try:
-    import sounddevice as sd
-    import numpy as np
     import json
     import vosk
     VOSK_AVAILABLE = True
 except ImportError:
     VOSK_AVAILABLE = False
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Silence decoded by prewarm()
+PREWARM_SECONDS = 0.2
+
+# Longest command recorded in small-footprint mode
+SMALL_FOOTPRINT_RECORD_SECONDS = 10
+
+# Frame read from the follow-up input stream (512 samples at 16 kHz)
+FOLLOW_UP_FRAME_SECONDS = 0.032
+
+# Audio kept from before speech was detected, so the first word is not clipped
+FOLLOW_UP_PREROLL_SECONDS = 0.3
+
 
 class SpeechRecognizer:
     """Handles speech-to-text conversion using Vosk."""
@@ -25,93 +52,391 @@ class SpeechRecognizer:
         """Initialize the speech recognizer."""
         logger.info("Initializing speech recognizer...")
         
+        self.model = None
+        self.server = None
+        self.models = None
+        self.language = None
+        
+        # Transcripts of noise are rejected here instead of costing an AI call
+        self.gate = TranscriptGate() if getattr(config, "ASR_GATE_ENABLED", True) else None
+        self.last_transcript = None
+        self.resampler = None
+        
+        # Input stream and voice activity detector for follow-ups, opened on
+        # first use and kept between turns
+        self.follow_up_stream = None
+        self.vad = None
+        self.speech_started_at = None
+        # Audio of the last follow-up, for speaker verification
+        self.follow_up_audio = None
+        self.follow_up_wait_stats = metrics.get_stats("follow_up.speech_start")
+        
+        # Optional high-pass, noise suppression and AGC before decoding
+        self.enhancer = create_speech_enhancer(config.SAMPLE_RATE)
+        
+        # Attach to a resident model server instead of loading our own model
+        if getattr(config, "MODEL_SERVER_SOCKET", None):
+            try:
+                self.server = ModelServerClient(config.MODEL_SERVER_SOCKET)
+                self.use_fallback = False
+                logger.info(f"Speech recognizer attached to model server ({self.server.model_path})")
+                return
+            except ModelServerError as e:
+                logger.warning(f"{e}. Loading the model in-process.")
+        
         if not VOSK_AVAILABLE:
             logger.warning("Vosk not available. Using fallback speech recognition.")
             self.use_fallback = True
             return
         
         try:
+            # Models per language; the default one is loaded now and stays resident
+            self.models = ModelManager()
+            self.language = self.models.default_language
+            model_path = self.models.languages[self.language]["model_path"]
+            
             # Initialize Vosk model
-            if not vosk.Model.exists(config.VOSK_MODEL_PATH):
-                logger.warning(f"Vosk model not found at {config.VOSK_MODEL_PATH}")
+            if not vosk.Model.exists(model_path):
+                logger.warning(f"Vosk model not found at {model_path}")
                 logger.info("Please download a Vosk model from https://alphacephei.com/vosk/models")
                 logger.info("For now, using fallback speech recognition...")
                 self.use_fallback = True
             else:
-                self.model = vosk.Model(config.VOSK_MODEL_PATH)
-                self.rec = vosk.KaldiRecognizer(self.model, config.SAMPLE_RATE)
+                self.model = self.models.get_model(self.language)
+                self.rec = self._make_recognizer(self.model)
                 self.use_fallback = False
                 logger.info("Speech recognizer initialized with Vosk")
-                
+        
         except Exception as e:
             logger.error(f"Failed to initialize speech recognizer: {e}")
             self.use_fallback = True
     
-    def listen_for_command(self, timeout=config.TIMEOUT_SECONDS):
+    def listen_for_command(self, timeout=None, budget=None, language=None):
         """
         Listen for a voice command.
         
         Args:
             timeout (int): Maximum time to listen in seconds
-            
+            budget (LatencyBudget): Turn budget, started at end of speech
+            language (str): Language of the command; defaults to the default language
+        
         Returns:
-            str: Recognized text or None if no speech detected
+            str: Recognized text, or None if no speech was detected or the
+                transcript was rejected (see last_transcript)
         """
         logger.debug("Listening for command...")
+        self.last_transcript = None
+        
+        if timeout is None:
+            timeout = config.TIMEOUT_SECONDS
+        if getattr(config, "SMALL_FOOTPRINT", False):
+            limit = getattr(config, "SMALL_FOOTPRINT_RECORD_SECONDS", SMALL_FOOTPRINT_RECORD_SECONDS)
+            timeout = min(timeout, limit)
         
         if self.use_fallback:
-            return self._fallback_listen()
+            command = self._fallback_listen()
+            if budget is not None:
+                budget.start()
+            return command
         
         try:
+            # Load the language's model while the user is speaking
+            self._select_language(language)
+            
             # Record audio
-            audio_data = self._record_audio(timeout)
+            with profiler.stage("capture"):
+                audio_data = self._record_audio(timeout)
+            
+            if budget is not None:
+                budget.start()
             
             if audio_data is None:
                 return None
             
-            # Process with Vosk
-            if self.rec.AcceptWaveform(audio_data.tobytes()):
-                result = json.loads(self.rec.Result())
-                text = result.get('text', '').strip()
-                
-                if text:
-                    logger.info(f"Recognized: {text}")
-                    return text
-                else:
-                    logger.debug("No speech detected")
-                    return None
-            else:
-                logger.debug("Speech not fully processed")
-                return None
-                
+            with profiler.stage("recognition"):
+                result = self._decode(audio_data)
+            
+            if budget is not None:
+                budget.check(STAGE_ASR)
+            
+            return self._accept(result)
+        
         except Exception as e:
             logger.error(f"Error in speech recognition: {e}")
             return None
     
+    def listen_for_follow_up(self, window, budget=None, language=None):
+        """
+        Listen for a command without a wake word, right after a response.
+        
+        Frames from an input stream that stays open between turns go through
+        voice activity detection. If speech starts within the window, it is
+        decoded while the user is still speaking, and capture stops after
+        FOLLOW_UP_END_SILENCE seconds of silence (or FOLLOW_UP_MAX_SECONDS),
+        instead of recording for the whole timeout.
+        
+        Args:
+            window (float): Seconds to wait for speech to start
+            budget (LatencyBudget): Turn budget, started at end of speech
+            language (str): Language of the command; defaults to the default language
+        
+        Returns:
+            str: Recognized text, or None. last_transcript stays None if
+                nobody spoke within the window.
+        """
+        self.last_transcript = None
+        self.speech_started_at = None
+        self.follow_up_audio = None
+        if self.use_fallback:
+            return None
+        
+        try:
+            self._select_language(language)
+            with profiler.stage("capture"):
+                result = self._capture_follow_up(window)
+            
+            if budget is not None:
+                budget.start()
+            if result is None:
+                return None
+            
+            if budget is not None:
+                budget.check(STAGE_ASR)
+            return self._accept(result)
+        
+        except Exception as e:
+            logger.error(f"Error listening for a follow-up: {e}")
+            return None
+    
+    def _capture_follow_up(self, window):
+        """
+        Wait for speech, then capture and decode it until it ends.
+        
+        With a local model and no enhancer, frames go into the recognizer
+        as they arrive; otherwise the utterance is decoded at its end.
+        
+        Args:
+            window (float): Seconds to wait for speech to start
+        
+        Returns:
+            dict: Vosk result, or None if no speech started in the window
+        """
+        clock = get_clock()
+        frame_length = int(config.SAMPLE_RATE * FOLLOW_UP_FRAME_SECONDS)
+        if self.follow_up_stream is None:
+            self.follow_up_stream = get_audio_backend().open_input(frame_length, config.SAMPLE_RATE)
+            self.vad = VoiceActivityDetector(config.SAMPLE_RATE, frame_length)
+        self.vad.end_silence = getattr(config, "FOLLOW_UP_END_SILENCE", 0.8)
+        self.vad.reset()
+        preroll = deque(maxlen=max(1, int(FOLLOW_UP_PREROLL_SECONDS / FOLLOW_UP_FRAME_SECONDS)))
+        
+        opened_at = clock.monotonic()
+        self.follow_up_stream.start()
+        try:
+            # Wait for speech to start
+            while True:
+                frame = np.asarray(self.follow_up_stream.read(), dtype=np.int16)
+                preroll.append(frame)
+                if self.vad.process(frame) == EVENT_START:
+                    break
+                if clock.monotonic() - opened_at >= window:
+                    logger.debug("No follow-up speech")
+                    return None
+            self.speech_started_at = clock.time()
+            self.follow_up_wait_stats.record(clock.monotonic() - opened_at)
+            logger.debug("Follow-up speech started")
+            
+            streaming = self.server is None and self.enhancer is None
+            frames, segments = list(preroll), []
+            if streaming:
+                for frame in frames:
+                    if self.rec.AcceptWaveform(frame.tobytes()):
+                        segments.append(json.loads(self.rec.Result()))
+            
+            # Capture until the speaker pauses
+            max_frames = int(getattr(config, "FOLLOW_UP_MAX_SECONDS", 10) / FOLLOW_UP_FRAME_SECONDS)
+            while len(frames) < max_frames:
+                frame = np.asarray(self.follow_up_stream.read(), dtype=np.int16)
+                frames.append(frame)
+                if streaming and self.rec.AcceptWaveform(frame.tobytes()):
+                    segments.append(json.loads(self.rec.Result()))
+                if self.vad.process(frame) == EVENT_END:
+                    break
+        finally:
+            self.follow_up_stream.stop()
+        
+        self.follow_up_audio = np.concatenate(frames)
+        with profiler.stage("recognition"):
+            if not streaming:
+                return self._decode(self.follow_up_audio)
+            segments.append(json.loads(self.rec.FinalResult()))
+            return _merge_results(segments)
+    
+    def transcribe(self, audio_data, language=None):
+        """
+        Recognize audio captured elsewhere, e.g. by a capture process.
+        
+        Args:
+            audio_data (numpy.ndarray): 16-bit mono audio at SAMPLE_RATE
+            language (str): Language of the audio; defaults to the default language
+        
+        Returns:
+            str: Recognized text, or None if no speech was detected or the
+                transcript was rejected (see last_transcript)
+        """
+        if self.use_fallback:
+            raise RuntimeError("No speech recognition model available")
+        
+        self.last_transcript = None
+        self._select_language(language)
+        return self._accept(self._decode(audio_data))
+    
+    def _accept(self, result):
+        """
+        Gate a Vosk result and keep it as the last transcript.
+        
+        Args:
+            result (dict): Vosk result with word details
+        
+        Returns:
+            str: Recognized text, or None if empty or rejected
+        """
+        transcript = parse_result(result)
+        if self.gate is not None:
+            transcript = self.gate.check(transcript)
+        self.last_transcript = transcript
+        
+        confidence = "n/a" if transcript.confidence is None else f"{transcript.confidence:.2f}"
+        if not transcript.text:
+            logger.debug("No speech detected")
+            return None
+        if transcript.rejected:
+            logger.info(f"Rejected transcript: {transcript.text} ({transcript.rejected}, confidence {confidence})")
+            return None
+        logger.info(f"Recognized: {transcript.text} (confidence {confidence})")
+        return transcript.text
+    
+    def _select_language(self, language):
+        """
+        Switch the local recognizer to a language's model.
+        
+        Args:
+            language (str): Language code, or None for the default language
+        """
+        if self.models is None or self.server is not None:
+            return
+        
+        model = self.models.get_model(language)
+        language = language or self.models.default_language
+        if language != self.language:
+            self.rec = self._make_recognizer(model)
+            self.language = language
+            logger.debug(f"Recognizing in '{language}'")
+    
+    def prewarm(self, language=None):
+        """
+        Prime the recognizer while the command is still being spoken.
+        
+        Decodes a moment of silence with a throwaway recognizer on the
+        current model, so model pages that were swapped out while idle are
+        back in memory before the real decode. A different language's model
+        is left to listen_for_command(), which loads it anyway.
+        
+        Args:
+            language (str): Language of the coming command; defaults to the default language
+        """
+        if self.use_fallback or self.models is None or self.server is not None:
+            return
+        model = self.models.models.get(self.language)
+        if model is None or (language or self.models.default_language) != self.language:
+            return
+        
+        rec = vosk.KaldiRecognizer(model, config.SAMPLE_RATE)
+        rec.AcceptWaveform(bytes(int(PREWARM_SECONDS * config.SAMPLE_RATE) * 2))
+        rec.FinalResult()
+    
+    def release_idle(self):
+        """
+        Free what only the last turn needed (small-footprint mode).
+        
+        Switches back to the default language, so the models of other
+        languages can be unloaded, and drops the resampler's buffers.
+        """
+        self.resampler = None
+        if self.models is None or self.server is not None:
+            return
+        if self.language != self.models.default_language:
+            self._select_language(None)
+        self.models.release_idle()
+    
+    @staticmethod
+    def _make_recognizer(model):
+        """Create a recognizer that reports per-word confidence and timing."""
+        rec = vosk.KaldiRecognizer(model, config.SAMPLE_RATE)
+        rec.SetWords(True)
+        return rec
+    
+    def _decode(self, audio_data):
+        """
+        Decode recorded audio with the local model or the model server.
+        
+        Args:
+            audio_data (numpy.ndarray): Recorded 16-bit audio
+        
+        Returns:
+            dict: Vosk result
+        """
+        if self.enhancer is not None:
+            audio_data = self.enhancer.enhance(audio_data)
+        
+        if self.server is not None:
+            return self.server.recognize(audio_data, config.SAMPLE_RATE, words=True)
+        
+        # Process with Vosk and finalize whatever is left in the decoder
+        if self.rec.AcceptWaveform(audio_data.tobytes()):
+            return json.loads(self.rec.Result())
+        return json.loads(self.rec.FinalResult())
+    
     def _record_audio(self, timeout):
         """
         Record audio from microphone.
         
+        The device records at its native rate (or CAPTURE_SAMPLE_RATE) and
+        the audio is resampled to SAMPLE_RATE and downmixed to mono here,
+        rather than relying on the host's resampling. A microphone array
+        arrives here already beamformed to one channel (see src.beamformer).
+        In small-footprint mode the device records at SAMPLE_RATE unless
+        CAPTURE_SAMPLE_RATE is set, so the buffer is a third of the size
+        of a 48 kHz one.
+        
         Args:
             timeout (int): Recording timeout in seconds
-            
+        
         Returns:
-            numpy.ndarray: Audio data or None if recording failed
+            numpy.ndarray: Mono audio at SAMPLE_RATE, or None if recording failed
         """
         try:
-            logger.debug(f"Recording audio for {timeout} seconds...")
+            backend = get_audio_backend()
+            native_rate = None if getattr(config, "SMALL_FOOTPRINT", False) else backend.native_sample_rate()
+            capture_rate = int(
+                getattr(config, "CAPTURE_SAMPLE_RATE", None)
+                or native_rate
+                or config.SAMPLE_RATE
+            )
+            logger.debug(f"Recording audio for {timeout} seconds at {capture_rate} Hz...")
             
             # Record audio
-            audio_data = sd.rec(
-                int(timeout * config.SAMPLE_RATE),
-                samplerate=config.SAMPLE_RATE,
-                channels=config.CHANNELS,
-                dtype=np.int16
+            audio_data = backend.record(
+                int(timeout * capture_rate),
+                capture_rate,
+                channels=config.CHANNELS
             )
-            sd.wait()
-            
-            return audio_data
             
+            if self.resampler is None or self.resampler.in_rate != capture_rate:
+                self.resampler = PolyphaseResampler(capture_rate, config.SAMPLE_RATE)
+            self.resampler.reset()
+            return self.resampler.process(audio_data)
+        
         except Exception as e:
             logger.error(f"Error recording audio: {e}")
             return None
@@ -132,7 +457,7 @@ class SpeechRecognizer:
                 return command
             else:
                 return None
-                
+        
         except KeyboardInterrupt:
             return None
         except Exception as e:
@@ -141,27 +466,55 @@ class SpeechRecognizer:
     
     def cleanup(self):
         """Clean up resources."""
+        if getattr(self, 'follow_up_stream', None) is not None:
+            self.follow_up_stream.delete()
+        if getattr(self, 'server', None) is not None:
+            self.server.close()
+        if getattr(self, 'models', None) is not None:
+            self.models.log_summary()
+        if getattr(self, 'gate', None) is not None:
+            self.gate.log_summary()
+        if getattr(self, 'enhancer', None) is not None:
+            self.enhancer.log_summary()
         logger.debug("Speech recognizer cleaned up")
 
 
+def _merge_results(segments):
+    """
+    Join the Vosk results of consecutive segments of one utterance.
+    
+    Args:
+        segments (list): Vosk results with word details
+    
+    Returns:
+        dict: One result with the text and words of all segments
+    """
+    return {
+        "text": " ".join(segment["text"] for segment in segments if segment.get("text")),
+        "result": [word for segment in segments for word in segment.get("result", [])],
+    }
+
+
 class SimpleSpeechRecognizer:
     """Simple speech recognizer for testing."""
     
     def __init__(self):
         """Initialize simple speech recognizer."""
         logger.info("Initializing simple speech recognizer (for testing)")
+        self.last_transcript = None
     
-    def listen_for_command(self, timeout=5):
+    def listen_for_command(self, timeout=5, budget=None, language=None):
         """
         Simulate speech recognition.
         
         Returns:
             str: Simulated command
         """
-        import time
-        time.sleep(1)
+        get_clock().sleep(1)
+        if budget is not None:
+            budget.start()
         return "What's the weather today?"
     
     def cleanup(self):
         """Clean up resources."""
-        logger.debug("Simple speech recognizer cleaned up") 
\ No newline at end of file
+        logger.debug("Simple speech recognizer cleaned up")
\ No newline at end of file
@@ -0,0 +1,613 @@
+"""
+Pipeline stages in separate processes, connected by a shared-memory audio ring
+
+With PROCESS_STAGES=True, capture and wake word detection, speech
+recognition and speech synthesis each run in their own process, so a long
+decode or synthesis can never starve the microphone and a crash in one
+stage does not take down the assistant. The main process keeps the AI
+client and the turn logic, and talks to the stages through proxies with
+the same interface as the in-process components.
+
+Audio flows through one ring buffer in shared memory, written by the
+capture process and read by the recognition process; only positions in the
+ring cross the control queues. A supervisor thread restarts stage processes
+that die.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+
+import config
+from src import profiler
+from src.latency_budget import STAGE_ASR, STAGE_TTS
+from src.model_server import SHARED_MEMORY_AVAILABLE, attach_shared_memory
+
+# Try to import optional dependencies
+try:
+    from multiprocessing import shared_memory
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Porcupine and the capture process work at 16 kHz
+RING_SAMPLE_RATE = 16000
+
+# Operations the synthesis process accepts
+SYNTHESIS_OPS = ("speak", "set_voice_rate", "set_voice_volume", "set_voice")
+
+
+class StageError(Exception):
+    """Raised when a stage process fails, restarts or does not answer in time."""
+
+
+class AudioRing:
+    """
+    Single-writer ring of 16-bit samples in shared memory.
+    
+    The first 8 bytes hold the total number of samples ever written; the
+    writer updates it after the samples, so readers never see a position
+    whose audio is not there yet. Readers address audio by absolute
+    position and find out from the counter whether it has been overwritten.
+    """
+    
+    HEADER_BYTES = 8
+    
+    def __init__(self, shm, capacity, owner):
+        """
+        Wrap a shared-memory segment.
+        
+        Args:
+            shm (SharedMemory): The segment
+            capacity (int): Number of samples the ring holds
+            owner (bool): Whether this process unlinks the segment
+        """
+        self.shm = shm
+        self.capacity = capacity
+        self.owner = owner
+        self._header = np.ndarray((1,), dtype=np.uint64, buffer=shm.buf)
+        self._data = np.ndarray((capacity,), dtype=np.int16, buffer=shm.buf, offset=self.HEADER_BYTES)
+    
+    @classmethod
+    def create(cls, capacity):
+        """
+        Create a new ring.
+        
+        Args:
+            capacity (int): Number of samples the ring holds
+        
+        Returns:
+            AudioRing: The ring, owned by the caller
+        """
+        shm = shared_memory.SharedMemory(create=True, size=cls.HEADER_BYTES + 2 * capacity)
+        ring = cls(shm, capacity, owner=True)
+        ring._header[0] = 0
+        return ring
+    
+    @classmethod
+    def attach(cls, name, capacity):
+        """
+        Attach to a ring created by another process.
+        
+        Args:
+            name (str): Shared-memory segment name
+            capacity (int): Number of samples the ring holds
+        
+        Returns:
+            AudioRing: The ring
+        """
+        return cls(attach_shared_memory(name), capacity, owner=False)
+    
+    @property
+    def name(self):
+        """str: Shared-memory segment name."""
+        return self.shm.name
+    
+    @property
+    def position(self):
+        """int: Total number of samples written so far."""
+        return int(self._header[0])
+    
+    def write(self, samples):
+        """
+        Append samples (single writer only).
+        
+        Args:
+            samples (sequence): 16-bit samples
+        """
+        samples = np.asarray(samples, dtype=np.int16)
+        position = self.position
+        index = position % self.capacity
+        first = min(len(samples), self.capacity - index)
+        self._data[index:index + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self._header[0] = position + len(samples)
+    
+    def read(self, start, count):
+        """
+        Copy samples out of the ring.
+        
+        Args:
+            start (int): Absolute position of the first sample
+            count (int): Number of samples
+        
+        Returns:
+            numpy.ndarray: The samples
+        
+        Raises:
+            StageError: If the samples are not written yet or already overwritten
+        """
+        if count > self.capacity:
+            raise StageError(f"Cannot read {count} samples from a ring of {self.capacity}")
+        if start + count > self.position:
+            raise StageError("Audio not captured yet")
+        
+        index = start % self.capacity
+        first = min(count, self.capacity - index)
+        audio = np.concatenate([self._data[index:index + first], self._data[:count - first]])
+        
+        # Checked after copying: the writer may have lapped us meanwhile
+        if self.position - start > self.capacity:
+            raise StageError("Audio was overwritten before it was read")
+        return audio
+    
+    def wait_until(self, position, timeout):
+        """
+        Wait until the ring has been written up to a position.
+        
+        Args:
+            position (int): Absolute position to wait for
+            timeout (float): Seconds to wait
+        
+        Raises:
+            StageError: If the capture process stops writing
+        """
+        deadline = time.monotonic() + timeout
+        while self.position < position:
+            if time.monotonic() >= deadline:
+                raise StageError("Capture stage stopped delivering audio")
+            time.sleep(0.01)
+    
+    def close(self):
+        """Detach, and free the segment if this process owns it."""
+        del self._header, self._data
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _configure_child_logging(stage_name):
+    """Send a stage process's log records to its stderr."""
+    logging.basicConfig(
+        level=getattr(logging, config.LOG_LEVEL),
+        format=f'%(asctime)s - {stage_name} - %(name)s - %(levelname)s - %(message)s'
+    )
+
+
+def _serve(handler, requests, responses, stop_event):
+    """Answer (id, op, kwargs) requests with (id, ok, result) until stopped."""
+    while not stop_event.is_set():
+        try:
+            request_id, op, kwargs = requests.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        try:
+            responses.put((request_id, True, handler(op, **kwargs)))
+        except Exception as e:
+            logger.error(f"Stage request '{op}' failed: {e}")
+            responses.put((request_id, False, str(e)))
+
+
+def _capture_main(ring_name, capacity, wake_events, stop_event):
+    """Capture process: read the microphone into the ring and run the wake word engine on it."""
+    from src.audio_io import get_audio_backend
+    from src.beamformer import install_array_frontend
+    from src.wake_word_detector import create_wake_engine, get_wake_words
+    
+    _configure_child_logging("capture")
+    install_array_frontend()
+    engine = create_wake_engine()
+    wake_words = get_wake_words()
+    ring = AudioRing.attach(ring_name, capacity)
+    recorder = get_audio_backend().open_input(engine.frame_length, engine.sample_rate)
+    recorder.start()
+    logger.info("Capture stage running")
+    
+    try:
+        while not stop_event.is_set():
+            pcm = recorder.read()
+            ring.write(pcm)
+            keyword_index = engine.process(pcm)
+            if keyword_index >= 0:
+                wake_events.put((ring.position, wake_words[keyword_index]))
+    finally:
+        recorder.stop()
+        recorder.delete()
+        engine.delete()
+        ring.close()
+
+
+def _recognition_main(ring_name, capacity, requests, responses, stop_event):
+    """Recognition process: decode ranges of the ring on request and return the gated transcript."""
+    from src.speech_recognition import SpeechRecognizer
+    
+    _configure_child_logging("recognition")
+    recognizer = SpeechRecognizer()
+    ring = AudioRing.attach(ring_name, capacity)
+    logger.info("Recognition stage running")
+    
+    def handle(op, start, count, language=None):
+        if op != "transcribe":
+            raise ValueError(f"Unknown op '{op}'")
+        recognizer.transcribe(ring.read(start, count), language)
+        return recognizer.last_transcript
+    
+    try:
+        _serve(handle, requests, responses, stop_event)
+    finally:
+        recognizer.cleanup()
+        ring.close()
+
+
+def _synthesis_main(requests, responses, stop_event):
+    """Synthesis process: speak text on request."""
+    from src.text_to_speech import TextToSpeech
+    
+    _configure_child_logging("synthesis")
+    tts = TextToSpeech()
+    logger.info("Synthesis stage running")
+    
+    def handle(op, **kwargs):
+        if op not in SYNTHESIS_OPS:
+            raise ValueError(f"Unknown op '{op}'")
+        return getattr(tts, op)(**kwargs)
+    
+    try:
+        _serve(handle, requests, responses, stop_event)
+    finally:
+        tts.cleanup()
+
+
+class _Stage:
+    """
+    One supervised stage process and its control queues.
+    
+    The process gets (requests, responses) queues after its own arguments,
+    or only an output queue if it does not serve requests.
+    """
+    
+    def __init__(self, name, target, args, context, stop_event, serves_requests=True):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.context = context
+        self.stop_event = stop_event
+        self.serves_requests = serves_requests
+        self.requests = None
+        self.responses = None
+        self.process = None
+        self.generation = 0
+        self.restarts = deque()
+        self.failed = False
+        self.lock = threading.Lock()
+    
+    def start(self):
+        """Start (or restart) the process."""
+        # Fresh queues: a process killed while holding a queue's lock would
+        # leave that queue blocked for its successor
+        self.requests = self.context.Queue()
+        self.responses = self.context.Queue()
+        queues = (self.requests, self.responses) if self.serves_requests else (self.responses,)
+        
+        self.process = self.context.Process(
+            target=self.target,
+            args=self.args + queues + (self.stop_event,),
+            name=f"wakeon-{self.name}",
+            daemon=True
+        )
+        self.process.start()
+        self.generation += 1
+
+
+class StageSupervisor:
+    """
+    Starts the stage processes, restarts them when they die and routes requests.
+    
+    A stage that dies more than STAGE_MAX_RESTARTS times within
+    STAGE_RESTART_WINDOW seconds is given up on; calls to it fail at once
+    so the assistant degrades instead of waiting.
+    """
+    
+    def __init__(self):
+        """Create the audio ring and the stage definitions."""
+        if not (SHARED_MEMORY_AVAILABLE and NUMPY_AVAILABLE):
+            raise ImportError("Process stages need numpy and multiprocessing.shared_memory")
+        if config.SAMPLE_RATE != RING_SAMPLE_RATE:
+            raise ValueError(f"Process stages need SAMPLE_RATE={RING_SAMPLE_RATE}")
+        
+        self.max_restarts = getattr(config, "STAGE_MAX_RESTARTS", 5)
+        self.restart_window = getattr(config, "STAGE_RESTART_WINDOW", 60.0)
+        self.call_timeout = getattr(config, "STAGE_CALL_TIMEOUT", 60.0)
+        
+        ring_seconds = max(getattr(config, "STAGE_RING_SECONDS", 60), 2 * config.TIMEOUT_SECONDS)
+        self.ring = AudioRing.create(int(ring_seconds * RING_SAMPLE_RATE))
+        
+        # Spawned rather than forked: the parent already runs threads
+        context = multiprocessing.get_context("spawn")
+        self.stop_event = context.Event()
+        ring_args = (self.ring.name, self.ring.capacity)
+        self.stages = {
+            # The capture stage's output queue carries wake word events
+            "capture": _Stage("capture", _capture_main, ring_args, context,
+                              self.stop_event, serves_requests=False),
+            "recognition": _Stage("recognition", _recognition_main, ring_args, context, self.stop_event),
+            "synthesis": _Stage("synthesis", _synthesis_main, (), context, self.stop_event),
+        }
+        
+        self._ids = itertools.count()
+        self._stopping = threading.Event()
+        self._monitor_thread = None
+        
+        self.wake_word_detector = StageWakeWordDetector(self)
+        self.speech_recognizer = StageSpeechRecognizer(self)
+        self.tts = StageTextToSpeech(self)
+    
+    def start(self):
+        """Start all stage processes and the monitor thread."""
+        for stage in self.stages.values():
+            stage.start()
+            logger.info(f"Started {stage.name} stage (pid {stage.process.pid})")
+        self._monitor_thread = threading.Thread(target=self._monitor, name="stage-supervisor", daemon=True)
+        self._monitor_thread.start()
+    
+    def _monitor(self):
+        """Restart stage processes that exit unexpectedly."""
+        interval = getattr(config, "STAGE_MONITOR_INTERVAL", 0.5)
+        while not self._stopping.wait(interval):
+            for stage in self.stages.values():
+                if stage.failed or stage.process.is_alive():
+                    continue
+                logger.error(f"{stage.name} stage exited with code {stage.process.exitcode}")
+                self._restart(stage)
+    
+    def _restart(self, stage):
+        """Restart a stage unless it keeps crashing."""
+        now = time.monotonic()
+        while stage.restarts and now - stage.restarts[0] > self.restart_window:
+            stage.restarts.popleft()
+        if len(stage.restarts) >= self.max_restarts:
+            stage.failed = True
+            logger.error(
+                f"{stage.name} stage crashed {len(stage.restarts) + 1} times in "
+                f"{self.restart_window:.0f}s; giving up on it"
+            )
+            return
+        stage.restarts.append(now)
+        stage.start()
+        logger.warning(f"Restarted {stage.name} stage (pid {stage.process.pid})")
+    
+    def is_running(self, name):
+        """
+        Check whether a stage is usable.
+        
+        Args:
+            name (str): Stage name
+        
+        Returns:
+            bool: False once the supervisor has given up on the stage
+        """
+        return not self.stages[name].failed
+    
+    def call(self, name, op, timeout=None, **kwargs):
+        """
+        Send a request to a stage and wait for its answer.
+        
+        Args:
+            name (str): "recognition" or "synthesis"
+            op (str): Operation name
+            timeout (float): Seconds to wait; defaults to STAGE_CALL_TIMEOUT
+            **kwargs: Operation arguments
+        
+        Returns:
+            object: The operation's result
+        
+        Raises:
+            StageError: If the stage fails, restarts or times out
+        """
+        stage = self.stages[name]
+        if stage.failed:
+            raise StageError(f"{name} stage is not running")
+        deadline = time.monotonic() + (timeout or self.call_timeout)
+        
+        with stage.lock:
+            request_id = next(self._ids)
+            generation = stage.generation
+            requests, responses = stage.requests, stage.responses
+            requests.put((request_id, op, kwargs))
+            
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise StageError(f"{name} stage did not answer '{op}' in time")
+                try:
+                    response_id, ok, result = responses.get(timeout=min(0.2, remaining))
+                except queue.Empty:
+                    if stage.generation != generation or stage.failed:
+                        raise StageError(f"{name} stage restarted during '{op}'")
+                    continue
+                if response_id != request_id:
+                    continue  # Answer to a request that was given up on
+                if not ok:
+                    raise StageError(result)
+                return result
+    
+    def stop(self):
+        """Stop all stage processes and free the ring."""
+        self._stopping.set()
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
+        self.stop_event.set()
+        for stage in self.stages.values():
+            if stage.process is None:
+                continue
+            stage.process.join(timeout=5)
+            if stage.process.is_alive():
+                logger.warning(f"{stage.name} stage did not stop; terminating it")
+                stage.process.terminate()
+                stage.process.join()
+        self.ring.close()
+        logger.info("Stage processes stopped")
+
+
+class StageWakeWordDetector:
+    """Wake word detector interface backed by the capture process."""
+    
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+        self.last_wake_word = None
+        self._interrupt = threading.Event()
+    
+    def detect(self):
+        """
+        Wait for a wake word detected by the capture process.
+        
+        Returns:
+            bool: True if wake word detected, False if interrupted
+        """
+        self._interrupt.clear()
+        since = self.supervisor.ring.position
+        while not self._interrupt.is_set():
+            try:
+                position, wake_word = self.supervisor.stages["capture"].responses.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if position < since:
+                continue  # Heard during the previous turn, e.g. in our own speech
+            self.last_wake_word = wake_word
+            return True
+        return False
+    
+    def interrupt(self):
+        """Make a running detect() return False."""
+        self._interrupt.set()
+    
+    def set_verifier(self, verifier):
+        """Wake word verification is not available with process stages."""
+        if verifier is not None:
+            logger.warning("Wake word verification is not supported with process stages")
+    
+    def cleanup(self):
+        """The supervisor owns the capture process."""
+
+
+class StageSpeechRecognizer:
+    """Speech recognizer interface backed by the recognition process."""
+    
+    # Attributes read by WakeonAssistant for the in-process recognizer
+    use_fallback = False
+    server = None
+    model = None
+    models = None
+    
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+        self.last_transcript = None
+    
+    def listen_for_command(self, timeout=None, budget=None, language=None):
+        """
+        Wait for the command audio to be captured, then have it decoded.
+        
+        Args:
+            timeout (int): Maximum time to listen in seconds
+            budget (LatencyBudget): Turn budget, started at end of speech
+            language (str): Language of the command
+        
+        Returns:
+            str: Recognized text, or None if no speech was detected or the
+                transcript was rejected (see last_transcript)
+        """
+        self.last_transcript = None
+        if timeout is None:
+            timeout = config.TIMEOUT_SECONDS
+        ring = self.supervisor.ring
+        start = ring.position
+        count = int(timeout * RING_SAMPLE_RATE)
+        
+        try:
+            with profiler.stage("capture"):
+                ring.wait_until(start + count, timeout + 5.0)
+            if budget is not None:
+                budget.start()
+            
+            with profiler.stage("recognition"):
+                transcript = self.supervisor.call("recognition", "transcribe", start=start, count=count,
+                                                  language=language)
+            if budget is not None:
+                budget.check(STAGE_ASR)
+            self.last_transcript = transcript
+            if transcript is None or transcript.rejected or not transcript.text:
+                return None
+            return transcript.text
+        
+        except StageError as e:
+            logger.error(f"Error in speech recognition: {e}")
+            if budget is not None:
+                budget.start()
+            return None
+    
+    def cleanup(self):
+        """The supervisor owns the recognition process."""
+
+
+class StageTextToSpeech:
+    """Text-to-speech interface backed by the synthesis process."""
+    
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+    
+    def speak(self, text, budget=None):
+        """
+        Speak text in the synthesis process and wait until it is done.
+        
+        Args:
+            text (str): Text to speak
+            budget (LatencyBudget): Turn budget; a miss is recorded if it ran out
+        """
+        if not text:
+            return
+        if budget is not None:
+            budget.check(STAGE_TTS)
+        try:
+            self.supervisor.call("synthesis", "speak", text=text)
+        except StageError as e:
+            logger.error(f"Error in text-to-speech: {e}")
+            print(f"🔊 {text}")
+    
+    def _send(self, op, **kwargs):
+        """Send a settings change to the synthesis process."""
+        try:
+            self.supervisor.call("synthesis", op, **kwargs)
+        except StageError as e:
+            logger.error(f"Error in text-to-speech: {e}")
+    
+    def set_voice_rate(self, rate):
+        """Set the speech rate."""
+        self._send("set_voice_rate", rate=rate)
+    
+    def set_voice_volume(self, volume):
+        """Set the speech volume."""
+        self._send("set_voice_volume", volume=volume)
+    
+    def set_voice(self, voice_id):
+        """Set the voice."""
+        self._send("set_voice", voice_id=voice_id)
+    
+    def cleanup(self):
+        """The supervisor owns the synthesis process."""
@@ -1,77 +1,78 @@
 """
-Text-to-Speech using pyttsx3
+Text-to-Speech through a streaming TTS backend
 """
 
 import logging
-import config
-
-# Try to import optional dependencies
-try:
-    import pyttsx3
-    PYTTSX3_AVAILABLE = True
-except ImportError:
-    PYTTSX3_AVAILABLE = False
+import queue
+import threading
+import time
+from src import metrics
+from src.audio_io import get_audio_backend
+from src.latency_budget import STAGE_TTS
+from src.tts_backends import TTSBackendError, TTSUnavailableError, create_tts_backend
 
 logger = logging.getLogger(__name__)
 
+# Phrase rendered and discarded by prewarm()
+PREWARM_TEXT = "Okay."
+
 
 class TextToSpeech:
-    """Handles text-to-speech conversion using pyttsx3."""
+    """
+    Speaks text with the configured TTS backend.
     
-    def __init__(self):
-        """Initialize the text-to-speech engine."""
-        logger.info("Initializing text-to-speech engine...")
+    The backend renders speech to PCM chunks, which are played through the
+    audio backend on a separate thread. While one sentence plays, the next
+    one is already being rendered. The backend can be released between
+    turns to save memory and is created again when next needed.
+    """
+    
+    def __init__(self, engine=None):
+        """
+        Initialize the text-to-speech engine.
         
-        if not PYTTSX3_AVAILABLE:
-            logger.warning("pyttsx3 not available. Using simple text-to-speech.")
-            raise ImportError("pyttsx3 not available. Install with: pip install pyttsx3")
+        Args:
+            engine (str): TTS backend name; defaults to TTS_ENGINE
+        """
+        logger.info("Initializing text-to-speech engine...")
         
+        self.engine = engine
+        # Voice, rate and volume set at runtime, applied again to a re-created backend
+        self._overrides = {}
         try:
-            # Initialize pyttsx3 engine
-            self.engine = pyttsx3.init()
-            
-            # Configure voice properties
-            self.engine.setProperty('rate', config.TTS_VOICE_RATE)
-            self.engine.setProperty('volume', config.TTS_VOICE_VOLUME)
-            
-            # Get available voices and set a good one
-            voices = self.engine.getProperty('voices')
-            if voices:
-                # Try to find a female voice, otherwise use the first available
-                female_voice = None
-                for voice in voices:
-                    if 'female' in voice.name.lower() or 'zira' in voice.name.lower():
-                        female_voice = voice
-                        break
-                
-                if female_voice:
-                    self.engine.setProperty('voice', female_voice.id)
-                else:
-                    self.engine.setProperty('voice', voices[0].id)
-                
-                logger.info(f"TTS initialized with voice: {self.engine.getProperty('voice')}")
-            else:
-                logger.warning("No voices found for TTS")
-            
+            self.backend = create_tts_backend(engine)
+        except TTSUnavailableError as e:
+            logger.warning(f"{e} Using simple text-to-speech.")
+            raise ImportError(str(e))
         except Exception as e:
             logger.error(f"Failed to initialize text-to-speech: {e}")
             raise
+        
+        # Held while rendering; engines like pyttsx3 are not thread-safe
+        self._render_lock = threading.Lock()
+        self._thread_bound = self.backend.thread_bound
+        self.first_chunk_stats = metrics.get_stats("tts.first_chunk")
+        self.synthesis_stats = metrics.get_stats("tts.synthesis")
+        logger.info(f"Text-to-speech engine: {self.backend.name}")
     
-    def speak(self, text):
+    def speak(self, text, budget=None):
         """
         Convert text to speech and play it.
         
         Args:
             text (str): Text to speak
+            budget (LatencyBudget): Turn budget; a miss is recorded if it ran out
         """
         if not text:
             logger.warning("No text provided for speech")
             return
         
+        if budget is not None:
+            budget.check(STAGE_TTS)
+        
         try:
             logger.debug(f"Speaking: {text}")
-            self.engine.say(text)
-            self.engine.runAndWait()
+            self._stream(text)
             logger.debug("Speech completed")
             
         except Exception as e:
@@ -79,6 +80,129 @@ class TextToSpeech:
             # Fallback to print if TTS fails
             print(f"🔊 {text}")
     
+    def prewarm(self):
+        """
+        Ready the engine before the answer arrives.
+        
+        Renders a short phrase without playing it, so the first real
+        sentence does not pay for cold engine caches. Engines bound to
+        the thread that created them are skipped, since prewarm() runs
+        on a background thread.
+        """
+        if self._thread_bound:
+            return
+        
+        with self._render_lock:
+            backend = self._get_backend()
+            if backend.speaks_directly:
+                # Nothing can be rendered without being heard
+                return
+            for _ in backend.synthesize(PREWARM_TEXT):
+                pass
+    
+    def release_idle(self):
+        """Drop the TTS engine until it is needed again, freeing its memory."""
+        with self._render_lock:
+            if self.backend is not None:
+                self.backend.cleanup()
+                self.backend = None
+                logger.debug("Text-to-speech engine released")
+    
+    def _get_backend(self):
+        """Get the backend, creating it again if it was released; call with the render lock held."""
+        if self.backend is None:
+            self.backend = create_tts_backend(self.engine)
+            for method, value in self._overrides.items():
+                getattr(self.backend, method)(value)
+        return self.backend
+    
+    def _apply(self, method, value):
+        """Set a backend property now, if loaded, and on every re-created backend."""
+        self._overrides[method] = value
+        backend = self.backend
+        if backend is not None:
+            getattr(backend, method)(value)
+    
+    def _stream(self, text):
+        """
+        Render text and play each chunk as soon as it is ready.
+        
+        Args:
+            text (str): Text to speak
+        """
+        with self._render_lock:
+            backend = self._get_backend()
+            if backend.speaks_directly:
+                self._say(backend, text)
+                return
+        
+        chunks = queue.Queue()
+        errors = []
+        
+        def play():
+            backend = get_audio_backend()
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    return
+                if errors:
+                    continue
+                try:
+                    backend.play(chunk.audio, chunk.sample_rate)
+                except Exception as e:
+                    errors.append(e)
+        
+        player = threading.Thread(target=play, name="tts-playback", daemon=True)
+        player.start()
+        
+        start = time.monotonic()
+        first_chunk = None
+        audio_seconds = 0.0
+        direct = False
+        try:
+            with self._render_lock:
+                backend = self._get_backend()
+                try:
+                    for chunk in backend.synthesize(text):
+                        if first_chunk is None:
+                            first_chunk = time.monotonic() - start
+                            self.first_chunk_stats.record(first_chunk)
+                        audio_seconds += len(chunk.audio) / chunk.sample_rate
+                        chunks.put(chunk)
+                        if errors:
+                            break
+                except TTSBackendError:
+                    # An engine that turns out unable to render speaks the text itself
+                    if first_chunk is not None or not backend.speaks_directly:
+                        raise
+                    direct = True
+        finally:
+            chunks.put(None)
+        
+        if direct:
+            player.join()
+            with self._render_lock:
+                self._say(backend, text)
+            return
+        
+        synthesis = time.monotonic() - start
+        self.synthesis_stats.record(synthesis)
+        if first_chunk is not None:
+            logger.debug(
+                f"TTS first chunk in {first_chunk * 1000:.0f} ms, "
+                f"{audio_seconds:.1f}s of audio rendered in {synthesis * 1000:.0f} ms"
+            )
+        
+        player.join()
+        if errors:
+            raise errors[0]
+    
+    def _say(self, backend, text):
+        """Have an engine that cannot render speak text itself; call with the render lock held."""
+        start = time.monotonic()
+        backend.say(text)
+        self.synthesis_stats.record(time.monotonic() - start)
+    
     def set_voice_rate(self, rate):
         """
         Set the speech rate.
@@ -87,7 +211,7 @@ class TextToSpeech:
             rate (int): Speech rate (words per minute)
         """
         try:
-            self.engine.setProperty('rate', rate)
+            self._apply("set_rate", rate)
             logger.debug(f"Voice rate set to {rate}")
         except Exception as e:
             logger.error(f"Error setting voice rate: {e}")
@@ -100,11 +224,24 @@ class TextToSpeech:
             volume (float): Volume level (0.0 to 1.0)
         """
         try:
-            self.engine.setProperty('volume', volume)
+            self._apply("set_volume", volume)
             logger.debug(f"Voice volume set to {volume}")
         except Exception as e:
             logger.error(f"Error setting voice volume: {e}")
     
+    def set_voice(self, voice_id):
+        """
+        Set the voice, e.g. for the language of the current turn.
+        
+        Args:
+            voice_id (str): Voice id of the TTS backend
+        """
+        try:
+            self._apply("set_voice", voice_id)
+            logger.debug(f"Voice set to {voice_id}")
+        except Exception as e:
+            logger.error(f"Error setting voice: {e}")
+    
     def get_available_voices(self):
         """
         Get list of available voices.
@@ -113,8 +250,8 @@ class TextToSpeech:
             list: List of available voice names
         """
         try:
-            voices = self.engine.getProperty('voices')
-            return [voice.name for voice in voices]
+            with self._render_lock:
+                return self._get_backend().get_voices()
         except Exception as e:
             logger.error(f"Error getting available voices: {e}")
             return []
@@ -122,8 +259,8 @@ class TextToSpeech:
     def cleanup(self):
         """Clean up resources."""
         try:
-            if hasattr(self, 'engine'):
-                self.engine.stop()
+            if getattr(self, 'backend', None) is not None:
+                self.backend.cleanup()
             logger.debug("Text-to-speech engine cleaned up")
         except Exception as e:
             logger.error(f"Error cleaning up text-to-speech: {e}")
@@ -136,12 +273,13 @@ class SimpleTextToSpeech:
         """Initialize simple text-to-speech."""
         logger.info("Initializing simple text-to-speech (for testing)")
     
-    def speak(self, text):
+    def speak(self, text, budget=None):
         """
         Simulate text-to-speech by printing.
         
         Args:
             text (str): Text to speak
+            budget (LatencyBudget): Ignored
         """
         print(f"🔊 {text}")
         logger.info(f"Simple TTS: {text}")
@@ -0,0 +1,121 @@
+"""
+Confidence gate for recognized commands, so noise is not sent to the AI
+"""
+
+import logging
+import threading
+from collections import Counter, namedtuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# One recognized word with Vosk's confidence and its timing in seconds
+Word = namedtuple("Word", ["word", "confidence", "start", "end"])
+
+# A recognized command; rejected is the gate's reason, or None if it passed
+Transcript = namedtuple("Transcript", ["text", "confidence", "words", "rejected"])
+
+REJECT_TOO_SHORT = "too_short"
+REJECT_FILLER = "filler"
+REJECT_LOW_CONFIDENCE = "low_confidence"
+
+# Settings that only need a new gate, not a new recognizer
+GATE_SETTINGS = {"ASR_GATE_ENABLED", "ASR_MIN_CONFIDENCE", "ASR_MIN_WORDS", "ASR_FILLER_WORDS"}
+
+# What the assistant does with a rejected command
+ACTION_REPROMPT = "reprompt"
+ACTION_IGNORE = "ignore"
+
+
+def parse_result(result):
+    """
+    Build a transcript from a Vosk result with word details (SetWords).
+    
+    Args:
+        result (dict): Vosk result with "text" and, for speech, "result"
+    
+    Returns:
+        Transcript: Text, mean word confidence (None without word details)
+            and words, not yet gated
+    """
+    words = [
+        Word(item.get("word", ""), item.get("conf", 1.0), item.get("start"), item.get("end"))
+        for item in result.get("result", [])
+    ]
+    confidence = sum(word.confidence for word in words) / len(words) if words else None
+    return Transcript(result.get("text", "").strip(), confidence, words, None)
+
+
+class TranscriptGate:
+    """
+    Rejects transcripts that are probably not a command.
+    
+    Background noise such as a TV tends to decode to short fragments with
+    low word confidence, or to a lone filler word like "the". Each of those
+    would otherwise cost a full AI round trip.
+    """
+    
+    def __init__(self, min_confidence=None, min_words=None, filler_words=None):
+        """
+        Initialize the gate.
+        
+        Args:
+            min_confidence (float): Lowest mean word confidence accepted
+            min_words (int): Fewest words accepted
+            filler_words (iterable): Words that do not make a command on their own
+        """
+        if min_confidence is None:
+            min_confidence = getattr(config, "ASR_MIN_CONFIDENCE", 0.6)
+        if min_words is None:
+            min_words = getattr(config, "ASR_MIN_WORDS", 1)
+        if filler_words is None:
+            filler_words = getattr(config, "ASR_FILLER_WORDS", "the,a,uh,um,huh,hmm,oh")
+        if isinstance(filler_words, str):
+            filler_words = filler_words.split(",")
+        
+        self.min_confidence = min_confidence
+        self.min_words = min_words
+        self.filler_words = {word.strip().lower() for word in filler_words if word.strip()}
+        
+        self.accepted = 0
+        self.rejections = Counter()
+        self._lock = threading.Lock()
+    
+    def check(self, transcript):
+        """
+        Gate a transcript.
+        
+        Args:
+            transcript (Transcript): Transcript from parse_result()
+        
+        Returns:
+            Transcript: The same transcript with rejected set to the reason, if any
+        """
+        if not transcript.text:
+            return transcript
+        
+        words = transcript.text.split()
+        reason = None
+        if len(words) < self.min_words:
+            reason = REJECT_TOO_SHORT
+        elif all(word.lower() in self.filler_words for word in words):
+            reason = REJECT_FILLER
+        elif transcript.confidence is not None and transcript.confidence < self.min_confidence:
+            reason = REJECT_LOW_CONFIDENCE
+        
+        with self._lock:
+            if reason is None:
+                self.accepted += 1
+            else:
+                self.rejections[reason] += 1
+        return transcript._replace(rejected=reason)
+    
+    def log_summary(self):
+        """Log how many transcripts were accepted and rejected, by reason."""
+        with self._lock:
+            rejected = sum(self.rejections.values())
+            if not rejected:
+                return
+            reasons = ", ".join(f"{reason}={count}" for reason, count in sorted(self.rejections.items()))
+            logger.info(f"Transcript gate: {self.accepted} accepted, {rejected} rejected ({reasons})")
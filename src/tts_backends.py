@@ -0,0 +1,332 @@
+"""
+Pluggable text-to-speech backends that render speech to PCM chunks
+
+A backend never plays audio itself. synthesize() yields int16 chunks as
+soon as each is ready, so the caller can start playing the first sentence
+while the next one is still being rendered, and can measure how long the
+first chunk took.
+"""
+
+import importlib.util
+import logging
+import os
+import re
+import sys
+import tempfile
+import wave
+from collections import namedtuple
+
+import config
+from src.audio_io import read_wav
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Engines are only imported by the backend that uses them, so the unused
+# one costs no memory (piper pulls in onnxruntime)
+PYTTSX3_AVAILABLE = importlib.util.find_spec("pyttsx3") is not None
+PIPER_AVAILABLE = importlib.util.find_spec("piper") is not None
+pyttsx3 = piper = None
+
+logger = logging.getLogger(__name__)
+
+# One piece of rendered speech
+SpeechChunk = namedtuple("SpeechChunk", ["audio", "sample_rate"])
+
+# Rough speaking rate of a Piper voice at length_scale 1.0, in words per minute
+PIPER_NATURAL_RATE = 150
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class TTSBackendError(Exception):
+    """Raised when a TTS backend fails."""
+
+
+class TTSUnavailableError(TTSBackendError):
+    """Raised when a TTS backend cannot be used (missing library or model)."""
+
+
+def _import_pyttsx3():
+    """Import pyttsx3 on first use."""
+    global pyttsx3
+    try:
+        import pyttsx3
+    except ImportError as e:
+        raise TTSUnavailableError(f"pyttsx3 not available: {e}")
+
+
+def _import_piper():
+    """Import Piper on first use."""
+    global piper
+    try:
+        import piper
+    except ImportError as e:
+        raise TTSUnavailableError(f"Piper not available: {e}")
+
+
+def split_sentences(text):
+    """
+    Split text into sentences, the unit backends render at a time.
+    
+    Args:
+        text (str): Text to split
+    
+    Returns:
+        list: Non-empty sentences
+    """
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+class TTSBackend:
+    """Base class for text-to-speech backends."""
+    
+    name = "base"
+    
+    # True when the engine can only play to the speakers itself; say() is
+    # then used instead of synthesize()
+    speaks_directly = False
+    
+    # True when the engine must only be used from the thread that created it
+    thread_bound = False
+    
+    def synthesize(self, text):
+        """
+        Render text to speech.
+        
+        Args:
+            text (str): Text to speak
+        
+        Yields:
+            SpeechChunk: int16 mono samples and their sample rate, in order
+        """
+        raise NotImplementedError
+    
+    def say(self, text):
+        """
+        Speak text straight to the speakers, for engines that cannot render.
+        
+        Args:
+            text (str): Text to speak
+        """
+        raise NotImplementedError
+    
+    def set_rate(self, rate):
+        """
+        Set the speech rate.
+        
+        Args:
+            rate (int): Speech rate (words per minute)
+        """
+    
+    def set_volume(self, volume):
+        """
+        Set the speech volume.
+        
+        Args:
+            volume (float): Volume level (0.0 to 1.0)
+        """
+    
+    def set_voice(self, voice_id):
+        """
+        Set the voice.
+        
+        Args:
+            voice_id (str): Backend-specific voice id
+        """
+    
+    def get_voices(self):
+        """
+        Get the voices the backend can use.
+        
+        Returns:
+            list: Voice names
+        """
+        return []
+    
+    def cleanup(self):
+        """Clean up resources."""
+
+
+class Pyttsx3Backend(TTSBackend):
+    """
+    pyttsx3 rendered to buffers instead of the speakers.
+    
+    pyttsx3 can only write whole utterances to a file, so each sentence is
+    rendered to a temporary WAV file and read back as one chunk. Where the
+    driver does not write 16-bit mono WAV (macOS's nsss writes AIFF), the
+    engine speaks directly instead, as pyttsx3 normally does.
+    """
+    
+    name = "pyttsx3"
+    
+    # sapi5 drives a COM object and nsss an NSRunLoop, both tied to one thread
+    thread_bound = True
+    
+    def __init__(self):
+        """Initialize the pyttsx3 engine."""
+        if not PYTTSX3_AVAILABLE:
+            raise TTSUnavailableError("pyttsx3 not available. Install with: pip install pyttsx3")
+        _import_pyttsx3()
+        
+        self.engine = pyttsx3.init()
+        self.speaks_directly = sys.platform == "darwin"
+        self.engine.setProperty('rate', config.TTS_VOICE_RATE)
+        self.engine.setProperty('volume', config.TTS_VOICE_VOLUME)
+        
+        # Get available voices and set a good one
+        voices = self.engine.getProperty('voices')
+        if voices:
+            # Try to find a female voice, otherwise use the first available
+            female_voice = None
+            for voice in voices:
+                if 'female' in voice.name.lower() or 'zira' in voice.name.lower():
+                    female_voice = voice
+                    break
+            
+            if female_voice:
+                self.engine.setProperty('voice', female_voice.id)
+            else:
+                self.engine.setProperty('voice', voices[0].id)
+            
+            logger.info(f"TTS initialized with voice: {self.engine.getProperty('voice')}")
+        else:
+            logger.warning("No voices found for TTS")
+    
+    def synthesize(self, text):
+        """Render text one sentence at a time."""
+        for sentence in split_sentences(text):
+            audio, sample_rate = self._render(sentence)
+            yield SpeechChunk(audio, sample_rate)
+    
+    def _render(self, sentence):
+        """Render one sentence through a temporary WAV file."""
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            self.engine.save_to_file(sentence, path)
+            self.engine.runAndWait()
+            return read_wav(path)
+        except (wave.Error, ValueError, EOFError) as e:
+            # The driver wrote some other format; speak directly from now on
+            logger.warning(f"pyttsx3 did not write 16-bit mono WAV ({e}); speaking directly")
+            self.speaks_directly = True
+            raise TTSBackendError(str(e))
+        finally:
+            os.remove(path)
+    
+    def say(self, text):
+        """Speak text through the engine's own audio output."""
+        self.engine.say(text)
+        self.engine.runAndWait()
+    
+    def set_rate(self, rate):
+        self.engine.setProperty('rate', rate)
+    
+    def set_volume(self, volume):
+        self.engine.setProperty('volume', volume)
+    
+    def set_voice(self, voice_id):
+        self.engine.setProperty('voice', voice_id)
+    
+    def get_voices(self):
+        return [voice.name for voice in self.engine.getProperty('voices')]
+    
+    def cleanup(self):
+        self.engine.stop()
+
+
+class PiperBackend(TTSBackend):
+    """
+    Piper, a fast local neural TTS engine.
+    
+    Piper streams audio sentence by sentence and runs faster than real time
+    on a Raspberry Pi 4, so the first sentence is ready well before pyttsx3
+    would have rendered it. Voices are ONNX model files; the voice id is
+    the model path.
+    """
+    
+    name = "piper"
+    
+    def __init__(self):
+        """Load the Piper voice model."""
+        if not PIPER_AVAILABLE:
+            raise TTSUnavailableError("Piper not available. Install with: pip install piper-tts")
+        if not NUMPY_AVAILABLE:
+            raise TTSUnavailableError("numpy not available. Install with: pip install numpy")
+        _import_piper()
+        
+        model_path = getattr(config, "PIPER_MODEL_PATH", "models/piper/en_US-lessac-medium.onnx")
+        self._load(model_path)
+        self.set_rate(config.TTS_VOICE_RATE)
+        self.set_volume(config.TTS_VOICE_VOLUME)
+    
+    def _load(self, model_path):
+        """Load a voice model."""
+        if not os.path.exists(model_path):
+            raise TTSUnavailableError(f"Piper voice not found at {model_path}")
+        self.voice = piper.PiperVoice.load(model_path)
+        self.model_path = model_path
+        self.sample_rate = self.voice.config.sample_rate
+        logger.info(f"TTS initialized with Piper voice: {model_path}")
+    
+    def synthesize(self, text):
+        """Stream Piper's audio for each sentence as it is produced."""
+        if hasattr(self.voice, "synthesize_stream_raw"):
+            # piper-tts before 1.3 yields raw int16 bytes per sentence
+            for raw in self.voice.synthesize_stream_raw(text, length_scale=self.length_scale):
+                yield SpeechChunk(self._scale(np.frombuffer(raw, dtype=np.int16)), self.sample_rate)
+        else:
+            syn_config = piper.SynthesisConfig(length_scale=self.length_scale)
+            for chunk in self.voice.synthesize(text, syn_config=syn_config):
+                yield SpeechChunk(self._scale(chunk.audio_int16_array), chunk.sample_rate)
+    
+    def _scale(self, audio):
+        """Apply the volume setting to int16 samples."""
+        if self.volume >= 1.0:
+            return audio
+        return (audio * self.volume).astype(np.int16)
+    
+    def set_rate(self, rate):
+        # Piper sets the speed by stretching phoneme lengths
+        self.length_scale = PIPER_NATURAL_RATE / max(rate, 1)
+    
+    def set_volume(self, volume):
+        self.volume = min(max(volume, 0.0), 1.0)
+    
+    def set_voice(self, voice_id):
+        self._load(voice_id)
+    
+    def get_voices(self):
+        directory = os.path.dirname(self.model_path) or "."
+        return sorted(name for name in os.listdir(directory) if name.endswith(".onnx"))
+
+
+BACKENDS = {
+    Pyttsx3Backend.name: Pyttsx3Backend,
+    PiperBackend.name: PiperBackend,
+}
+
+
+def create_tts_backend(name=None):
+    """
+    Create the TTS backend selected in the configuration.
+    
+    Args:
+        name (str): Backend name; defaults to TTS_ENGINE
+    
+    Returns:
+        TTSBackend: The backend
+    
+    Raises:
+        TTSUnavailableError: If the backend is unknown or cannot be used
+    """
+    if name is None:
+        name = getattr(config, "TTS_ENGINE", Pyttsx3Backend.name)
+    if name not in BACKENDS:
+        raise TTSUnavailableError(f"Unknown TTS engine '{name}'")
+    return BACKENDS[name]()
@@ -0,0 +1,158 @@
+"""
+Energy-based voice activity detection, for listening without a wake word
+"""
+
+import logging
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# A frame is speech when its energy is this many times the noise floor
+ACTIVITY_RATIO = 3.0
+
+# Per-frame rise of the noise floor estimate, so it follows louder rooms
+NOISE_FLOOR_RISE = 1.01
+
+# Frames quieter than this are never speech, however quiet the room
+MIN_SPEECH_DBFS = -55.0
+
+EVENT_START = "start"
+EVENT_END = "end"
+
+
+class NoiseFloorGate:
+    """
+    Tells frames that stand out from a running noise floor.
+    
+    The floor drops to any quieter frame at once and otherwise rises by
+    floor_rise per frame, so it follows a room that gets louder but not
+    the speech in it. It never goes below one LSB squared, so after
+    digital silence not every sound counts as activity. Shared by voice
+    activity detection, the keyword spotter, the beamformer and AGC.
+    """
+    
+    def __init__(self, activity_ratio=ACTIVITY_RATIO, floor_rise=NOISE_FLOOR_RISE, min_dbfs=None):
+        """
+        Initialize the gate.
+        
+        Args:
+            activity_ratio (float): Energy above this multiple of the floor is activity
+            floor_rise (float): Per-frame growth of the floor
+            min_dbfs (float): Frames quieter than this are never activity; None for no limit
+        """
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy not available. Install with: pip install numpy")
+        
+        self.activity_ratio = activity_ratio
+        self.floor_rise = floor_rise
+        self.min_energy = (32768 * 10 ** (min_dbfs / 20)) ** 2 if min_dbfs is not None else 0.0
+        self.noise_floor = None
+    
+    def is_active(self, frame):
+        """
+        Track the noise floor and tell whether a frame stands out from it.
+        
+        Args:
+            frame (numpy.ndarray): Mono samples at int16 scale
+        
+        Returns:
+            bool: True if the frame is louder than the room
+        """
+        energy = float(np.mean(np.asarray(frame, dtype=np.float32) ** 2)) if len(frame) else 0.0
+        if self.noise_floor is None or energy < self.noise_floor:
+            self.noise_floor = max(energy, 1.0)
+            return False
+        self.noise_floor *= self.floor_rise
+        return energy > self.activity_ratio * self.noise_floor and energy > self.min_energy
+
+
+class VoiceActivityDetector:
+    """
+    Finds where an utterance starts and ends in a stream of frames.
+    
+    A frame counts as speech when a NoiseFloorGate finds it louder than
+    the room. Speech starts after
+    start_frames speech frames in a row, so a click does not open an
+    utterance, and ends after end_silence seconds without speech, so the
+    pauses between words do not close it. The noise floor is kept across
+    utterances; reset() only forgets the utterance in progress.
+    """
+    
+    def __init__(self, sample_rate, frame_length, end_silence=0.8, start_frames=2):
+        """
+        Initialize the detector.
+        
+        Args:
+            sample_rate (int): Sample rate in Hz
+            frame_length (int): Samples per frame
+            end_silence (float): Seconds of silence that end an utterance
+            start_frames (int): Speech frames in a row that start one
+        """
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy not available. Install with: pip install numpy")
+        
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.start_frames = start_frames
+        self.end_silence = end_silence
+        self.gate = NoiseFloorGate(min_dbfs=MIN_SPEECH_DBFS)
+        self.reset()
+    
+    @property
+    def end_silence(self):
+        """float: Seconds of silence that end an utterance."""
+        return self.end_frames * self.frame_length / self.sample_rate
+    
+    @end_silence.setter
+    def end_silence(self, seconds):
+        self.end_frames = max(1, int(round(seconds * self.sample_rate / self.frame_length)))
+    
+    def reset(self):
+        """Forget the utterance in progress, e.g. before a new listening window."""
+        self.in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+    
+    def is_speech(self, frame):
+        """
+        Track the noise floor and tell whether a frame stands out from it.
+        
+        Args:
+            frame (numpy.ndarray): 16-bit samples
+        
+        Returns:
+            bool: True if the frame sounds like speech
+        """
+        return self.gate.is_active(frame)
+    
+    def process(self, frame):
+        """
+        Feed the next frame.
+        
+        Args:
+            frame (numpy.ndarray): frame_length 16-bit samples
+        
+        Returns:
+            str: EVENT_START when an utterance starts, EVENT_END when it
+                ends, None otherwise
+        """
+        speech = self.is_speech(frame)
+        if not self.in_speech:
+            self._speech_run = self._speech_run + 1 if speech else 0
+            if self._speech_run >= self.start_frames:
+                self.in_speech = True
+                self._silence_run = 0
+                return EVENT_START
+            return None
+        
+        self._silence_run = 0 if speech else self._silence_run + 1
+        if self._silence_run >= self.end_frames:
+            self.reset()
+            return EVENT_END
+        return None
@@ -0,0 +1,262 @@
+"""
+Wake word sensitivity sweep over recorded corpora
+
+Replays recordings from each site through Porcupine at a grid of
+sensitivities, in a process pool, and reports the false accepts per hour
+on background audio against the miss rate on wake word recordings, with
+a recommended PORCUPINE_SENSITIVITIES setting per site.
+
+A site is a directory with two subdirectories of 16-bit mono WAV files at
+Porcupine's sample rate (16 kHz):
+
+    site/positive/   one wake word utterance per file; with several wake
+                     words, one subdirectory per wake word (positive/jarvis/)
+    site/negative/   background audio without the wake word (TV, talk, ...)
+
+Usage:
+    python -m src.wake_sensitivity_sweep corpora/kitchen corpora/office
+    python -m src.wake_sensitivity_sweep corpora/kitchen --sensitivities 0.3:0.9:0.05 --output sweep.json
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from src.audio_io import read_wav
+from src.wake_word_detector import PORCUPINE_AVAILABLE, create_porcupine, get_wake_words
+
+logger = logging.getLogger(__name__)
+
+# Detections closer together than this count once, as the assistant would
+# be busy with the first one
+REFRACTORY_SECONDS = 1.0
+
+
+def parse_grid(spec):
+    """
+    Parse a sensitivity grid.
+    
+    Args:
+        spec (str): "START:STOP:STEP" (inclusive) or a comma-separated list
+    
+    Returns:
+        list: Sensitivities between 0 and 1
+    """
+    if ":" in spec:
+        start, stop, step = (float(value) for value in spec.split(":"))
+        count = int(round((stop - start) / step)) + 1
+        values = [round(start + i * step, 4) for i in range(count)]
+    else:
+        values = [float(value) for value in spec.split(",")]
+    if not values or any(not 0.0 <= value <= 1.0 for value in values):
+        raise ValueError(f"Sensitivities must be between 0 and 1: {spec}")
+    return values
+
+
+def _wav_files(directory):
+    """16-bit WAV files directly in a directory, sorted."""
+    return sorted(glob.glob(os.path.join(directory, "*.wav")))
+
+
+def load_site(site_dir, wake_words):
+    """
+    Find a site's recordings.
+    
+    Args:
+        site_dir (str): Site directory with positive/ and negative/
+        wake_words (list): Wake words being tuned
+    
+    Returns:
+        dict: "positive" maps wake words to files, "negative" lists files
+    """
+    positive_dir = os.path.join(site_dir, "positive")
+    positives = {}
+    for wake_word in wake_words:
+        files = _wav_files(os.path.join(positive_dir, wake_word))
+        if files:
+            positives[wake_word] = files
+    if not positives and _wav_files(positive_dir):
+        # No per-wake-word folders: the recordings are of the first wake word
+        positives[wake_words[0]] = _wav_files(positive_dir)
+    return {"positive": positives, "negative": _wav_files(os.path.join(site_dir, "negative"))}
+
+
+def count_detections(job):
+    """
+    Run one wake word at one sensitivity over a list of files (in a worker).
+    
+    Args:
+        job (tuple): (wake word, sensitivity, file paths)
+    
+    Returns:
+        list: (detections, seconds of audio) per file
+    """
+    wake_word, sensitivity, paths = job
+    porcupine = create_porcupine([wake_word], [sensitivity])
+    refractory_frames = int(REFRACTORY_SECONDS * porcupine.sample_rate / porcupine.frame_length)
+    results = []
+    try:
+        for path in paths:
+            audio, sample_rate = read_wav(path)
+            if sample_rate != porcupine.sample_rate:
+                raise ValueError(f"{path}: {sample_rate} Hz, Porcupine needs {porcupine.sample_rate} Hz")
+            
+            length = porcupine.frame_length
+            detections = 0
+            last = -refractory_frames
+            for index, offset in enumerate(range(0, len(audio) - length + 1, length)):
+                detected = porcupine.process(audio[offset:offset + length].tolist()) >= 0
+                if detected and index - last >= refractory_frames:
+                    detections += 1
+                    last = index
+            results.append((detections, len(audio) / sample_rate))
+    finally:
+        porcupine.delete()
+    return results
+
+
+def sweep(sites, wake_words, sensitivities, workers=None):
+    """
+    Measure every site, wake word and sensitivity.
+    
+    Args:
+        sites (list): Site directories
+        wake_words (list): Wake words to tune
+        sensitivities (list): Sensitivity grid
+        workers (int): Worker processes; defaults to the CPU count
+    
+    Returns:
+        dict: Site name to wake word to a list of curve points (dicts with
+            sensitivity, false_accepts_per_hour, miss_rate and the raw counts)
+    """
+    corpora = {os.path.basename(os.path.normpath(site)): load_site(site, wake_words) for site in sites}
+    
+    jobs = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for site, corpus in corpora.items():
+            for wake_word, positives in corpus["positive"].items():
+                for sensitivity in sensitivities:
+                    jobs[(site, wake_word, sensitivity, "positive")] = pool.submit(
+                        count_detections, (wake_word, sensitivity, positives))
+                    if corpus["negative"]:
+                        jobs[(site, wake_word, sensitivity, "negative")] = pool.submit(
+                            count_detections, (wake_word, sensitivity, corpus["negative"]))
+        counts = {key: future.result() for key, future in jobs.items()}
+    
+    results = {}
+    for site, corpus in corpora.items():
+        results[site] = {}
+        for wake_word in corpus["positive"]:
+            curve = []
+            for sensitivity in sensitivities:
+                positive = counts[(site, wake_word, sensitivity, "positive")]
+                negative = counts.get((site, wake_word, sensitivity, "negative"), [])
+                misses = sum(1 for detections, _ in positive if detections == 0)
+                false_accepts = sum(detections for detections, _ in negative)
+                hours = sum(seconds for _, seconds in negative) / 3600
+                curve.append({
+                    "sensitivity": sensitivity,
+                    "false_accepts_per_hour": false_accepts / hours if hours else None,
+                    "miss_rate": misses / len(positive),
+                    "false_accepts": false_accepts,
+                    "negative_hours": hours,
+                    "misses": misses,
+                    "positives": len(positive),
+                })
+            results[site][wake_word] = curve
+    return results
+
+
+def recommend(curve, max_false_accepts_per_hour):
+    """
+    Pick the sensitivity with the fewest misses within the false accept limit.
+    
+    Ties go to the point with fewer false accepts, then the lower
+    sensitivity. Without negative audio nothing is recommended.
+    
+    Args:
+        curve (list): Points from sweep() for one site and wake word
+        max_false_accepts_per_hour (float): Highest acceptable false accept rate
+    
+    Returns:
+        dict: The recommended point, or None
+    """
+    measured = [point for point in curve if point["false_accepts_per_hour"] is not None]
+    if not measured:
+        return None
+    within = [point for point in measured if point["false_accepts_per_hour"] <= max_false_accepts_per_hour]
+    if not within:
+        # Nothing meets the limit: take the quietest setting
+        return min(measured, key=lambda point: (point["false_accepts_per_hour"], point["miss_rate"]))
+    return min(within, key=lambda point: (point["miss_rate"], point["false_accepts_per_hour"], point["sensitivity"]))
+
+
+def print_results(results, max_false_accepts_per_hour):
+    """Print each curve and the recommended settings."""
+    for site, curves in results.items():
+        recommended = {}
+        for wake_word, curve in curves.items():
+            point = recommend(curve, max_false_accepts_per_hour)
+            print(f"\n{site} / {wake_word}: {curve[0]['positives']} positives, "
+                  f"{curve[0]['negative_hours']:.2f} h of negatives")
+            print("  sensitivity   false accepts/h   miss rate")
+            for entry in curve:
+                fa = entry["false_accepts_per_hour"]
+                fa = "n/a" if fa is None else f"{fa:.2f}"
+                mark = "  <-" if entry is point else ""
+                print(f"  {entry['sensitivity']:>11.2f}   {fa:>15}   {entry['miss_rate']:>9.1%}{mark}")
+            if point is not None:
+                recommended[wake_word] = point["sensitivity"]
+        
+        if recommended:
+            print(f"\n{site}: PORCUPINE_SENSITIVITIES={json.dumps(recommended)}")
+        else:
+            print(f"\n{site}: no negative audio, no recommendation")
+
+
+def main():
+    """Run the sweep from the command line."""
+    parser = argparse.ArgumentParser(description="Wake word sensitivity sweep over recorded corpora")
+    parser.add_argument("sites", nargs="+", help="Site directories with positive/ and negative/ WAV files")
+    parser.add_argument("--wake-words", help="Comma-separated wake words (default: the configured ones)")
+    parser.add_argument("--sensitivities", default="0.1:0.9:0.1",
+                        help="Grid as START:STOP:STEP or a comma-separated list (default: 0.1:0.9:0.1)")
+    parser.add_argument("--max-false-accepts", type=float, default=0.5,
+                        help="False accepts per hour allowed for the recommendation (default: 0.5)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--output", help="Also write the curves and recommendations as JSON")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL), format="%(levelname)s - %(message)s")
+    if not PORCUPINE_AVAILABLE:
+        print("Error: Porcupine not available. Install with: pip install pvporcupine")
+        sys.exit(1)
+    
+    wake_words = args.wake_words.split(",") if args.wake_words else get_wake_words()
+    sensitivities = parse_grid(args.sensitivities)
+    results = sweep(args.sites, wake_words, sensitivities, args.workers)
+    if not any(results.values()):
+        print("Error: no positive recordings found")
+        sys.exit(1)
+    
+    print_results(results, args.max_false_accepts)
+    if args.output:
+        output = {
+            site: {
+                wake_word: {"curve": curve, "recommended": recommend(curve, args.max_false_accepts)}
+                for wake_word, curve in curves.items()
+            }
+            for site, curves in results.items()
+        }
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
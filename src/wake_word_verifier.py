@@ -0,0 +1,181 @@
+"""
+Second-stage wake word verification on buffered keyword audio
+"""
+
+import json
+import logging
+import threading
+import time
+
+from src import metrics
+from src.wake_word_detector import get_wake_words
+
+# Try to import optional dependencies
+try:
+    import vosk
+    VOSK_AVAILABLE = True
+except ImportError:
+    VOSK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class WakeWordVerifier:
+    """Base class for verifiers that re-check a wake word detection."""
+    
+    def __init__(self, wake_words=None):
+        """
+        Initialize the verification counters.
+        
+        Args:
+            wake_words (list): Wake words to confirm; defaults to every
+                language's, as from get_wake_words()
+        """
+        self.wake_words = [word.lower() for word in (wake_words or get_wake_words())]
+        self.triggers = 0
+        self.rejected = 0
+        self.latency = metrics.get_stats("wake.verify")
+        self._lock = threading.Lock()
+    
+    def verify(self, audio, sample_rate, wake_word=None):
+        """
+        Re-check buffered audio around a detection and record the outcome.
+        
+        Args:
+            audio (numpy.ndarray): 16-bit mono audio ending at the detection
+            sample_rate (int): Sample rate of the audio
+            wake_word (str): Wake word the detector matched; any of the
+                wake words is confirmed if not given
+        
+        Returns:
+            bool: True if the wake word is confirmed
+        """
+        start = time.monotonic()
+        accepted = self._verify(audio, sample_rate, wake_word)
+        self.latency.record(time.monotonic() - start)
+        
+        with self._lock:
+            self.triggers += 1
+            if not accepted:
+                self.rejected += 1
+        return accepted
+    
+    def _verify(self, audio, sample_rate, wake_word):
+        """Verifier-specific check; see verify()."""
+        raise NotImplementedError
+    
+    def _expected(self, wake_word):
+        """Get the wake words a detection may confirm as."""
+        return [wake_word.lower()] if wake_word else self.wake_words
+    
+    def false_wake_rate(self):
+        """
+        Get the share of detections rejected by the verifier.
+        
+        Returns:
+            float: Rejected detections divided by all detections
+        """
+        with self._lock:
+            return self.rejected / self.triggers if self.triggers else 0.0
+    
+    def log_summary(self):
+        """Log trigger counts, false-wake rate and added latency."""
+        summary = self.latency.summary()
+        p95 = f"{summary['p95'] * 1000:.1f}ms" if summary["p95"] is not None else "n/a"
+        logger.info(
+            f"Wake word verifier: {self.triggers} triggers, {self.rejected} rejected "
+            f"(false-wake rate {self.false_wake_rate():.1%}), p95 latency {p95}"
+        )
+
+
+class VoskGrammarVerifier(WakeWordVerifier):
+    """
+    Verifies detections with a Vosk recognizer restricted to the wake word.
+    
+    Each wake word is decoded with the model of its language, so wake words
+    of other languages in LANGUAGE_MODELS are not rejected by the default
+    language's model.
+    """
+    
+    def __init__(self, model, models=None, wake_words=None):
+        """
+        Initialize the grammar verifier.
+        
+        Args:
+            model (vosk.Model): Loaded default-language model, shared with
+                speech recognition
+            models (ModelManager): The recognizer's models per language, for
+                wake words of other languages; None uses model for all
+            wake_words (list): Wake words to confirm; defaults to get_wake_words()
+        """
+        super().__init__(wake_words)
+        
+        if not VOSK_AVAILABLE:
+            raise ImportError("Vosk not available. Install with: pip install vosk")
+        
+        self.model = model
+        self.models = models
+        self._recognizers = {}
+    
+    def _model_for(self, wake_word):
+        """Get the model of the wake word's language."""
+        if self.models is None or not wake_word:
+            return self.model
+        language = self.models.language_for_wake_word(wake_word)
+        if language == self.models.default_language:
+            return self.model
+        return self.models.get_model(language)
+    
+    def _verify(self, audio, sample_rate, wake_word):
+        """Decode the buffered audio against a grammar of the expected wake words."""
+        expected = self._expected(wake_word)
+        grammar = json.dumps(expected + ["[unk]"])
+        model = self._model_for(wake_word)
+        
+        if model is self.model:
+            rec = self._recognizers.get((sample_rate, grammar))
+            if rec is None:
+                rec = self._recognizers[(sample_rate, grammar)] = vosk.KaldiRecognizer(model, sample_rate, grammar)
+        else:
+            # Not cached, so an evicted language model is not kept alive
+            rec = vosk.KaldiRecognizer(model, sample_rate, grammar)
+        
+        rec.AcceptWaveform(audio.tobytes())
+        text = json.loads(rec.FinalResult()).get("text", "")
+        rec.Reset()
+        
+        accepted = any(word in text for word in expected)
+        if not accepted:
+            logger.info(f"Wake word rejected by verifier (heard '{text}')")
+        return accepted
+
+
+class ModelServerGrammarVerifier(WakeWordVerifier):
+    """Verifies detections with a wake word grammar on the resident model server."""
+    
+    def __init__(self, client, wake_words=None):
+        """
+        Initialize the grammar verifier.
+        
+        Args:
+            client (ModelServerClient): Connected model server client
+            wake_words (list): Wake words in the server model's language;
+                defaults to get_wake_words()
+        """
+        super().__init__(wake_words)
+        self.client = client
+    
+    def _verify(self, audio, sample_rate, wake_word):
+        """Decode the buffered audio against a grammar of the expected wake words on the server."""
+        if wake_word and wake_word.lower() not in self.wake_words:
+            # The server has one model; other languages' wake words cannot be checked
+            return True
+        
+        expected = self._expected(wake_word)
+        grammar = json.dumps(expected + ["[unk]"])
+        text = self.client.recognize(audio, sample_rate, grammar=grammar).get("text", "")
+        
+        accepted = any(word in text for word in expected)
+        if not accepted:
+            logger.info(f"Wake word rejected by verifier (heard '{text}')")
+        return accepted
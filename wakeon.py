@@ -3,16 +3,30 @@
 Wakeon - A lightweight, customizable voice assistant
 """
 
+import argparse
+import json
 import logging
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from src.wake_word_detector import WakeWordDetector
+from src.wake_word_detector import create_wake_word_detector, get_wake_words
 from src.speech_recognition import SpeechRecognizer
 from src.ai_processor import AIProcessor
 from src.text_to_speech import TextToSpeech
 from src.audio_manager import AudioManager
+from src.wake_word_verifier import ModelServerGrammarVerifier, VoskGrammarVerifier
+from src.latency_budget import LatencyBudget, STAGE_ASR
+from src.config_watcher import ConfigWatcher
+from src.interaction_journal import InteractionJournal
+from src.stage_processes import StageSupervisor
+from src.transcript_gate import ACTION_REPROMPT, GATE_SETTINGS, TranscriptGate
+from src.beamformer import install_array_frontend
+from src.speech_enhancer import DSP_SETTINGS, create_speech_enhancer
+from src.speaker_verification import SPEAKER_SETTINGS, create_speaker_verifier
+from src import audio_io, memory_report, metrics, profiler
 import config
 
 # Configure logging
@@ -35,14 +49,54 @@ class WakeonAssistant:
         logger.info("Initializing Wakeon Assistant...")
         
         try:
-            self.audio_manager = AudioManager()
-            self.wake_word_detector = WakeWordDetector()
-            self.speech_recognizer = SpeechRecognizer()
-            self.ai_processor = AIProcessor()
-            self.tts = TextToSpeech()
+            with memory_report.measure("audio"):
+                # A microphone array is beamformed into one channel before anything opens a stream
+                install_array_frontend()
+                self.audio_manager = AudioManager()
+            self.stages = None
+            if getattr(config, "PROCESS_STAGES", False):
+                # Capture, recognition and synthesis in their own processes
+                with memory_report.measure("stages"):
+                    self.stages = StageSupervisor()
+                    self.stages.start()
+                self.wake_word_detector = self.stages.wake_word_detector
+                self.speech_recognizer = self.stages.speech_recognizer
+                self.tts = self.stages.tts
+            else:
+                with memory_report.measure("speech_recognizer"):
+                    self.speech_recognizer = SpeechRecognizer()
+                with memory_report.measure("wake_word_detector"):
+                    self.wake_word_detector = self._create_wake_word_detector()
+                with memory_report.measure("tts"):
+                    self.tts = TextToSpeech()
+            with memory_report.measure("ai_processor"):
+                self.ai_processor = AIProcessor()
+            self.config_watcher = None
+            self._stop_requested = threading.Event()
+            self._tts_voice = None
+            self._language = None
+            self.journal = InteractionJournal() if getattr(config, "JOURNAL_ENABLED", True) else None
             
-            logger.info("Wakeon Assistant initialized successfully!")
+            # Warms the AI connection, recognizer and TTS while a command is spoken
+            self._prewarm_executor = None
+            if getattr(config, "PREWARM_ON_WAKE", True):
+                self._prewarm_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="prewarm")
+            
+            if getattr(config, "WAKE_VERIFY_ENABLED", False):
+                self._enable_wake_verification()
+            
+            self.speaker_verifier = None
+            if getattr(config, "SPEAKER_VERIFY_ENABLED", False):
+                with memory_report.measure("speaker_verifier"):
+                    self._enable_speaker_verification()
             
+            memory_report.snapshot("after init")
+            if getattr(config, "SMALL_FOOTPRINT", False):
+                # Nothing but the wake word detector is needed until the first wake word
+                self._release_idle()
+            
+            logger.info("Wakeon Assistant initialized successfully!")
+        
         except Exception as e:
             logger.error(f"Failed to initialize Wakeon Assistant: {e}")
             raise
@@ -51,40 +105,38 @@ class WakeonAssistant:
         """Main loop for the voice assistant."""
         logger.info(f"Starting Wakeon Assistant. Say '{config.WAKE_WORD}' to activate!")
         
+        if getattr(config, "CONFIG_HOT_RELOAD", True):
+            self._start_config_watcher()
+        
         try:
-            while True:
+            while not self._stop_requested.is_set():
+                # Swap in components rebuilt for new settings between turns
+                self._apply_config_changes()
+                
                 # Wait for wake word
                 logger.debug("Listening for wake word...")
-                if self.wake_word_detector.detect():
+                with profiler.stage("wake"):
+                    detected = self.wake_word_detector.detect()
+                
+                if detected:
                     logger.info("Wake word detected!")
-                    
-                    # Play activation sound
-                    self.audio_manager.play_activation_sound()
-                    
-                    # Listen for command
-                    logger.debug("Listening for command...")
-                    command = self.speech_recognizer.listen_for_command()
-                    
-                    if command:
-                        logger.info(f"Command received: {command}")
-                        
-                        # Process with AI
-                        response = self.ai_processor.process_command(command)
-                        
-                        if response:
-                            logger.info(f"AI Response: {response}")
-                            
-                            # Speak the response
-                            self.tts.speak(response)
-                        else:
-                            logger.warning("No response from AI")
-                            self.tts.speak("I'm sorry, I couldn't process that request.")
-                    else:
-                        logger.warning("No command detected")
-                        self.tts.speak("I didn't catch that. Could you repeat?")
+                    # Other people and media are dropped before anything is recorded or sent
+                    detected = self._check_speaker()
                 
-                time.sleep(0.1)  # Small delay to prevent CPU overuse
+                if detected:
+                    follow_up = self._handle_turn()
+                    
+                    # After an answer, keep listening for a follow-up without the wake word
+                    while follow_up and not self._stop_requested.is_set():
+                        follow_up = self._handle_turn(follow_up=True)
+                    if getattr(config, "SMALL_FOOTPRINT", False):
+                        self._release_idle()
                 
+                audio_io.get_clock().sleep(0.1)  # Small delay to prevent CPU overuse
+            
+            logger.info("Stopping Wakeon Assistant...")
+            self.cleanup()
+        
         except KeyboardInterrupt:
             logger.info("Shutting down Wakeon Assistant...")
             self.cleanup()
@@ -93,32 +145,451 @@ class WakeonAssistant:
             self.cleanup()
             raise
     
+    def stop(self):
+        """Make run() return once the current turn is finished."""
+        self._stop_requested.set()
+        self.wake_word_detector.interrupt()
+    
+    def _handle_turn(self, follow_up=False):
+        """
+        Run one interaction and record it in the journal.
+        
+        Args:
+            follow_up (bool): Listen for a follow-up in the window after the
+                last answer instead of after a wake word
+        
+        Returns:
+            bool: True if the turn was answered and a follow-up window should open
+        """
+        clock = audio_io.get_clock()
+        # The turn budget starts at end of speech
+        budget = LatencyBudget()
+        if follow_up:
+            # The recognizer and its stream are still hot: no beep, no pre-warming
+            command = self.speech_recognizer.listen_for_follow_up(
+                getattr(config, "FOLLOW_UP_SECONDS", 0), budget=budget, language=self._language
+            )
+            if self.speech_recognizer.speech_started_at is None:
+                logger.debug("Follow-up window closed; waiting for the wake word")
+                return False
+            if command and not self._check_speaker(follow_up=True):
+                # Someone else spoke into the window; only an enrolled voice may go on without the wake word
+                return False
+            turn = {"wake_at": self.speech_recognizer.speech_started_at, "follow_up": 1}
+        else:
+            turn = {"wake_at": clock.time()}
+            self._language = self._select_language()
+            self._prewarm(self._language)
+            
+            # Play activation sound
+            self.audio_manager.play_activation_sound()
+            
+            # Listen for command
+            logger.debug("Listening for command...")
+            command = self.speech_recognizer.listen_for_command(budget=budget, language=self._language)
+            
+            rejected = getattr(self.speech_recognizer.last_transcript, "rejected", None)
+            if not command and rejected and getattr(config, "ASR_GATE_ACTION", ACTION_REPROMPT) == ACTION_REPROMPT:
+                # Probably noise: ask once and listen again; the journal keeps the second attempt
+                logger.info(f"Command rejected ({rejected}); asking again")
+                self.tts.speak("I didn't catch that. Could you repeat?")
+                budget = LatencyBudget()
+                command = self.speech_recognizer.listen_for_command(budget=budget, language=self._language)
+        transcript = self.speech_recognizer.last_transcript
+        turn["command_at"] = clock.time()
+        turn["transcript"] = command
+        if transcript is not None:
+            turn["asr_confidence"] = transcript.confidence
+            if transcript.rejected:
+                turn["transcript"] = transcript.text
+                turn["asr_rejected"] = transcript.rejected
+        
+        answered = False
+        if command:
+            logger.info(f"Command received: {command}")
+            
+            if STAGE_ASR in budget.missed_stages:
+                self._speak_filler(budget)
+            
+            # Process with AI
+            with profiler.stage("ai"):
+                response = self.ai_processor.process_command(command, budget=budget)
+            turn["ai_done_at"] = clock.time()
+            turn["response"] = response
+            turn.update(self.ai_processor.last_turn_info)
+            
+            if response:
+                logger.info(f"AI Response: {response}")
+                
+                # Speak the response
+                with profiler.stage("tts"):
+                    self.tts.speak(response, budget=budget)
+                answered = True
+            else:
+                logger.warning("No response from AI")
+                self.tts.speak("I'm sorry, I couldn't process that request.")
+        elif follow_up:
+            # Nobody has to answer a follow-up window; noise in it just ends the conversation
+            logger.debug("No follow-up command")
+        elif transcript is not None and transcript.rejected:
+            # Still noise after asking again, or the gate ignores it: go back to waiting without a word
+            logger.info(f"Command rejected ({transcript.rejected})")
+        else:
+            logger.warning("No command detected")
+            self.tts.speak("I didn't catch that. Could you repeat?")
+        
+        turn["tts_done_at"] = clock.time()
+        if budget.missed_stages:
+            turn["budget_misses"] = json.dumps(sorted(budget.missed_stages))
+        if self.journal is not None:
+            self.journal.record(turn)
+        
+        return (
+            answered
+            and getattr(config, "FOLLOW_UP_SECONDS", 0) > 0
+            and hasattr(self.speech_recognizer, "listen_for_follow_up")
+        )
+    
+    def _release_idle(self):
+        """
+        Free engines that are idle until the next wake word (small-footprint mode).
+        
+        The TTS engine is created again by the wake word pre-warming while
+        the command is recorded, or when it first speaks.
+        """
+        for component in (self.speech_recognizer, self.tts):
+            release = getattr(component, "release_idle", None)
+            if release is not None:
+                release()
+        memory_report.release_memory()
+    
+    def _prewarm(self, language):
+        """
+        Start warming the components the turn will need, without waiting.
+        
+        Args:
+            language (str): Language of the coming command
+        """
+        if self._prewarm_executor is None:
+            return
+        
+        targets = (
+            ("ai", self.ai_processor, ()),
+            ("recognizer", self.speech_recognizer, (language,)),
+            ("tts", self.tts, ()),
+        )
+        for name, component, args in targets:
+            prewarm = getattr(component, "prewarm", None)
+            if prewarm is not None:
+                self._prewarm_executor.submit(self._run_prewarm, name, prewarm, args)
+    
+    @staticmethod
+    def _run_prewarm(name, prewarm, args):
+        """Run one component's prewarm() and record how long it took."""
+        start = time.monotonic()
+        try:
+            prewarm(*args)
+        except Exception as e:
+            logger.debug(f"Pre-warming {name} failed: {e}")
+            return
+        metrics.get_stats(f"prewarm.{name}").record(time.monotonic() - start)
+    
+    def _select_language(self):
+        """
+        Pick the turn's language from the wake word and switch the TTS voice.
+        
+        Returns:
+            str: Language code, or None if the recognizer has a single model
+        """
+        models = getattr(self.speech_recognizer, "models", None)
+        if models is None:
+            return None
+        
+        language = models.language_for_wake_word(getattr(self.wake_word_detector, "last_wake_word", None))
+        voice = models.get_tts_voice(language) or models.get_tts_voice(models.default_language)
+        if voice and voice != self._tts_voice:
+            self.tts.set_voice(voice)
+            self._tts_voice = voice
+        return language
+    
+    def _start_config_watcher(self):
+        """Watch .env and config.py and rebuild components in the background."""
+        factories = {"ai_processor": AIProcessor}
+        if self.stages is None:
+            factories.update(
+                wake_word_detector=self._create_wake_word_detector,
+                speech_recognizer=SpeechRecognizer, tts=TextToSpeech
+            )
+        else:
+            logger.info("With process stages, wake word, recognizer and TTS engine settings apply after a restart")
+        
+        self.config_watcher = ConfigWatcher(
+            factories=factories,
+            # Leave detect() early so an idle assistant picks up changes at once
+            on_ready=lambda: self.wake_word_detector.interrupt()
+        )
+        self.config_watcher.start()
+    
+    def _apply_config_changes(self):
+        """Apply configuration changes prepared by the watcher."""
+        if self.config_watcher is None:
+            return
+        
+        for change in self.config_watcher.take_pending():
+            recognizer_swapped = "speech_recognizer" in change.components and self.stages is None
+            for name, component in change.components.items():
+                if name == "wake_word_detector" and recognizer_swapped:
+                    # Built on the recognizer being replaced; rebuilt below
+                    component.cleanup()
+                    continue
+                old_component = getattr(self, name)
+                setattr(self, name, component)
+                old_component.cleanup()
+                logger.info(f"Swapped in new {name}")
+            
+            if recognizer_swapped:
+                # Vosk spotting decodes on the old recognizer's model or server
+                # connection, which its cleanup() just released
+                self.wake_word_detector.cleanup()
+                self.wake_word_detector = self._create_wake_word_detector()
+                logger.info("Swapped in new wake_word_detector")
+            
+            if "TTS_VOICE_RATE" in change.changed_keys:
+                self.tts.set_voice_rate(config.TTS_VOICE_RATE)
+            if "TTS_VOICE_VOLUME" in change.changed_keys:
+                self.tts.set_voice_volume(config.TTS_VOICE_VOLUME)
+            if "PREWARM_ON_WAKE" in change.changed_keys:
+                if getattr(config, "PREWARM_ON_WAKE", True) and self._prewarm_executor is None:
+                    self._prewarm_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="prewarm")
+                elif not getattr(config, "PREWARM_ON_WAKE", True) and self._prewarm_executor is not None:
+                    self._prewarm_executor.shutdown(wait=False)
+                    self._prewarm_executor = None
+            if change.changed_keys & GATE_SETTINGS and self.stages is None:
+                enabled = getattr(config, "ASR_GATE_ENABLED", True)
+                self.speech_recognizer.gate = TranscriptGate() if enabled else None
+            if change.changed_keys & DSP_SETTINGS and self.stages is None:
+                self.speech_recognizer.enhancer = create_speech_enhancer(config.SAMPLE_RATE)
+            
+            # The verifier is tied to both the detector and the recognizer's model
+            verifier_affected = (
+                "WAKE_VERIFY_ENABLED" in change.changed_keys
+                or "wake_word_detector" in change.components
+                or "speech_recognizer" in change.components
+            )
+            if verifier_affected:
+                if getattr(config, "WAKE_VERIFY_ENABLED", False):
+                    self._enable_wake_verification()
+                else:
+                    self.wake_word_detector.set_verifier(None)
+            
+            # The Vosk embedding uses the recognizer's model
+            speaker_affected = (
+                change.changed_keys & SPEAKER_SETTINGS
+                or ("speech_recognizer" in change.components and self.speaker_verifier is not None)
+            )
+            if speaker_affected:
+                if self.speaker_verifier is not None:
+                    self.speaker_verifier.log_summary()
+                self._enable_speaker_verification()
+    
+    def _create_wake_word_detector(self):
+        """
+        Create the wake word detector on the current recognizer.
+        
+        Returns:
+            WakeWordDetector: Porcupine or Vosk detector
+        """
+        # Vosk keyword spotting, if used, shares the recognizer's model or server
+        return create_wake_word_detector(self.speech_recognizer.model, self.speech_recognizer.server)
+    
+    def _enable_wake_verification(self):
+        """Re-check wake word detections with the already loaded Vosk model."""
+        if self.stages is not None:
+            logger.warning("Wake word verification is not supported with process stages; skipping")
+            return
+        
+        if self.speech_recognizer.use_fallback:
+            logger.warning("Wake word verification needs a Vosk model; skipping")
+            return
+        
+        models = self.speech_recognizer.models
+        if self.speech_recognizer.server is not None:
+            # The server only has the default language's model
+            wake_words = [
+                word for word in get_wake_words()
+                if models is None or models.language_for_wake_word(word) == models.default_language
+            ]
+            verifier = ModelServerGrammarVerifier(self.speech_recognizer.server, wake_words)
+        else:
+            verifier = VoskGrammarVerifier(self.speech_recognizer.model, models)
+        self.wake_word_detector.set_verifier(verifier)
+        logger.info("Wake word verification enabled")
+    
+    def _enable_speaker_verification(self):
+        """Accept wake words only from enrolled speakers, if any are enrolled."""
+        self.speaker_verifier = None
+        if self.stages is not None:
+            logger.warning("Speaker verification is not supported with process stages; skipping")
+            return
+        
+        try:
+            self.speaker_verifier = create_speaker_verifier(self.speech_recognizer.model)
+        except Exception as e:
+            logger.error(f"Failed to enable speaker verification: {e}")
+    
+    def _check_speaker(self, follow_up=False):
+        """
+        Check that the wake word, or a follow-up, was said by an enrolled speaker.
+        
+        Errors accept the turn, so a broken check never locks the enrolled
+        users out. A follow-up whose audio was not kept is rejected, since
+        it skips the wake word and nothing else vouches for the speaker.
+        
+        Args:
+            follow_up (bool): Check the recognizer's follow-up audio instead
+                of the wake word's audio
+        
+        Returns:
+            bool: True if the turn should go ahead
+        """
+        if self.speaker_verifier is None:
+            return True
+        
+        if follow_up:
+            what = "Follow-up"
+            audio = getattr(self.speech_recognizer, "follow_up_audio", None)
+            if audio is None:
+                logger.info("Follow-up ignored: no audio to verify the speaker")
+                return False
+        else:
+            what = "Wake word"
+            get_keyword_audio = getattr(self.wake_word_detector, "get_keyword_audio", None)
+            if get_keyword_audio is None:
+                return True
+        
+        try:
+            with profiler.stage("speaker"):
+                if follow_up:
+                    sample_rate = config.SAMPLE_RATE
+                else:
+                    audio, sample_rate = get_keyword_audio(), self.wake_word_detector.engine.sample_rate
+                match = self.speaker_verifier.verify(audio, sample_rate)
+        except Exception as e:
+            logger.error(f"Error in speaker verification: {e}")
+            return True
+        
+        if match.accepted:
+            logger.info(f"Speaker verified: {match.speaker} ({match.score:.2f})")
+        elif match.speaker is None:
+            logger.info(f"{what} ignored: not enough voice to verify the speaker")
+        else:
+            logger.info(f"{what} ignored: speaker not enrolled "
+                        f"(closest {match.speaker} at {match.score:.2f})")
+        return match.accepted
+    
+    def _speak_filler(self, budget):
+        """
+        Say a quick "still working" phrase when recognition used up the budget.
+        
+        The user has now heard something, so the rest of the turn gets a
+        fresh, shorter deadline instead of failing straight to the fallback.
+        
+        Args:
+            budget (LatencyBudget): The current turn budget
+        """
+        self.tts.speak(getattr(config, "LATENCY_FILLER_PHRASE", "One moment."))
+        budget.extend(getattr(config, "LATENCY_FILLER_EXTENSION_SECONDS", 3.0))
+    
     def cleanup(self):
         """Clean up resources."""
+        if self.config_watcher is not None:
+            self.config_watcher.stop()
+        if self._prewarm_executor is not None:
+            self._prewarm_executor.shutdown(wait=False)
+        memory_report.snapshot("steady state")
+        if self.speaker_verifier is not None:
+            self.speaker_verifier.log_summary()
+        LatencyBudget.log_misses()
+        metrics.log_all()
         try:
             self.audio_manager.cleanup()
             self.wake_word_detector.cleanup()
+            self.ai_processor.cleanup()
+            if self.stages is not None:
+                self.stages.stop()
+            if self.journal is not None:
+                self.journal.close()
             logger.info("Cleanup completed")
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
 
 
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Wakeon voice assistant")
+    parser.add_argument("--profile", action="store_true",
+                        help="Sample the process and write per-stage collapsed stacks on exit")
+    parser.add_argument("--profile-allocations", action="store_true",
+                        help="With --profile, also trace allocations in capture and recognition")
+    parser.add_argument("--profile-interval", type=float, default=0.005,
+                        help="Seconds between profiler samples (default: 0.005)")
+    parser.add_argument("--profile-dir", default=f"{config.LOGS_DIR}/profile",
+                        help="Directory for profiler reports")
+    parser.add_argument("--memory-report", nargs="?", const=f"{config.LOGS_DIR}/memory_report.json", metavar="JSON",
+                        help="Log resident memory per component after init and at shutdown, and write it "
+                             "as JSON (default: logs/memory_report.json)")
+    parser.add_argument("--audio-input", nargs="+", metavar="WAV",
+                        help="Run on these 16-bit mono WAV files on a virtual clock instead of "
+                             "the microphone; exits when they have been consumed")
+    return parser.parse_args()
+
+
 def main():
     """Main entry point."""
+    args = parse_args()
+    
     print("🎙️  Wakeon Voice Assistant")
     print("=" * 40)
     print(f"Wake word: '{config.WAKE_WORD}'")
     print("Press Ctrl+C to exit")
     print("=" * 40)
     
+    sampler = None
+    if args.profile:
+        sampler = profiler.SamplingProfiler(
+            interval=args.profile_interval,
+            trace_allocations=args.profile_allocations
+        )
+        sampler.start()
+    
+    report = memory_report.start() if args.memory_report else None
+    
+    backend = None
+    if args.audio_input:
+        audio_io.set_clock(audio_io.VirtualClock())
+        backend = audio_io.FakeAudioBackend(audio_io.WavFileSource(args.audio_input))
+        audio_io.set_audio_backend(backend)
+    
     try:
         assistant = WakeonAssistant()
+        if backend is not None:
+            backend.on_exhausted = assistant.stop
         assistant.run()
+        if backend is not None:
+            print(f"Simulated {audio_io.get_clock().monotonic():.1f}s of audio; "
+                  f"{len(backend.played)} playbacks captured")
     except Exception as e:
         logger.error(f"Failed to start Wakeon Assistant: {e}")
         print(f"Error: {e}")
         sys.exit(1)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            sampler.write_reports(args.profile_dir)
+        if report is not None:
+            report.log()
+            report.write(args.memory_report)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file